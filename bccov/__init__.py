@@ -1,2 +1,21 @@
-from bccov.main import run_cli
-from bccov.lib import run_tracepc_cov, run_bbcov_cov, setup
\ No newline at end of file
+# the entry points are imported on first access, so importing bccov (or one
+# of its submodules) does not pull in the whole CLI
+_LAZY_ATTRS = {
+    "run_cli": "bccov.main",
+    "run_tracepc_cov": "bccov.lib",
+    "run_bbcov_cov": "bccov.lib",
+    "setup": "bccov.lib",
+    "Session": "bccov.session",
+}
+
+__all__ = list(_LAZY_ATTRS)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(_LAZY_ATTRS[name]), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,133 @@
+from collections import namedtuple
+import hashlib
+import json
+import os
+import pathlib
+import threading
+
+from bccov.lruntime import RunResult
+from bccov.utils.pylogger import get_logger
+
+log = get_logger(__name__)
+
+CacheEntry = namedtuple("CacheEntry", ["coverage", "result"])
+
+# entries of other versions are misses, version 2 stores bbcov sparse
+CACHE_VERSION = 2
+
+
+def hash_file(path: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def encode_coverage(coverage, mode: str):
+    """
+    bbcov counter arrays are mostly zeros, only the [block index, count] pairs
+    of the blocks that ran are stored along with the length of the array.
+    Functions that did not run are left out.
+    """
+    if mode != "bbcov":
+        return coverage
+    encoded = {}
+    for file_name, func_map in coverage.items():
+        for func_name, cov_array in func_map.items():
+            counts = [[i, count] for i, count in enumerate(cov_array) if count]
+            if counts:
+                encoded.setdefault(file_name, {})[func_name] = [len(cov_array), counts]
+    return encoded
+
+
+def decode_coverage(encoded, mode: str):
+    if mode != "bbcov":
+        return encoded
+    coverage = {}
+    for file_name, func_map in encoded.items():
+        for func_name, (length, counts) in func_map.items():
+            cov_array = [0] * length
+            for i, count in counts:
+                cov_array[i] = count
+            coverage.setdefault(file_name, {})[func_name] = cov_array
+    return coverage
+
+
+def read_entry(path: pathlib.Path) -> dict:
+    """
+    :return: the cache entry stored at path with its coverage decoded, None
+        if it is corrupt or was written by another version
+    """
+    try:
+        entry = json.loads(path.read_text())
+    except json.decoder.JSONDecodeError:
+        log.warning(f"Ignoring corrupt cache entry {path}")
+        return None
+    if entry.get("version") != CACHE_VERSION:
+        return None
+    entry["coverage"] = decode_coverage(entry["coverage"], entry["mode"])
+    return entry
+
+
+class CoverageCache:
+    """
+    On-disk cache of decoded per-input coverage, keyed by the hash of the
+    instrumented binary and the hash of the input contents. Entries live in
+    <cache_dir>/<binary hash>/<input hash>.json, so rebuilding the target
+    never returns stale coverage.
+    """
+
+    def __init__(self, cache_dir: pathlib.Path, binary: pathlib.Path, mode: str):
+        self.mode = mode
+        self.binary_hash = hash_file(binary)
+        self.dir = pathlib.Path(cache_dir) / self.binary_hash
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, input_hash: str) -> pathlib.Path:
+        return self.dir / f"{input_hash}.json"
+
+    def get(self, input_file: pathlib.Path, input_hash: str = None):
+        input_hash = input_hash or hash_file(input_file)
+        path = self.entry_path(input_hash)
+        if not path.exists():
+            self.misses += 1
+            return None
+        entry = read_entry(path)
+        if entry is None or entry["mode"] != self.mode:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CacheEntry(entry["coverage"], RunResult(*entry["result"]))
+
+    def put(
+        self,
+        input_file: pathlib.Path,
+        coverage,
+        result: RunResult,
+        input_hash: str = None,
+    ):
+        """
+        Results that timed out or left no coverage are not cached, they depend
+        on --timeout and the machine and the next run may do better.
+        """
+        if result.timed_out or coverage is None:
+            return
+        input_hash = input_hash or hash_file(input_file)
+        path = self.entry_path(input_hash)
+        entry = {
+            "version": CACHE_VERSION,
+            "input": str(input_file),
+            "mode": self.mode,
+            "result": list(result),
+            "coverage": encode_coverage(coverage, self.mode),
+        }
+        # write then rename so concurrent readers never see a partial entry
+        tmp_path = path.with_suffix(f".{os.getpid()}-{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(entry))
+        os.replace(tmp_path, path)
+
+    def print_stats(self):
+        log.info(f"Coverage cache {self.dir} : {self.hits} hits, {self.misses} misses")
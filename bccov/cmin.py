@@ -0,0 +1,101 @@
+from typing import List
+from collections import namedtuple
+import heapq
+import pathlib
+import shutil
+
+from bccov.utils.pylogger import get_logger
+
+log = get_logger(__name__)
+
+# blocks is a frozenset of block keys, weight the cost of keeping the input
+Candidate = namedtuple("Candidate", ["input_file", "blocks", "weight"])
+
+
+def coverage_blocks(coverage, mode: str = "bbcov") -> frozenset:
+    """
+    Turn the decoded coverage of one input into the set of blocks it hit. bbcov
+    blocks are (file, function, index) tuples, tracepc blocks their global ids
+    and edgecov uses the hit edge map indices.
+    """
+    if coverage is None:
+        return frozenset()
+    if mode == "tracepc":
+        return frozenset(coverage)
+    elif mode == "edgecov":
+        return frozenset(index for index, _ in coverage)
+    elif mode == "bbcov":
+        return frozenset(
+            (file_name, func_name, i)
+            for file_name, func_map in coverage.items()
+            for func_name, cov_array in func_map.items()
+            for i, count in enumerate(cov_array)
+            if count > 0
+        )
+    else:
+        raise NotImplementedError
+
+
+def input_weight(input_file: pathlib.Path, exec_time: float, weight: str) -> float:
+    if weight == "count":
+        return 1.0
+    elif weight == "size":
+        return float(max(1, input_file.stat().st_size))
+    elif weight == "time":
+        return max(1e-6, exec_time)
+    else:
+        raise NotImplementedError
+
+
+def minimize(candidates: List[Candidate]) -> List[Candidate]:
+    """
+    Greedy weighted set cover: repeatedly keep the input covering the most
+    not-yet-covered blocks per unit of weight until every block hit by the
+    corpus is covered. Gains only shrink as blocks get covered, so stale heap
+    entries are re-scored lazily instead of re-scoring all inputs every round.
+    """
+    covered = set()
+    chosen = []
+    heap = [
+        (-len(c.blocks) / c.weight, i) for i, c in enumerate(candidates) if c.blocks
+    ]
+    heapq.heapify(heap)
+
+    while heap:
+        neg_score, i = heapq.heappop(heap)
+        candidate = candidates[i]
+        gain = len(candidate.blocks - covered)
+        if gain == 0:
+            continue
+        score = gain / candidate.weight
+        if heap and score < -heap[0][0]:
+            heapq.heappush(heap, (-score, i))
+            continue
+        chosen.append(candidate)
+        covered |= candidate.blocks
+
+    return chosen
+
+
+def write_corpus(chosen: List[Candidate], output_dir: pathlib.Path):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for candidate in chosen:
+        destination = output_dir / candidate.input_file.name
+        if destination.exists():
+            # AFL crash and queue entries can share names
+            destination = (
+                output_dir
+                / f"{candidate.input_file.parent.name}_{candidate.input_file.name}"
+            )
+        shutil.copy2(candidate.input_file, destination)
+
+
+def print_summary(candidates: List[Candidate], chosen: List[Candidate]):
+    all_blocks = set()
+    for c in candidates:
+        all_blocks |= c.blocks
+    total_size = sum(c.input_file.stat().st_size for c in candidates)
+    chosen_size = sum(c.input_file.stat().st_size for c in chosen)
+    print(f"Kept {len(chosen)} / {len(candidates)} inputs")
+    print(f"Blocks covered: {len(all_blocks)}")
+    print(f"Corpus size: {chosen_size} / {total_size} bytes")
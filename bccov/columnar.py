@@ -0,0 +1,316 @@
+"""
+Columnar binary coverage dump.
+
+Layout (little endian):
+
+    magic "BCCOVCOL" | u32 version | u32 section count
+    section table    : (4 byte tag, u64 offset, u64 length) per section
+    strs             : u32 count, u64 offsets[count + 1], utf-8 blob
+    func             : (u32 name, u32 file, u32 first block, u32 block count) per function
+    bbid / cntr      : u32 block id / u64 counter per block
+    loff             : u64 offsets[blocks + 1] into the line columns
+    lfil / llin      : u32 file string / u32 line number per line entry
+    fidx             : (u64 name hash, u32 function, u32 pad) sorted by hash
+
+Every column is stored contiguously so the loader can decode it with a single
+array.frombytes instead of parsing one JSON object per block and line. The
+fidx index lets load_function_cov_map binary search a function and seek to
+just its slice of every column.
+"""
+from array import array
+import hashlib
+import os
+import pathlib
+import struct
+import sys
+
+from bccov.coverage import (
+    DUMP_SKIP_FILES,
+    BBCovCoverageStats,
+    CoverageDetails,
+    Function,
+    LineDetails,
+)
+
+MAGIC = b"BCCOVCOL"
+VERSION = 1
+
+HEADER = struct.Struct("<8sII")
+SECTION = struct.Struct("<4sQQ")
+FUNC_RECORD = struct.Struct("<IIII")
+INDEX_RECORD = struct.Struct("<QI4x")
+
+
+def name_hash(name: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(name.encode(), digest_size=8).digest(), "little"
+    )
+
+
+def is_columnar_dump(path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _to_bytes(arr: array) -> bytes:
+    if sys.byteorder != "little":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_bytes(typecode: str, data) -> array:
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr
+
+
+class StringTable:
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def intern(self, s: str) -> int:
+        idx = self.index.get(s)
+        if idx is None:
+            idx = len(self.strings)
+            self.index[s] = idx
+            self.strings.append(s)
+        return idx
+
+    def to_bytes(self) -> bytes:
+        encoded = [s.encode() for s in self.strings]
+        offsets = array("Q", [0])
+        for e in encoded:
+            offsets.append(offsets[-1] + len(e))
+        return struct.pack("<I", len(encoded)) + _to_bytes(offsets) + b"".join(encoded)
+
+
+def decode_strings(data) -> list:
+    (count,) = struct.unpack_from("<I", data, 0)
+    offsets = _from_bytes("Q", data[4 : 4 + 8 * (count + 1)])
+    blob = bytes(data[4 + 8 * (count + 1) :])
+    return [blob[offsets[i] : offsets[i + 1]].decode() for i in range(count)]
+
+
+def build_sections(cov_map: dict) -> dict:
+    strings = StringTable()
+    funcs = bytearray()
+    bb_ids = array("I")
+    counters = array("Q")
+    line_offsets = array("Q", [0])
+    line_files = array("I")
+    line_numbers = array("I")
+
+    index = []
+
+    for f, func in cov_map.items():
+        if f.file_name in DUMP_SKIP_FILES:
+            continue
+        index.append((name_hash(f.name), len(index)))
+        funcs += FUNC_RECORD.pack(
+            strings.intern(f.name),
+            strings.intern(f.file_name),
+            len(counters),
+            len(func),
+        )
+        for bb in func:
+            bb_ids.append(bb.id)
+            counters.append(bb.coverage_index)
+            for line in bb.line_details:
+                line_files.append(strings.intern(line.file_name))
+                line_numbers.append(line.line_no)
+            line_offsets.append(len(line_files))
+
+    return {
+        b"strs": strings.to_bytes(),
+        b"func": bytes(funcs),
+        b"bbid": _to_bytes(bb_ids),
+        b"cntr": _to_bytes(counters),
+        b"loff": _to_bytes(line_offsets),
+        b"lfil": _to_bytes(line_files),
+        b"llin": _to_bytes(line_numbers),
+        b"fidx": b"".join(INDEX_RECORD.pack(h, i) for h, i in sorted(index)),
+    }
+
+
+def write_sections(sections: dict, output_file):
+    offset = HEADER.size + SECTION.size * len(sections)
+    table = b""
+    for tag, data in sections.items():
+        table += SECTION.pack(tag, offset, len(data))
+        offset += len(data)
+
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(sections)))
+        f.write(table)
+        for data in sections.values():
+            f.write(data)
+    os.replace(tmp_file, output_file)
+
+
+def dump_columnar_cov_map(output_file, cov_map: dict = None):
+    if cov_map is None:
+        cov_map = BBCovCoverageStats.COV_MAP
+    write_sections(build_sections(cov_map), output_file)
+
+
+def read_section_table(f) -> dict:
+    magic, version, num_sections = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise Exception(f"{f.name} is not a columnar coverage dump")
+    if version > VERSION:
+        raise Exception(f"{f.name} has unsupported columnar dump version {version}")
+    table = {}
+    for _ in range(num_sections):
+        tag, offset, length = SECTION.unpack(f.read(SECTION.size))
+        table[tag] = (offset, length)
+    return table
+
+
+def load_columnar_cov_map(dump_file: pathlib.Path) -> dict:
+    """
+    Loads a columnar dump and populates BBCovCoverageStats.COV_MAP.
+    """
+    with open(dump_file, "rb") as f:
+        table = read_section_table(f)
+        data = memoryview(f.read())
+    base = HEADER.size + SECTION.size * len(table)
+
+    def section(tag):
+        offset, length = table[tag]
+        return data[offset - base : offset - base + length]
+
+    strings = decode_strings(section(b"strs"))
+    bb_ids = _from_bytes("I", section(b"bbid"))
+    counters = _from_bytes("Q", section(b"cntr"))
+    line_offsets = _from_bytes("Q", section(b"loff"))
+    line_files = _from_bytes("I", section(b"lfil"))
+    line_numbers = _from_bytes("I", section(b"llin"))
+
+    # identical (file, line) pairs share one LineDetails
+    lines = {}
+    cov_map = {}
+    for name, file_name, first_bb, num_bbs in FUNC_RECORD.iter_unpack(section(b"func")):
+        bb_objs = []
+        for bb in range(first_bb, first_bb + num_bbs):
+            linemap = []
+            for k in range(line_offsets[bb], line_offsets[bb + 1]):
+                key = (line_files[k], line_numbers[k])
+                line = lines.get(key)
+                if line is None:
+                    line = lines[key] = LineDetails(strings[key[0]], key[1])
+                linemap.append(line)
+            bb_objs.append(CoverageDetails(counters[bb], bb_ids[bb], linemap, []))
+        cov_map[Function(name=strings[name], file_name=strings[file_name])] = bb_objs
+
+    BBCovCoverageStats.COV_MAP = cov_map
+    return cov_map
+
+
+class ColumnarReader:
+    """
+    Random access to a columnar dump, every lookup only reads the few records
+    it needs.
+    """
+
+    def __init__(self, dump_file: pathlib.Path):
+        self.f = open(dump_file, "rb")
+        self.table = read_section_table(self.f)
+
+    def close(self):
+        self.f.close()
+
+    def read(self, tag: bytes, offset: int, length: int):
+        self.f.seek(self.table[tag][0] + offset)
+        return self.f.read(length)
+
+    def read_column(self, tag: bytes, typecode: str, start: int, count: int) -> array:
+        size = array(typecode).itemsize
+        return _from_bytes(typecode, self.read(tag, start * size, count * size))
+
+    def read_string(self, idx: int) -> str:
+        start, end = struct.unpack("<QQ", self.read(b"strs", 4 + 8 * idx, 16))
+        (count,) = struct.unpack("<I", self.read(b"strs", 0, 4))
+        return self.read(b"strs", 4 + 8 * (count + 1) + start, end - start).decode()
+
+    def find_functions(self, name: str) -> list:
+        """
+        Binary search the hash index, returns the indices of the function
+        records whose name hashes like name.
+        """
+        h = name_hash(name)
+        num_records = self.table[b"fidx"][1] // INDEX_RECORD.size
+        lo, hi = 0, num_records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_hash, _ = INDEX_RECORD.unpack(
+                self.read(b"fidx", mid * INDEX_RECORD.size, INDEX_RECORD.size)
+            )
+            if mid_hash < h:
+                lo = mid + 1
+            else:
+                hi = mid
+        found = []
+        while lo < num_records:
+            record_hash, func = INDEX_RECORD.unpack(
+                self.read(b"fidx", lo * INDEX_RECORD.size, INDEX_RECORD.size)
+            )
+            if record_hash != h:
+                break
+            found.append(func)
+            lo += 1
+        return found
+
+    def read_function(self, func: int):
+        name, file_name, first_bb, num_bbs = FUNC_RECORD.unpack(
+            self.read(b"func", func * FUNC_RECORD.size, FUNC_RECORD.size)
+        )
+        bb_ids = self.read_column(b"bbid", "I", first_bb, num_bbs)
+        counters = self.read_column(b"cntr", "Q", first_bb, num_bbs)
+        line_offsets = self.read_column(b"loff", "Q", first_bb, num_bbs + 1)
+        first_line = line_offsets[0]
+        num_lines = line_offsets[-1] - first_line
+        line_files = self.read_column(b"lfil", "I", first_line, num_lines)
+        line_numbers = self.read_column(b"llin", "I", first_line, num_lines)
+
+        strings = {}
+        for idx in set(line_files):
+            strings[idx] = self.read_string(idx)
+        bb_objs = []
+        for bb in range(num_bbs):
+            linemap = [
+                LineDetails(strings[line_files[k]], line_numbers[k])
+                for k in range(
+                    line_offsets[bb] - first_line, line_offsets[bb + 1] - first_line
+                )
+            ]
+            bb_objs.append(CoverageDetails(counters[bb], bb_ids[bb], linemap, []))
+        f = Function(name=self.read_string(name), file_name=self.read_string(file_name))
+        return f, bb_objs
+
+
+def load_function_cov_map(dump_file: pathlib.Path, functions: list) -> dict:
+    """
+    Populates BBCovCoverageStats.COV_MAP with only the given functions of a
+    columnar dump. Dumps without the function index are loaded whole.
+    """
+    reader = ColumnarReader(dump_file)
+    try:
+        if b"fidx" not in reader.table:
+            reader.close()
+            return load_columnar_cov_map(dump_file)
+        cov_map = {}
+        for name in functions:
+            for func in reader.find_functions(name):
+                f, bb_objs = reader.read_function(func)
+                if f.name == name:
+                    cov_map[f] = bb_objs
+    finally:
+        reader.close()
+
+    BBCovCoverageStats.COV_MAP = cov_map
+    return cov_map
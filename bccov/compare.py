@@ -0,0 +1,217 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
+import pathlib
+
+from bccov.compile import build_binary
+from bccov.coverage import (
+    TracePCCoverageStats,
+    read_process_coverage,
+    remove_coverage_files,
+)
+from bccov.lruntime import run_and_collect_coverage
+from bccov.utils.pylogger import get_logger
+
+log = get_logger(__name__)
+
+Variant = namedtuple("Variant", ["compiler", "binary"])
+Divergence = namedtuple("Divergence", ["key", "reached", "inputs"])
+
+
+def build_variants(
+    linked_bitcode, compilers: list, output_dir, cflags: str = "", jobs: int = None
+):
+    """
+    Compile the linked bitcode with every compiler concurrently, the compilers
+    run as separate processes so threads are enough.
+    """
+    variants = [
+        Variant(compiler, pathlib.Path(f"{output_dir}/bin{cid}"))
+        for cid, compiler in enumerate(compilers)
+    ]
+    with ThreadPoolExecutor(max_workers=jobs or len(variants)) as pool:
+        futures = {
+            pool.submit(
+                build_binary, linked_bitcode, v.binary, v.compiler, cflags or ""
+            ): v
+            for v in variants
+        }
+        for future in as_completed(futures):
+            future.result()
+    missing = [v.compiler for v in variants if not v.binary.exists()]
+    if missing:
+        raise Exception(f"Could not build the target with {', '.join(missing)}")
+    return variants
+
+
+class CompilerComparison:
+    """
+    The tracepc blocks every input reached in the binary of every compiler
+    variant, kept as one set per input and variant so recording costs the
+    size of the trace however many inputs there are. Divergences are found
+    input by input: a block diverges on an input when some but not all
+    variants reached it.
+    """
+
+    def __init__(self, variants: list):
+        self.variants = variants
+        self.inputs = []
+        # reached[v][i]: blocks input i reached in variant v
+        self.reached = [[] for _ in variants]
+        self.returncodes = [[] for _ in variants]
+
+    def add_input(self, input_file: pathlib.Path) -> int:
+        self.inputs.append(input_file)
+        for reached in self.reached:
+            reached.append(frozenset())
+        for codes in self.returncodes:
+            codes.append(None)
+        return len(self.inputs) - 1
+
+    def record(self, variant: int, input_idx: int, bb_ids, returncode):
+        self.reached[variant][input_idx] = frozenset(bb_ids)
+        self.returncodes[variant][input_idx] = returncode
+
+    def diverging(self, keys_by_input) -> list:
+        """
+        :param keys_by_input: [keys reached per variant] for every input, in
+            input order
+        :return: a Divergence for every key that some but not all variants
+            reached on the same input, sorted by key
+        """
+        reached = {}
+        inputs = {}
+        for i, keys in enumerate(keys_by_input):
+            for v, variant_keys in enumerate(keys):
+                for key in variant_keys:
+                    reached.setdefault(key, [0] * len(keys))[v] += 1
+            for key in set().union(*keys).difference(frozenset.intersection(*keys)):
+                inputs.setdefault(key, []).append(self.inputs[i])
+        return [Divergence(key, reached[key], inputs[key]) for key in sorted(inputs)]
+
+    def block_divergence(self) -> list:
+        return self.diverging(zip(*self.reached))
+
+    def line_divergence(self) -> list:
+        lines = {}
+
+        def block_lines(bb):
+            if bb not in lines:
+                lines[bb] = [
+                    (line.file_name, line.line_no)
+                    for line in TracePCCoverageStats.COV_MAP[bb].line_details
+                ]
+            return lines[bb]
+
+        return self.diverging(
+            [
+                frozenset(line for bb in blocks for line in block_lines(bb))
+                for blocks in keys
+            ]
+            for keys in zip(*self.reached)
+        )
+
+    def exit_divergence(self) -> list:
+        return [
+            (input_file, [codes[i] for codes in self.returncodes])
+            for i, input_file in enumerate(self.inputs)
+            if len({codes[i] for codes in self.returncodes}) > 1
+        ]
+
+    def report(self) -> dict:
+        compilers = [v.compiler for v in self.variants]
+        return {
+            "compilers": compilers,
+            "inputs": len(self.inputs),
+            "blocks": [
+                {
+                    "id": d.key,
+                    "lines": [
+                        f"{l.file_name}:{l.line_no}"
+                        for l in TracePCCoverageStats.COV_MAP[d.key].line_details
+                    ],
+                    "reached": dict(zip(compilers, d.reached)),
+                    "inputs": [str(i) for i in d.inputs],
+                }
+                for d in self.block_divergence()
+            ],
+            "lines": [
+                {
+                    "file": d.key[0],
+                    "line": d.key[1],
+                    "reached": dict(zip(compilers, d.reached)),
+                    "inputs": [str(i) for i in d.inputs],
+                }
+                for d in self.line_divergence()
+            ],
+            "exit_codes": [
+                {"input": str(i), "returncodes": dict(zip(compilers, codes))}
+                for i, codes in self.exit_divergence()
+            ],
+        }
+
+    def print_report(self, max_inputs: int = 3):
+        report = self.report()
+        print(
+            f"Compared {report['inputs']} inputs across {', '.join(report['compilers'])}"
+        )
+        print(f"Blocks with diverging reachability: {len(report['blocks'])}")
+        for block in report["blocks"]:
+            reached = ", ".join(f"{c}: {n}" for c, n in block["reached"].items())
+            print(
+                f"\tbb {block['id']} {' '.join(block['lines'])} | reached by {reached}"
+            )
+            for input_file in block["inputs"][:max_inputs]:
+                print(f"\t\t{input_file}")
+        print(f"Lines with diverging reachability: {len(report['lines'])}")
+        print(f"Inputs with diverging exit codes: {len(report['exit_codes'])}")
+        for entry in report["exit_codes"]:
+            print(f"\t{entry['input']} : {entry['returncodes']}")
+
+
+def compare_inputs(
+    comparison: CompilerComparison,
+    inputs: list,
+    work_dir,
+    timeout: float = None,
+    kill_timeout: float = 1.0,
+    jobs: int = None,
+):
+    """
+    Run every input through every variant in parallel. Workers only execute
+    and decode, the results are recorded and merged on the calling thread.
+    """
+
+    def run(variant_idx, input_idx, input_file):
+        cov_file = pathlib.Path(f"{work_dir}/cmp-v{variant_idx}-i{input_idx}.bc_cov")
+        remove_coverage_files(cov_file)
+        result = run_and_collect_coverage(
+            comparison.variants[variant_idx].binary,
+            cov_file,
+            input_file,
+            timeout=timeout,
+            kill_timeout=kill_timeout,
+        )
+        coverage = read_process_coverage(cov_file, mode="tracepc") or []
+        remove_coverage_files(cov_file)
+        return coverage, result
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        futures = {}
+        for input_file in inputs:
+            input_idx = comparison.add_input(input_file)
+            for variant_idx in range(len(comparison.variants)):
+                futures[pool.submit(run, variant_idx, input_idx, input_file)] = (
+                    variant_idx,
+                    input_idx,
+                )
+        for future in as_completed(futures):
+            variant_idx, input_idx = futures[future]
+            coverage, result = future.result()
+            comparison.record(variant_idx, input_idx, coverage, result.returncode)
+
+
+def write_report(comparison: CompilerComparison, output_file):
+    with open(output_file, "w") as f:
+        json.dump(comparison.report(), f, indent=4)
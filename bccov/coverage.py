@@ -1,19 +1,39 @@
 from collections import namedtuple
+import glob
 import json
+import os
 import pathlib
+import re
 import struct
 import sys
 
 from bccov.utils.pylogger import get_logger
+from bccov.utils.trace import span
 
 LineDetails = namedtuple("LineDetails", ["file_name", "line_no"])
 CoverageDetails = namedtuple(
     "CoverageDetails", ["coverage_index", "id", "line_details", "files"]
 )
 Function = namedtuple("Function", ["name", "file_name"])
+# src is None for the edge into a function's entry block
+Edge = namedtuple("Edge", ["src", "dst"])
 
 log = get_logger(__name__, "INFO")
 
+# helper files that are never part of a coverage dump
+DUMP_SKIP_FILES = [
+    "instrumentation_helpers/complex_types.c",
+    "instrumentation_helpers/helper.c",
+    "instrumentation_helpers/hooks.c",
+    "instrumentation_helpers/list.c"
+]
+
+DUMP_FORMATS = ["json", "columnar"]
+
+# how add_cov_map combines the counters of a block across inputs: the highest
+# counter, the total, or the total plus a histogram of the per-input counters
+AGGREGATE_MODES = ["max", "sum", "hist"]
+
 
 class TracePCCoverageStats:
     COV_MAP = {}
@@ -88,6 +108,15 @@ class TracePCCoverageStats:
 
 class BBCovCoverageStats:
     COV_MAP = {}
+    AGGREGATE = "max"
+    # (Function, block index) -> {bucket: inputs}, bucket b counts the inputs
+    # that executed the block [2 ** (b - 1), 2 ** b) times, only kept in hist mode
+    HISTOGRAMS = {}
+
+    @staticmethod
+    def set_aggregate_mode(mode: str):
+        assert mode in AGGREGATE_MODES, f"Unknown aggregation mode {mode}"
+        BBCovCoverageStats.AGGREGATE = mode
 
     @staticmethod
     def cov_info_array_parse(cov_array: list):
@@ -103,6 +132,7 @@ class BBCovCoverageStats:
     @staticmethod
     def init_cov_info(cov_info: dict):
         BBCovCoverageStats.COV_MAP = {}
+        BBCovCoverageStats.HISTOGRAMS = {}
         for file_name, func_map in cov_info.items():
             for func_obj in func_map:
                 f = Function(name=func_obj["Function"], file_name=file_name)
@@ -114,7 +144,7 @@ class BBCovCoverageStats:
     def add_cov_map(cov_map, cov_file_name):
         for file_name, func_map in cov_map.items():
             for func_name, cov_array in func_map.items():
-                f = Function(name=func_name.decode(), file_name=file_name.decode())
+                f = Function(name=func_name, file_name=file_name)
 
                 assert (
                     f in BBCovCoverageStats.COV_MAP
@@ -128,11 +158,21 @@ class BBCovCoverageStats:
                         i == BBCovCoverageStats.COV_MAP[f][i].id
                     ), f"Coverage index mismatch for {f} at index {i}"
                     if cov_array[i] > 0:
-                        BBCovCoverageStats.COV_MAP[f][i] = CoverageDetails(
-                            coverage_index=max(
+                        if BBCovCoverageStats.AGGREGATE == "max":
+                            coverage_index = max(
                                 BBCovCoverageStats.COV_MAP[f][i].coverage_index,
                                 cov_array[i],
-                            ),
+                            )
+                        else:
+                            coverage_index = (
+                                BBCovCoverageStats.COV_MAP[f][i].coverage_index + cov_array[i]
+                            )
+                        if BBCovCoverageStats.AGGREGATE == "hist":
+                            hist = BBCovCoverageStats.HISTOGRAMS.setdefault((f, i), {})
+                            bucket = cov_array[i].bit_length()
+                            hist[bucket] = hist.get(bucket, 0) + 1
+                        BBCovCoverageStats.COV_MAP[f][i] = CoverageDetails(
+                            coverage_index=coverage_index,
                             id=BBCovCoverageStats.COV_MAP[f][i].id,
                             line_details=BBCovCoverageStats.COV_MAP[f][i].line_details,
                             files=BBCovCoverageStats.COV_MAP[f][i].files
@@ -186,17 +226,10 @@ class BBCovCoverageStats:
 
     @staticmethod
     def get_json_cov_map():
-        SKIP_FILES = [
-            "instrumentation_helpers/complex_types.c",
-            "instrumentation_helpers/helper.c",
-            "instrumentation_helpers/hooks.c",
-            "instrumentation_helpers/list.c"
-        ]
-        
         # convert to json serializable format
         cov_map = {}
         for f, func in BBCovCoverageStats.COV_MAP.items():
-            if f.file_name in SKIP_FILES:
+            if f.file_name in DUMP_SKIP_FILES:
                 continue
             
             if f.file_name not in cov_map:
@@ -253,6 +286,179 @@ class BBCovCoverageStats:
                 print(f"\t{covered} / {total} : {covered/total}")
 
 
+class EdgeCoverageStats:
+    """
+    Edge coverage from the hashed map of -edgecov. The map is indexed by
+    (src location >> 1) ^ dst location, so every CFG edge of the cov_info is
+    mapped to its index up front and a hit index marks all edges that hash to
+    it. A block is covered when an edge into it was hit.
+    """
+
+    COV_MAP = {}
+    FUNCTIONS = {}
+    EDGE_INDEX = {}
+    EDGE_HITS = {}
+    UNMAPPED = set()
+    MAP_SIZE = 0
+
+    @staticmethod
+    def init_cov_info(cov_info: dict):
+        EdgeCoverageStats.COV_MAP = {}
+        EdgeCoverageStats.FUNCTIONS = {}
+        EdgeCoverageStats.EDGE_INDEX = {}
+        EdgeCoverageStats.EDGE_HITS = {}
+        EdgeCoverageStats.UNMAPPED = set()
+        EdgeCoverageStats.MAP_SIZE = cov_info["MapSize"]
+
+        locations = {}
+        for bb_obj in cov_info["BasicBlock"]:
+            id = bb_obj["Id"]
+            linemap = []
+            for line_obj in bb_obj["Coverage"]:
+                linemap.append(LineDetails(line_obj["File"], line_obj["Line"]))
+            EdgeCoverageStats.COV_MAP[id] = CoverageDetails(0, id, linemap, [])
+            EdgeCoverageStats.FUNCTIONS[id] = bb_obj["Function"]
+            locations[id] = bb_obj["Location"]
+
+        for bb_obj in cov_info["BasicBlock"]:
+            src = bb_obj["Id"]
+            if bb_obj["Entry"]:
+                EdgeCoverageStats.EDGE_INDEX.setdefault(locations[src], []).append(
+                    Edge(None, src)
+                )
+            for dst in bb_obj["Successors"]:
+                index = (locations[src] >> 1) ^ locations[dst]
+                EdgeCoverageStats.EDGE_INDEX.setdefault(index, []).append(Edge(src, dst))
+
+    @staticmethod
+    def add_cov_map(cov_map, cov_file_name):
+        # highest count of an edge into each block, so every block is updated
+        # and credited to the input once however many of its edges were hit
+        reached = {}
+        for index, count in cov_map:
+            edges = EdgeCoverageStats.EDGE_INDEX.get(index)
+            if edges is None:
+                # an edge the CFG does not have, e.g. through a longjmp
+                EdgeCoverageStats.UNMAPPED.add(index)
+                continue
+            for edge in edges:
+                EdgeCoverageStats.EDGE_HITS[edge] = max(
+                    EdgeCoverageStats.EDGE_HITS.get(edge, 0), count
+                )
+                reached[edge.dst] = max(reached.get(edge.dst, 0), count)
+
+        for dst, count in reached.items():
+            bb = EdgeCoverageStats.COV_MAP[dst]
+            bb.files.append(cov_file_name)
+            if count > bb.coverage_index:
+                EdgeCoverageStats.COV_MAP[dst] = bb._replace(coverage_index=count)
+
+    @staticmethod
+    def function_blocks(function: str):
+        return [
+            bb
+            for id, bb in EdgeCoverageStats.COV_MAP.items()
+            if EdgeCoverageStats.FUNCTIONS[id] == function
+        ]
+
+    @staticmethod
+    def get_files_covering_line(function: str, line: int):
+        files = set()
+        for bb in EdgeCoverageStats.function_blocks(function):
+            if bb.coverage_index > 0:
+                for line_detail in bb.line_details:
+                    if line_detail.line_no == line:
+                        files.update(bb.files)
+        return files
+
+    @staticmethod
+    def get_lines_covered(function: str):
+        covered_lines = set()
+        uncovered_lines = set()
+        for bb in EdgeCoverageStats.function_blocks(function):
+            if bb.coverage_index > 0:
+                for line in bb.line_details:
+                    covered_lines.add(line.line_no)
+            else:
+                for line in bb.line_details:
+                    uncovered_lines.add(line.line_no)
+        intersection = covered_lines.intersection(uncovered_lines)
+        return (
+            covered_lines.difference(intersection),
+            uncovered_lines.difference(intersection),
+            intersection,
+        )
+
+    @staticmethod
+    def get_file_name(function: str):
+        for bb in EdgeCoverageStats.function_blocks(function):
+            if bb.line_details:
+                return pathlib.Path(bb.line_details[0].file_name).name
+        return None
+
+    @staticmethod
+    def print_stats():
+        total_edges = sum(len(edges) for edges in EdgeCoverageStats.EDGE_INDEX.values())
+        collisions = sum(
+            len(edges) for edges in EdgeCoverageStats.EDGE_INDEX.values() if len(edges) > 1
+        )
+        covered_bbs = sum(1 for bb in EdgeCoverageStats.COV_MAP.values() if bb.coverage_index > 0)
+        print(f"Edges covered: {len(EdgeCoverageStats.EDGE_HITS)} / {total_edges}")
+        print(f"Basic blocks covered: {covered_bbs} / {len(EdgeCoverageStats.COV_MAP)}")
+        print(f"Edges sharing a map index: {collisions}")
+        print(f"Hit indices without a CFG edge: {len(EdgeCoverageStats.UNMAPPED)}")
+
+    @staticmethod
+    def print_summary(function):
+        blocks = EdgeCoverageStats.function_blocks(function)
+        if not blocks:
+            return
+        covered = sum(1 for bb in blocks if bb.coverage_index > 0)
+        ids = {bb.id for bb in blocks}
+        edges = [
+            edge
+            for index_edges in EdgeCoverageStats.EDGE_INDEX.values()
+            for edge in index_edges
+            if edge.dst in ids
+        ]
+        covered_edges = sum(1 for edge in edges if edge in EdgeCoverageStats.EDGE_HITS)
+        print(f"{function} : ", end="")
+        print(f"\t{covered} / {len(blocks)} blocks, {covered_edges} / {len(edges)} edges")
+
+
+# the class-level state of the stats classes and how to create it empty, so a
+# caller can keep several coverage stores and swap them in (see bccov.session)
+STATS_STATE = {
+    (TracePCCoverageStats, "COV_MAP"): dict,
+    (TracePCCoverageStats, "ORDER"): dict,
+    (TracePCCoverageStats, "CMP_MAP"): dict,
+    (TracePCCoverageStats, "Counter"): int,
+    (TracePCCoverageStats, "cmp_mode"): bool,
+    (BBCovCoverageStats, "COV_MAP"): dict,
+    (BBCovCoverageStats, "AGGREGATE"): lambda: "max",
+    (BBCovCoverageStats, "HISTOGRAMS"): dict,
+    (EdgeCoverageStats, "COV_MAP"): dict,
+    (EdgeCoverageStats, "FUNCTIONS"): dict,
+    (EdgeCoverageStats, "EDGE_INDEX"): dict,
+    (EdgeCoverageStats, "EDGE_HITS"): dict,
+    (EdgeCoverageStats, "UNMAPPED"): set,
+    (EdgeCoverageStats, "MAP_SIZE"): int,
+}
+
+
+def empty_stats_state() -> dict:
+    return {key: factory() for key, factory in STATS_STATE.items()}
+
+
+def save_stats_state() -> dict:
+    return {(cls, attr): getattr(cls, attr) for cls, attr in STATS_STATE}
+
+
+def load_stats_state(state: dict):
+    for (cls, attr), value in state.items():
+        setattr(cls, attr, value)
+
+
 def enable_comparison_mode():
     TracePCCoverageStats.set_cmp_mode(True)
 
@@ -283,11 +489,14 @@ def parse_cov_info_file(cov_info_file: pathlib.Path, mode: str = "tracepc"):
         cov_info_file.exists() and cov_info_file.is_file()
     ), f"Coverage info file {cov_info_file} does not exist"
 
-    cov_json = json.loads(cov_info_file.read_text())
-    if mode == "tracepc":
-        TracePCCoverageStats.init_cov_info(cov_json)
-    elif mode == "bbcov":
-        BBCovCoverageStats.init_cov_info(cov_json)
+    with span("init_cov_info", mode=mode):
+        cov_json = json.loads(cov_info_file.read_text())
+        if mode == "tracepc":
+            TracePCCoverageStats.init_cov_info(cov_json)
+        elif mode == "bbcov":
+            BBCovCoverageStats.init_cov_info(cov_json)
+        elif mode == "edgecov":
+            EdgeCoverageStats.init_cov_info(cov_json)
 
 
 def parse_coverage_file(
@@ -301,29 +510,120 @@ def parse_coverage_file(
         parse_tracepc_coverage_file(cov_file)
     elif mode == "bbcov":
         parse_bbcov_coverage_file(cov_file, original_input)
+    elif mode == "edgecov":
+        EdgeCoverageStats.add_cov_map(read_edgecov_coverage_file(cov_file), original_input)
     else:
         raise NotImplementedError
 
 
-def parse_tracepc_coverage_file(cov_file: pathlib.Path):
-    f = open(cov_file, "rb")
+def read_coverage_file(cov_file: pathlib.Path, mode: str = "tracepc"):
+    """
+    Decode a coverage file without merging it, the result can be cached and
+    merged later with merge_coverage.
+    """
+    with span("parse_coverage", mode=mode):
+        if mode == "tracepc":
+            return read_tracepc_coverage_file(cov_file)
+        elif mode == "bbcov":
+            return read_bbcov_coverage_file(cov_file)
+        elif mode == "edgecov":
+            return read_edgecov_coverage_file(cov_file)
+        else:
+            raise NotImplementedError
+
+
+def process_coverage_files(cov_file: pathlib.Path) -> list:
+    """
+    The coverage file of the target followed by the "<cov_file>.<pid>" files
+    written by the processes it forked.
+    """
+    files = [cov_file] if cov_file.exists() else []
+    children = [
+        pathlib.Path(p)
+        for p in glob.glob(f"{glob.escape(str(cov_file))}.*")
+        if p.rsplit(".", 1)[1].isdigit()
+    ]
+    return files + sorted(children, key=lambda p: int(p.suffix[1:]))
+
+
+def remove_coverage_files(cov_file: pathlib.Path):
+    for f in process_coverage_files(cov_file):
+        f.unlink()
+
+
+def combine_coverage(coverages: list, mode: str = "tracepc"):
+    """
+    Combine the decoded coverage of all processes of one input: traces are
+    concatenated, counters added and edge counts added (saturating like the map).
+    """
+    if len(coverages) == 1:
+        return coverages[0]
+    if mode == "tracepc":
+        return [bb_id for coverage in coverages for bb_id in coverage]
+    elif mode == "bbcov":
+        combined = {}
+        for coverage in coverages:
+            for file_name, func_map in coverage.items():
+                combined_funcs = combined.setdefault(file_name, {})
+                for func_name, cov_array in func_map.items():
+                    if func_name in combined_funcs:
+                        combined_funcs[func_name] = [
+                            a + b for a, b in zip(combined_funcs[func_name], cov_array)
+                        ]
+                    else:
+                        combined_funcs[func_name] = list(cov_array)
+        return combined
+    elif mode == "edgecov":
+        counts = {}
+        for coverage in coverages:
+            for index, count in coverage:
+                counts[index] = min(255, counts.get(index, 0) + count)
+        return [[index, counts[index]] for index in sorted(counts)]
+    else:
+        raise NotImplementedError
+
+
+def read_process_coverage(cov_file: pathlib.Path, mode: str = "tracepc"):
+    """
+    Decode and combine the coverage of every process of one run, None when no
+    process wrote a coverage file.
+    """
+    files = process_coverage_files(cov_file)
+    if not files:
+        return None
+    return combine_coverage([read_coverage_file(f, mode=mode) for f in files], mode)
+
+
+def merge_coverage(cov_map, mode: str = "tracepc", original_input: pathlib.Path = None):
+    with span("merge_coverage", mode=mode):
+        if mode == "tracepc":
+            TracePCCoverageStats.add_cov_map(cov_map)
+        elif mode == "bbcov":
+            BBCovCoverageStats.add_cov_map(cov_map, original_input)
+        elif mode == "edgecov":
+            EdgeCoverageStats.add_cov_map(cov_map, original_input)
+        else:
+            raise NotImplementedError
+
 
+def read_tracepc_coverage_file(cov_file: pathlib.Path):
     bbs = []
-    while True:
-        bb_id = read_uint32(f)
-        if bb_id == None:
-            break
+    with open(cov_file, "rb") as f:
+        while True:
+            bb_id = read_uint32(f)
+            if bb_id == None:
+                break
 
-        bbs.append(bb_id)
+            bbs.append(bb_id)
+    return bbs
 
+
+def parse_tracepc_coverage_file(cov_file: pathlib.Path):
     # use the bbs to create the map
-    TracePCCoverageStats.add_cov_map(bbs)
+    TracePCCoverageStats.add_cov_map(read_tracepc_coverage_file(cov_file))
 
 
-def parse_bbcov_coverage_file(
-    cov_file: pathlib.Path, original_input: pathlib.Path = None
-):
-    
+def read_bbcov_coverage_file(cov_file: pathlib.Path):
     cov_map = {}
     f = open(cov_file, "rb")
 
@@ -339,6 +639,8 @@ def parse_bbcov_coverage_file(
 
         func_map = {}
         num_functions = read_size(f)
+        if num_functions == None:
+            break
         for _ in range(num_functions):
             function_name_length = read_size(f)
             function_name = f.read(function_name_length)
@@ -347,16 +649,34 @@ def parse_bbcov_coverage_file(
                 break
 
             cov_array_len = read_size(f)
-            cov_array = []
-            for i in range(cov_array_len):
-                cov_array.append(read_uint64(f))
+            raw = f.read(8 * cov_array_len) if cov_array_len != None else b""
+            if cov_array_len == None or len(raw) != 8 * cov_array_len:
+                log.warning(f"{cov_file} is truncated at {function_name}")
+                break
+            cov_array = list(struct.unpack(f"{cov_array_len}Q", raw))
 
-            func_map[function_name] = cov_array
+            func_map[function_name.decode()] = cov_array
             log.debug(f"{function_name} : {cov_array}")
 
-        cov_map[file_name] = func_map
+        cov_map[file_name.decode()] = func_map
+
+    f.close()
+    return cov_map
+
 
-    BBCovCoverageStats.add_cov_map(cov_map, original_input)
+def read_edgecov_coverage_file(cov_file: pathlib.Path):
+    """
+    The edge map is written out raw, returns [index, count] of every hit
+    index (lists so the result can be cached as JSON).
+    """
+    data = cov_file.read_bytes()
+    return [[m.start(), data[m.start()]] for m in re.finditer(rb"[^\x00]", data)]
+
+
+def parse_bbcov_coverage_file(
+    cov_file: pathlib.Path, original_input: pathlib.Path = None
+):
+    BBCovCoverageStats.add_cov_map(read_bbcov_coverage_file(cov_file), original_input)
 
 
 def print_files_covered_by_line(mode="bbcov", function="main", line=0):
@@ -365,6 +685,8 @@ def print_files_covered_by_line(mode="bbcov", function="main", line=0):
     elif mode == "bbcov":
         files = BBCovCoverageStats.get_files_covering_line(function, line)
         print(files)
+    elif mode == "edgecov":
+        print(EdgeCoverageStats.get_files_covering_line(function, line))
     else:
         raise NotImplementedError
 
@@ -374,6 +696,8 @@ def print_coverage_stats(mode="bbcov"):
         TracePCCoverageStats.print_stats()
     elif mode == "bbcov":
         BBCovCoverageStats.print_stats()
+    elif mode == "edgecov":
+        EdgeCoverageStats.print_stats()
     else:
         raise NotImplementedError
 
@@ -392,15 +716,29 @@ def print_coverage_summary(mode="bbcov", function="main"):
             function = "old_main_grill"
         BBCovCoverageStats.print_summary(function)        
         return get_file_name(function)
+    elif mode == "edgecov":
+        EdgeCoverageStats.print_summary(function)
+        return EdgeCoverageStats.get_file_name(function)
     else:
         raise NotImplementedError
 
-def dump_coverage_info(mode="bbcov", output_file=""):
+def dump_coverage_info(mode="bbcov", output_file="", dump_format="json"):
     if mode == "tracepc":
         raise NotImplementedError
     elif mode == "bbcov":
-        with open(output_file, "w") as f:
-            f.write(json.dumps(BBCovCoverageStats.get_json_cov_map(), indent=4))
+        if BBCovCoverageStats.AGGREGATE == "hist":
+            log.warning("Coverage dumps only keep the counters, the histograms are not written")
+        with span("dump_coverage", format=dump_format):
+            if dump_format == "columnar":
+                from bccov.columnar import dump_columnar_cov_map
+
+                dump_columnar_cov_map(output_file)
+                return
+            # write then rename, the dump can be read while watch mode rewrites it
+            tmp_file = f"{output_file}.tmp"
+            with open(tmp_file, "w") as f:
+                f.write(json.dumps(BBCovCoverageStats.get_json_cov_map(), indent=4))
+            os.replace(tmp_file, output_file)
     else:
         raise NotImplementedError
 
@@ -413,6 +751,8 @@ def highlight_lines(function: str, sources: str, mode="bbcov", output_file=""):
         covered, uncovered, intersection = TracePCCoverageStats.get_lines_covered(
             function
         )
+    elif mode == "edgecov":
+        covered, uncovered, intersection = EdgeCoverageStats.get_lines_covered(function)
     else:
         if function == "main":
             log.warning("SWITCHING MAIN to old_main_grill - for GRILLER !!!! IF NOT GRILLER pls fix")
@@ -445,7 +785,13 @@ def load_dumped_json_cov_map(json_file):
     and populates BBCovCoverageStats.COV_MAP.
     """
     with open(json_file, "r") as f:
-        cov_json = json.load(f)
+        load_json_cov_map(json.load(f))
+
+
+def load_json_cov_map(cov_json: dict):
+    """
+    Populates BBCovCoverageStats.COV_MAP from a decoded JSON dump.
+    """
     BBCovCoverageStats.COV_MAP = {}
     for file_name, func_map in cov_json.items():
         for func_name, bb_list in func_map.items():
@@ -460,3 +806,29 @@ def load_dumped_json_cov_map(json_file):
                 covidx = bb.get("CovIndex", 0)
                 bb_objs.append(CoverageDetails(covidx, id, linemap, []))
             BBCovCoverageStats.COV_MAP[fkey] = bb_objs
+
+
+def load_dumped_cov_map(dump_file):
+    """
+    Loads a coverage dump in either format (see dump_coverage_info) into
+    BBCovCoverageStats.COV_MAP.
+    """
+    from bccov.columnar import is_columnar_dump, load_columnar_cov_map
+
+    if is_columnar_dump(dump_file):
+        load_columnar_cov_map(dump_file)
+    else:
+        load_dumped_json_cov_map(dump_file)
+
+
+def load_dumped_function_cov_map(dump_file, functions: list):
+    """
+    Like load_dumped_cov_map, but columnar dumps only decode the given
+    functions. JSON dumps are always loaded whole.
+    """
+    from bccov.columnar import is_columnar_dump, load_function_cov_map
+
+    if is_columnar_dump(dump_file):
+        load_function_cov_map(dump_file, functions)
+    else:
+        load_dumped_json_cov_map(dump_file)
@@ -0,0 +1,153 @@
+import json
+import os
+import pathlib
+import socket
+import socketserver
+import threading
+
+from bccov.coverage import BBCovCoverageStats
+from bccov.indexer import get_function_source
+from bccov.utils.pylogger import get_logger
+
+log = get_logger(__name__)
+
+
+class CoverageDaemon:
+    """
+    Answers queries against the warm coverage state. The coverage map and the
+    code database are not thread safe, so every query holds the lock.
+
+    Protocol: one JSON object per line in both directions. Requests carry a
+    "cmd" and its arguments, replies are {"ok": true, "result": ...} or
+    {"ok": false, "error": "..."}.
+
+        {"cmd": "ping"}
+        {"cmd": "summary", "function": name}
+        {"cmd": "source", "function": name, "file": optional file name}
+        {"cmd": "inputs", "function": name, "line": line}
+        {"cmd": "run_new_inputs"}
+        {"cmd": "shutdown"}
+    """
+
+    def __init__(self, run_new_inputs):
+        self.run_new_inputs = run_new_inputs
+        self.lock = threading.Lock()
+        self.server = None
+
+    def handle(self, request: dict):
+        handler = getattr(self, f"cmd_{request.get('cmd')}", None)
+        if handler is None:
+            raise Exception(f"Unknown command {request.get('cmd')}")
+        with self.lock:
+            return handler(request)
+
+    def cmd_ping(self, request):
+        return "pong"
+
+    def cmd_summary(self, request):
+        function = request["function"]
+        summary = []
+        for f, func in BBCovCoverageStats.COV_MAP.items():
+            if f.name == function:
+                covered = sum(1 for bb in func if bb.coverage_index > 0)
+                summary.append(
+                    {
+                        "file": f.file_name,
+                        "function": f.name,
+                        "covered": covered,
+                        "total": len(func),
+                    }
+                )
+        return summary
+
+    def cmd_source(self, request):
+        function = request["function"]
+        sources = get_function_source(function, request.get("file"), output_mode=False)
+        if sources is None:
+            raise Exception(f"Could not find function with the name {function}")
+        covered, uncovered, intersection = BBCovCoverageStats.get_lines_covered(
+            function
+        )
+        lines = []
+        for line in sources:
+            status = None
+            if line.line in covered:
+                status = "covered"
+            elif line.line in uncovered:
+                status = "uncovered"
+            elif line.line in intersection:
+                status = "partial"
+            lines.append({"line": line.line, "source": line.source, "status": status})
+        return lines
+
+    def cmd_inputs(self, request):
+        files = BBCovCoverageStats.get_files_covering_line(
+            request["function"], int(request["line"])
+        )
+        return sorted(str(f) for f in files)
+
+    def cmd_run_new_inputs(self, request):
+        return {"new_inputs": self.run_new_inputs()}
+
+    def cmd_shutdown(self, request):
+        # shutdown() blocks until serve_forever returns, so it cannot run on
+        # the handler thread
+        threading.Thread(target=self.server.shutdown).start()
+        return "shutting down"
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                reply = {
+                    "ok": True,
+                    "result": self.server.coverage_daemon.handle(json.loads(line)),
+                }
+            except Exception as e:
+                log.debug(f"Query {line!r} failed : {e}")
+                reply = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path: pathlib.Path, daemon: CoverageDaemon):
+    if socket_path.exists():
+        socket_path.unlink()
+    with DaemonServer(str(socket_path), RequestHandler) as server:
+        server.coverage_daemon = daemon
+        daemon.server = server
+        os.chmod(socket_path, 0o600)
+        log.info(f"Serving coverage queries on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    socket_path.unlink()
+    log.info("Daemon stopped")
+
+
+def query(socket_path: pathlib.Path, request: dict) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(str(socket_path))
+        s.sendall(json.dumps(request).encode() + b"\n")
+        reply = b""
+        while not reply.endswith(b"\n"):
+            chunk = s.recv(1 << 16)
+            if not chunk:
+                break
+            reply += chunk
+    if not reply.endswith(b"\n"):
+        # the daemon died or shut down before replying in full
+        raise Exception(
+            f"The daemon on {socket_path} closed the connection without replying"
+            if not reply
+            else f"The daemon on {socket_path} sent an incomplete reply : {reply!r}"
+        )
+    return json.loads(reply)
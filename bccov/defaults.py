@@ -0,0 +1,16 @@
+"""
+Defaults and choices of the CLI options that belong to subsystems main only
+imports when they are used. Kept free of imports, so building the parser
+(and --help) does not load them.
+"""
+
+DEFAULT_COMPILERS = ["clang", "~/griller_utils/AFLplusplus/afl-clang-fast"]
+
+DEFAULT_QUEUE_SIZE = 64
+
+DEFAULT_TRIAGE_LAST = 8
+
+# cost minimized by cmin
+WEIGHTS = ["count", "size", "time"]
+
+MERGE_OPS = {"sum": lambda a, b: a + b, "max": max}
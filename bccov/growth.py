@@ -0,0 +1,143 @@
+"""
+Coverage growth over a fuzzing campaign.
+
+AFL names queue entries "id:000042,src:000007,time:12345,...", the id is the
+discovery order and time (AFL++) the milliseconds since the campaign started.
+Replaying the queue in id order and adding each entry's blocks to the
+cumulative set gives the coverage the campaign had after every entry.
+"""
+from typing import List
+from collections import namedtuple
+import csv
+import json
+import pathlib
+import re
+
+from bccov.cmin import coverage_blocks
+from bccov.coverage import (
+    BBCovCoverageStats,
+    EdgeCoverageStats,
+    Function,
+    TracePCCoverageStats,
+)
+from bccov.utils.pylogger import get_logger
+from bccov.watch import is_input_file
+
+log = get_logger(__name__)
+
+# time is in seconds since the first entry
+QueueEntry = namedtuple("QueueEntry", ["input_file", "id", "time"])
+GrowthPoint = namedtuple("GrowthPoint", ["time", "inputs", "blocks", "lines"])
+
+AFL_NAME = re.compile(r"^id:(\d+)")
+AFL_TIME = re.compile(r"(?:^|,)time:(\d+)")
+
+
+def queue_entries(queue_dir: pathlib.Path) -> List[QueueEntry]:
+    """
+    The entries of an AFL queue in discovery order. Without a time: field
+    (AFL before ++ and non-AFL directories) the modification time is used,
+    files that are not named by AFL come last in modification time order.
+    """
+    files = [f for f in queue_dir.glob("*") if is_input_file(f)]
+    if not files:
+        return []
+    start = min(f.stat().st_mtime for f in files)
+    entries = []
+    for f in files:
+        id_match = AFL_NAME.match(f.name)
+        time_match = AFL_TIME.search(f.name)
+        if time_match:
+            time = int(time_match.group(1)) / 1000
+        else:
+            time = f.stat().st_mtime - start
+        entries.append(
+            QueueEntry(f, int(id_match.group(1)) if id_match else None, time)
+        )
+    return sorted(
+        entries,
+        key=lambda e: (
+            e.id is None,
+            e.id if e.id is not None else 0,
+            e.time,
+            e.input_file.name,
+        ),
+    )
+
+
+def block_lines(block, mode: str) -> list:
+    """
+    The (file, line) pairs of a block key as returned by coverage_blocks, for
+    edgecov the lines of the blocks the map index leads to.
+    """
+    if mode == "tracepc":
+        bbs = [TracePCCoverageStats.COV_MAP[block]]
+    elif mode == "bbcov":
+        file_name, func_name, i = block
+        bbs = [BBCovCoverageStats.COV_MAP[Function(func_name, file_name)][i]]
+    elif mode == "edgecov":
+        bbs = [
+            EdgeCoverageStats.COV_MAP[edge.dst]
+            for edge in EdgeCoverageStats.EDGE_INDEX.get(block, [])
+        ]
+    else:
+        raise NotImplementedError
+    return [(line.file_name, line.line_no) for bb in bbs for line in bb.line_details]
+
+
+class GrowthCurve:
+    """
+    Cumulative coverage as the set of blocks seen so far. Only blocks seen
+    for the first time are looked up for lines, so an entry costs a set
+    lookup per block it hit.
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.blocks = set()
+        self.lines = set()
+        self.points = []
+
+    def add(self, entry: QueueEntry, coverage) -> GrowthPoint:
+        for block in coverage_blocks(coverage, self.mode):
+            if block not in self.blocks:
+                self.blocks.add(block)
+                self.lines.update(block_lines(block, self.mode))
+        # entries can be out of time order when AFL syncs from other instances
+        time = max(entry.time, self.points[-1].time) if self.points else entry.time
+        point = GrowthPoint(
+            time, len(self.points) + 1, len(self.blocks), len(self.lines)
+        )
+        self.points.append(point)
+        return point
+
+
+def write_growth(points: List[GrowthPoint], output_file: pathlib.Path):
+    """
+    JSON for a .json output file, CSV otherwise.
+    """
+    if output_file.suffix == ".json":
+        with open(output_file, "w") as f:
+            json.dump([p._asdict() for p in points], f, indent=4)
+        return
+    with open(output_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(GrowthPoint._fields)
+        for p in points:
+            writer.writerow([f"{p.time:.3f}", p.inputs, p.blocks, p.lines])
+
+
+def print_summary(points: List[GrowthPoint]):
+    if not points:
+        print("No queue entries")
+        return
+    last = points[-1]
+    print(
+        f"{last.inputs} entries over {last.time:.1f}s : {last.blocks} blocks, {last.lines} lines"
+    )
+    # when the campaign reached half and 90% of its final block coverage
+    for fraction in [0.5, 0.9]:
+        point = next(p for p in points if p.blocks >= fraction * last.blocks)
+        print(
+            f"\t{int(fraction * 100)}% of blocks after {point.time:.1f}s ({point.inputs} entries)"
+        )
@@ -3,9 +3,7 @@ from typing import List
 from collections import namedtuple
 import os
 
-import clang.cindex
-from clang.cindex import Config
-
+from bccov.sources import SourceCache
 from bccov.utils import get_logger
 
 logger = get_logger(__name__, "INFO")
@@ -13,8 +11,20 @@ logger = get_logger(__name__, "INFO")
 sources = namedtuple("sources", ["source", "line", "file_path"])
 
 
+def load_clang():
+    """
+    The libclang bindings are imported on first use, most commands never build
+    a code database.
+    """
+    import clang.cindex
+
+    return clang.cindex
+
+
 class CodebaseAnalyzer:
     def __init__(self, codebase_path):
+        self.cindex = load_clang()
+        Config = self.cindex.Config
         if pathlib.Path('/home/r3x/llvm10/llvm-10.0.0.obj/lib').exists():
             Config.set_library_path('/home/r3x/llvm10/llvm-10.0.0.obj/lib')
         elif pathlib.Path('/usr/lib/llvm-10/lib').exists():
@@ -22,8 +32,9 @@ class CodebaseAnalyzer:
         else:
             raise Exception("Could not find the clang library path")
         
-        self.index = clang.cindex.Index.create()
+        self.index = self.cindex.Index.create()
         self.cache = {}  # Cache to store indexes and extracted data for each file
+        self.sources = SourceCache(codebase_path)
         self.codebase_path = codebase_path
         self.load_codebase()
 
@@ -47,7 +58,7 @@ class CodebaseAnalyzer:
         tu = self.cache[file_path]["tu"]
         for node in tu.cursor.walk_preorder():
             if node.location.file is not None and node.location.file.name == file_path:
-                if node.kind == clang.cindex.CursorKind.FUNCTION_DECL:
+                if node.kind == self.cindex.CursorKind.FUNCTION_DECL:
                     self.cache[file_path]["functions"][node.spelling] = node
                 # elif node.kind in [clang.cindex.CursorKind.STRUCT_DECL, clang.cindex.CursorKind.UNION_DECL, clang.cindex.CursorKind.TYPEDEF_DECL, clang.cindex.CursorKind.ENUM_DECL]:
                 #     self.cache[file_path]['types'][node.spelling] = node
@@ -112,14 +123,11 @@ class CodebaseAnalyzer:
                 file_path = functions[choice - 1][0]
                     
         start_line, end_line = node.extent.start.line, node.extent.end.line
-        with open(file_path, "rb") as file:
-            lines = file.readlines()
+        source_file = self.sources.get(file_path)
         # prepend each line with the line number and a tab
         new_lines = []
-        for i in range(start_line, end_line + 1):
-            new_lines.append(
-                sources(f"{i}:\t{lines[i - 1].decode('latin-1')}", i, file_path)
-            )
+        for i, line in source_file.lines(start_line, end_line):
+            new_lines.append(sources(f"{i}:\t{line}", i, file_path))
 
         return new_lines
 
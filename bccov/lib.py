@@ -6,6 +6,7 @@ import uuid
 from bccov.utils.pylogger import get_logger, set_global_log_level
 from bccov.main import tracepc, bbcov
 from bccov.config import set_config, set_cwd
+from bccov.defaults import DEFAULT_COMPILERS, DEFAULT_QUEUE_SIZE, DEFAULT_TRIAGE_LAST
 from bccov.llvm import build_passes
 from bccov.runtime import build_runtime
 
@@ -40,6 +41,37 @@ class Args(object):
         self.output_file = None
         self.print_stats = False
         self.line = None
+        self.timeout = 5.0
+        self.kill_timeout = 1.0
+        self.cache_dir = None
+        self.no_cache = False
+        self.no_carry_forward = False
+        self.watch = False
+        self.jobs = os.cpu_count()
+        self.pipeline = False
+        self.persistent = False
+        self.queue_size = DEFAULT_QUEUE_SIZE
+        self.dump_interval = 60.0
+        self.poll_interval = 1.0
+        self.cmin = None
+        self.cmin_weight = "count"
+        self.triage = None
+        self.triage_last = DEFAULT_TRIAGE_LAST
+        self.growth = None
+        self.shard_output = None
+        self.dump_format = "json"
+        self.report_html = None
+        self.report_lcov = None
+        self.daemon = None
+        self.aggregate = "max"
+        self.profile = None
+        self.profile_top = 20
+        self.flamegraph = None
+        self.edgecov = False
+        self.tracepc_guard = False
+        self.scope_function = None
+        self.scope_depth = None
+        self.compilers = list(DEFAULT_COMPILERS)
 
     def set_function(self, function):
         self.function = function
@@ -85,9 +117,10 @@ def run_bbcov_cov(bitcode_file, dirs, source_dir, target_function, cflags, outpu
     bbcov(args)
 
 def run_highlight_from_dumped_covinfo(covinfo_file, source_dir, target_function, output_file=None):
-    from bccov.coverage import load_dumped_json_cov_map, print_coverage_summary, get_function_source, highlight_lines
+    from bccov.coverage import load_dumped_function_cov_map, print_coverage_summary, highlight_lines
     from bccov.indexer import create_code_database, get_function_source
-    load_dumped_json_cov_map(covinfo_file)
+    # print_coverage_summary looks main up as old_main_grill
+    load_dumped_function_cov_map(covinfo_file, [target_function, "old_main_grill"])
     create_code_database(source_dir)
     file_name = print_coverage_summary("bbcov", target_function)
     sources = get_function_source(
@@ -2,6 +2,7 @@ import pathlib
 
 from bccov import config
 from bccov.utils import run_cmd
+from bccov.utils.trace import span
 
 
 def build_passes():
@@ -16,15 +17,26 @@ def run_passes(
     output_cov_info_file: str,
     skip_file: pathlib.Path,
     flags: str = "",
+    scope_function: str = None,
+    scope_depth: int = None,
 ):
+    """
+    With scope_function only that function and the functions reachable from
+    it (at most scope_depth calls deep if given) are instrumented.
+    """
     PASS_MAP = {"CovInstrument": f"{config.LIB_DIR}/build/libCovInstrument.so"}
     # run run.sh
     skip_flag = ""
     if skip_file.exists():
         skip_flag = f"--skiplist {skip_file}"
-    run_cmd(
-        f"{config.LLVM_OPT} -f -load {PASS_MAP[pass_name]} -output {output_cov_info_file} {flags} {skip_flag} -cov-instrument --disable-verify < {bitcode_file} > {output_bitcode_file}",
-    )
+    if scope_function:
+        flags = f"{flags} -scope-function {scope_function}"
+        if scope_depth is not None:
+            flags = f"{flags} -scope-depth {scope_depth}"
+    with span("run_passes", flags=flags):
+        run_cmd(
+            f"{config.LLVM_OPT} -f -load {PASS_MAP[pass_name]} -output {output_cov_info_file} {flags} {skip_flag} -cov-instrument --disable-verify < {bitcode_file} > {output_bitcode_file}",
+        )
     output_bitcode_file = pathlib.Path(output_bitcode_file)
     assert (
         output_bitcode_file.exists() and output_bitcode_file.is_file()
@@ -1,7 +1,16 @@
+from collections import namedtuple
+import os
 import pathlib
+import time
 
 from bccov import config
-from bccov.utils.commands import run_cmd
+from bccov.utils.commands import run_cmd, run_with_timeout
+from bccov.utils.pylogger import get_logger
+from bccov.utils.trace import EXEC_SPAN, span
+
+log = get_logger(__name__)
+
+RunResult = namedtuple("RunResult", ["returncode", "timed_out", "exec_time"])
 
 
 def build_runtime():
@@ -15,27 +24,54 @@ def link_runtime(
     debug: bool = False,
     mode: str = "",
 ):
-    BITCODE = {"tracepc": "tracepc_runtime.bc", "bbcov": "bbcov_runtime.bc"}
+    BITCODE = {
+        "tracepc": "tracepc_runtime.bc",
+        "bbcov": "bbcov_runtime.bc",
+        "edgecov": "edgecov_runtime.bc",
+    }
 
     assert all(
         p.exists() and p.is_file() for p in [input_bitcode]
     ), f"Input files do not exist"
 
-    if debug:
-        run_cmd(
-            f"{config.LLVM_LINK} {input_bitcode} {config.RUNTIME_DIR}/debug{BITCODE[mode]} -o {output_bitcode}",
-        )
-    else:
-        run_cmd(
-            f"{config.LLVM_LINK} {input_bitcode} {config.RUNTIME_DIR}/{BITCODE[mode]} -o {output_bitcode}",
-        )
+    with span("link_runtime", mode=mode):
+        if debug:
+            run_cmd(
+                f"{config.LLVM_LINK} {input_bitcode} {config.RUNTIME_DIR}/debug{BITCODE[mode]} -o {output_bitcode}",
+            )
+        else:
+            run_cmd(
+                f"{config.LLVM_LINK} {input_bitcode} {config.RUNTIME_DIR}/{BITCODE[mode]} -o {output_bitcode}",
+            )
 
 
 def run_and_collect_coverage(
-    input_binary: pathlib.Path, output_file: pathlib.Path, input_file: pathlib.Path
-):
+    input_binary: pathlib.Path,
+    output_file: pathlib.Path,
+    input_file: pathlib.Path,
+    timeout: float = None,
+    kill_timeout: float = 1.0,
+) -> RunResult:
+    """
+    Run the instrumented binary on a single input. If the input runs longer than
+    timeout seconds the target gets SIGTERM (the runtimes dump the counters they
+    have so far on it) and is SIGKILLed kill_timeout seconds after that.
+    """
     # Check if the input files exist
     assert input_binary.exists() and input_binary.is_file(), f"Input binary does not exist"
     assert input_file.exists() and input_file.is_file(), f"Input file does not exist"
 
-    run_cmd(f"BC_COV_FILE={output_file} {input_binary} < {input_file}")
+    env = dict(os.environ, BC_COV_FILE=str(output_file))
+    start = time.monotonic()
+    with span(EXEC_SPAN, input=input_file):
+        _, _, returncode, timed_out = run_with_timeout(
+            [str(input_binary)],
+            stdin_file=input_file,
+            env=env,
+            timeout=timeout,
+            kill_timeout=kill_timeout,
+        )
+    exec_time = time.monotonic() - start
+    if timed_out:
+        log.warning(f"{input_file} timed out after {exec_time:.2f}s")
+    return RunResult(returncode, timed_out, exec_time)
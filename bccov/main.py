@@ -1,29 +1,60 @@
 import argparse
+import json
 import os
 import pathlib
-import uuid
+import time
 
+from bccov.cache import CoverageCache, hash_file
 from bccov.compile import build_binary
 from bccov.config import TESTS_DIR, set_config
 from bccov.coverage import (
+    AGGREGATE_MODES,
+    DUMP_FORMATS,
+    BBCovCoverageStats,
     dump_coverage_info,
-    enable_comparison_mode,
     highlight_lines,
+    load_dumped_cov_map,
+    load_dumped_function_cov_map,
+    load_json_cov_map,
+    merge_coverage,
     parse_cov_info_file,
-    parse_coverage_file,
     print_coverage_stats,
     print_coverage_summary,
     print_files_covered_by_line,
+    read_process_coverage,
+    remove_coverage_files,
+)
+from bccov.defaults import (
+    DEFAULT_COMPILERS,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_TRIAGE_LAST,
+    MERGE_OPS,
+    WEIGHTS,
 )
 from bccov.indexer import create_code_database, get_function_source
 from bccov.llvm import build_passes, run_passes
 from bccov.lruntime import build_runtime, link_runtime, run_and_collect_coverage
+from bccov.remap import carry_forward
+from bccov.target import PASS_FLAGS, Target
+from bccov.utils import trace
 from bccov.utils.pylogger import get_logger, set_global_log_level
+from bccov.utils.trace import span
+
+# the subsystems behind the modes (watch, pipeline, persistent, cmin, triage,
+# growth, shards, reports, profiles, the daemon and compiler comparison) are
+# imported by the functions that use them, so startup only pays for the
+# common path
 
 log = get_logger(__name__)
 
 CWD=None
 
+# inputs that hit the per-input timeout, their partial coverage is still merged
+TIMED_OUT_INPUTS = []
+
+CACHE = None
+
+
 def run_cli():
     parser = argparse.ArgumentParser(
         description="Run an LLVM pass on a bitcode file and process input and source directories."
@@ -45,7 +76,6 @@ def run_cli():
         "--source_dir",
         type=pathlib.Path,
         help="Path to the directory containing source files",
-        required=True,
     )
     parser.add_argument(
         "-c",
@@ -78,6 +108,20 @@ def run_cli():
         help="Enable ordered tracing of basic blocks",
         action="store_true",
     )
+    parser.add_argument(
+        "--scope-function",
+        help="Only instrument this function and the functions reachable from it",
+    )
+    parser.add_argument(
+        "--scope-depth",
+        help="With --scope-function, only instrument callees up to this many calls deep",
+        type=int,
+    )
+    parser.add_argument(
+        "--tracepc-guard",
+        help="With --tracepc only record the first hit of every block, in first-hit order",
+        action="store_true",
+    )
     parser.add_argument(
         "--cflags",
         help="Flags to pass to the compiler",
@@ -89,12 +133,23 @@ def run_cli():
         help="Enable profiling-style, thread-safe basic block coverage",
         action="store_true",
     )
+    parser.add_argument(
+        "--edgecov",
+        help="Enable AFL-style edge coverage in a fixed-size hashed map",
+        action="store_true",
+    )
     parser.add_argument(
         "-ccm",
         "--compare-compilers-mode",
         help="Enable compiler comparison mode",
         action="store_true",
     )
+    parser.add_argument(
+        "--compilers",
+        help="Compilers to compare in comparison mode",
+        nargs="+",
+        default=DEFAULT_COMPILERS,
+    )
     parser.add_argument(
         "-afl",
         help="Treat the input directory as an AFL input directory",
@@ -127,9 +182,190 @@ def run_cli():
         help="Enable interactive mode",
         action="store_true",
     )
+    parser.add_argument(
+        "--timeout",
+        help="Per-input timeout in seconds, after which the target gets SIGTERM so it dumps partial coverage",
+        type=float,
+        default=5.0,
+    )
+    parser.add_argument(
+        "--kill-timeout",
+        help="Seconds to wait after the per-input timeout before the target is SIGKILLed",
+        type=float,
+        default=1.0,
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory of the per-input coverage cache (default: <cwd>/.bccov_cache)",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--no-cache",
+        help="Do not read or write the per-input coverage cache",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-carry-forward",
+        help="Do not reuse cached coverage of the previous build for functions that did not change",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--watch",
+        help="Keep running and merge new inputs (AFL queue and crash entries with -afl) as they appear",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of inputs executed concurrently in watch and pipeline mode",
+        type=int,
+        default=os.cpu_count(),
+    )
+    parser.add_argument(
+        "--pipeline",
+        help="Run the inputs with an asyncio pipeline that overlaps target execution with decoding and merging (bbcov)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--persistent",
+        help="Run all inputs in one target process, for harnesses that loop on __bc_cov_loop() (bbcov)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--queue-size",
+        help="Decoded results that may wait for the merging thread in --pipeline mode",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+    )
+    parser.add_argument(
+        "--dump-interval",
+        help="Seconds between coverage dumps to the output file in watch mode",
+        type=float,
+        default=60.0,
+    )
+    parser.add_argument(
+        "--poll-interval",
+        help="Seconds between directory scans when inotify is not available",
+        type=float,
+        default=1.0,
+    )
+    parser.add_argument(
+        "--cmin",
+        help="Write a minimal subset of the inputs that keeps every covered block to this directory",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--cmin-weight",
+        help="Cost minimized by --cmin: number of inputs, total input size or total execution time",
+        choices=WEIGHTS,
+        default="count",
+    )
+    parser.add_argument(
+        "--triage",
+        help="Bucket the crashes (AFL crash entries with -afl) by coverage signature and write the buckets as JSON to this file",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--triage-last",
+        help="Number of last executed blocks in the --triage signature (tracepc)",
+        type=int,
+        default=DEFAULT_TRIAGE_LAST,
+    )
+    parser.add_argument(
+        "--growth",
+        help="Replay the queue (the AFL queue with -afl) in discovery order and write coverage over time to this file (.json for JSON, CSV otherwise)",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--dump-format",
+        help="Format of the coverage dump written to the output file",
+        choices=DUMP_FORMATS,
+        default="json",
+    )
+    parser.add_argument(
+        "--aggregate",
+        help="How block counters are combined across inputs (sum and hist give total executions), "
+        "with --load-cov-info how the loaded counters were combined",
+        choices=AGGREGATE_MODES,
+        default="max",
+    )
+    parser.add_argument(
+        "--profile",
+        help="Print the hottest functions, lines and blocks and write them as JSON to this file",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--profile-top",
+        help="Number of entries in each profile ranking",
+        type=int,
+        default=20,
+    )
+    parser.add_argument(
+        "--flamegraph",
+        help="Write the block executions as folded stacks for flame graph tools",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--report-html",
+        help="Write an HTML coverage report of every covered file to this directory",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--report-lcov",
+        help="Write an lcov .info coverage report to this file",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--shard-output",
+        help="Also write the bbcov coverage as a mergeable shard to this file",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--merge",
+        help="Merge the given coverage shards into the output file",
+        type=pathlib.Path,
+        nargs="+",
+    )
+    parser.add_argument(
+        "--cov-info",
+        help="cov_info.json of the build the shards come from, needed to --load-cov-info a shard",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--merge-op",
+        help="How counters of the same block are combined by --merge",
+        choices=list(MERGE_OPS),
+        default="sum",
+    )
+    parser.add_argument(
+        "--daemon",
+        help="After the initial bbcov run, keep the state warm and serve queries on this Unix socket",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--client",
+        help="Send --query to the daemon listening on this Unix socket and print the reply",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--query",
+        help='JSON query for --client, e.g. \'{"cmd": "summary", "function": "main"}\'',
+        type=str,
+        default='{"cmd": "ping"}',
+    )
+    parser.add_argument(
+        "--trace",
+        help="Time every pipeline stage and print a latency summary at exit",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--trace-file",
+        help="Also write the stage spans as a Chrome trace JSON file (implies --trace)",
+        type=pathlib.Path,
+    )
     parser.add_argument(
         "--load-cov-info",
-        help="Load coverage info from a dumped file (from get_json_cov_map) and print highlighted source",
+        help="Load coverage info from a dumped file (json or columnar) and print highlighted source",
         type=pathlib.Path,
     )
 
@@ -138,10 +374,62 @@ def run_cli():
     args.cflags = os.getenv("CFLAGS")
     print("CFLAGS: ", args.cflags)
 
+    if args.client:
+        from bccov.daemon import query
+
+        print(json.dumps(query(args.client, json.loads(args.query)), indent=4))
+        return
+
+    if args.merge:
+        if not args.output_file:
+            print("Merging shards requires an output file. Exiting.")
+            exit(1)
+        from bccov.shard import merge_shard_files, write_shard
+
+        log.info(f"Merging {len(args.merge)} shards")
+        write_shard(merge_shard_files(args.merge, args.merge_op, args.jobs), args.output_file)
+        print(f"Merged shard written to {args.output_file}")
+        return
+
+    if not args.source_dir:
+        print("Source directory is required. Exiting.")
+        exit(1)
+
     if args.load_cov_info:
-        from bccov.coverage import load_dumped_json_cov_map, print_coverage_summary, get_file_name, highlight_lines
-        from bccov.indexer import create_code_database, get_function_source
-        load_dumped_json_cov_map(args.load_cov_info)
+        from bccov.columnar import is_columnar_dump
+        from bccov.shard import check_shard, is_shard, load_shard_cov_map
+
+        if args.aggregate == "hist":
+            print(
+                "Coverage dumps and shards do not keep histograms, "
+                "--aggregate hist needs the inputs. Exiting."
+            )
+            exit(1)
+        # dumps and shards only keep the counters, --aggregate says how they
+        # were combined
+        BBCovCoverageStats.set_aggregate_mode(args.aggregate)
+
+        if not is_columnar_dump(args.load_cov_info):
+            # JSON dumps and shards are told apart by their keys, so the file
+            # is decoded once. Both are always loaded whole
+            with open(args.load_cov_info, "r") as f:
+                cov_json = json.load(f)
+            if is_shard(cov_json):
+                if not args.cov_info:
+                    print("Loading a shard requires --cov-info. Exiting.")
+                    exit(1)
+                load_shard_cov_map(check_shard(cov_json, args.load_cov_info), args.cov_info)
+            else:
+                load_json_cov_map(cov_json)
+        elif args.report_html or args.report_lcov or args.profile or args.flamegraph:
+            load_dumped_cov_map(args.load_cov_info)
+        else:
+            # print_coverage_summary looks main up as old_main_grill
+            load_dumped_function_cov_map(args.load_cov_info, [args.function, "old_main_grill"])
+        if args.report_html or args.report_lcov or args.profile or args.flamegraph:
+            write_reports(args)
+            write_profile_outputs(args)
+            return
         create_code_database(args.source_dir)
         file_name = print_coverage_summary("bbcov", args.function)
         sources = get_function_source(
@@ -158,18 +446,39 @@ def run_cli():
         print("Bitcode file and input directory are required. Exiting.")
         exit(1)
 
-    if not args.tracepc and not args.bbcov:
+    num_modes = args.tracepc + args.bbcov + args.edgecov
+    if num_modes == 0:
         print("No instrumentation selected. Exiting.")
         exit(1)
 
-    if args.tracepc and args.bbcov:
+    if num_modes > 1:
         print("Only one instrumentation can be selected. Exiting.")
         exit(1)
 
     if args.compare_compilers_mode:
-        if args.bbcov:
-            print("Comparison mode not supported for bbcov. Exiting.")
+        if not args.tracepc:
+            print("Comparison mode is only supported for tracepc. Exiting.")
             exit(1)
+
+    if args.tracepc_guard and not args.tracepc:
+        print("--tracepc-guard requires --tracepc. Exiting.")
+        exit(1)
+
+    if args.daemon and not args.bbcov:
+        print("Daemon mode is only supported for bbcov. Exiting.")
+        exit(1)
+
+    if args.watch and not args.bbcov:
+        print("Watch mode is only supported for bbcov. Exiting.")
+        exit(1)
+
+    if args.persistent and not args.bbcov:
+        print("Persistent mode is only supported for bbcov. Exiting.")
+        exit(1)
+
+    if args.persistent and args.pipeline:
+        print("Persistent and pipeline mode cannot be combined. Exiting.")
+        exit(1)
     set_config(args.config_file)
     if args.debug:
         set_global_log_level("DEBUG")
@@ -180,77 +489,569 @@ def run_cli():
         build_passes()
         build_runtime()
 
-    if args.compare_compilers_mode:
-        compare_compilers(args)
-    else:
-        if args.tracepc:
-            tracepc(args)
-        elif args.bbcov:
-            bbcov(args)
+    if args.trace or args.trace_file:
+        trace.enable()
 
+    try:
+        if args.compare_compilers_mode:
+            compare_compilers(args)
+        elif args.cmin:
+            cmin(args, selected_mode(args))
+        elif args.triage:
+            triage(args, selected_mode(args))
+        elif args.growth:
+            growth(args, selected_mode(args))
+        else:
+            if args.tracepc:
+                tracepc(args)
+            elif args.bbcov:
+                bbcov(args)
+            elif args.edgecov:
+                edgecov(args)
+    finally:
+        if trace.ENABLED:
+            trace.print_summary()
+            if args.trace_file:
+                trace.write_chrome_trace(args.trace_file)
 
-def compare_compilers(args: argparse.Namespace):
-    # TODO: this is incomplete ATM
-    # Hardcode compilers for now
-    COMPILERS = ["clang", "~/griller_utils/AFLplusplus/afl-clang-fast"]
+
+def selected_mode(args: argparse.Namespace) -> str:
+    if args.tracepc:
+        return "tracepc"
+    elif args.edgecov:
+        return "edgecov"
+    return "bbcov"
+
+
+def pass_flags(args: argparse.Namespace, mode: str) -> str:
+    flags = PASS_FLAGS[mode]
+    if mode == "tracepc" and args.tracepc_guard:
+        flags += " -tracepc-guard"
+    return flags
+
+
+def build_target(args: argparse.Namespace, mode: str) -> Target:
+    """
+    Instrument the bitcode for the given mode, link the matching runtime and
+    compile it. bbcov artifacts carry a random suffix so several runs can share
+    the working directory.
+    """
+    import uuid
+
+    suffix = f"-{str(uuid.uuid4())[0:8]}" if mode == "bbcov" else ""
+    log.info("Running Instrumentation passes")
     run_passes(
         pass_name="CovInstrument",
         bitcode_file=args.bitcode_file,
-        output_bitcode_file=f"{CWD}/instrumented.bc",
-        output_cov_info_file=f"{CWD}/cov_info.json",
+        output_bitcode_file=f"{CWD}/instrumented{suffix}.bc",
+        output_cov_info_file=f"{CWD}/cov_info{suffix}.json",
         skip_file=args.skip_file,
-        flags="-tracepc",
+        flags=pass_flags(args, mode),
+        scope_function=args.scope_function,
+        scope_depth=args.scope_depth,
     )
+
+    log.info("Linking runtime")
     link_runtime(
-        pathlib.Path(f"{CWD}/instrumented.bc"),
-        pathlib.Path(f"{CWD}/final_linked.bc"),
+        pathlib.Path(f"{CWD}/instrumented{suffix}.bc"),
+        pathlib.Path(f"{CWD}/final_linked{suffix}.bc"),
         args.debug,
-        "tracepc",
+        mode,
     )
 
-    enable_comparison_mode()
-    parse_cov_info_file(pathlib.Path(f"{CWD}/cov_info.json"), mode="tracepc")
-    create_code_database(args.source_dir)
-    for cid, compiler in enumerate(COMPILERS):
-        build_binary(f"{CWD}/final_linked.bc", f"{CWD}/bin{cid}", compiler)
-
-    for input_file in args.input_dir.glob("*"):
-        if not input_file.is_file():
-            continue
-        for cid, compiler in enumerate(COMPILERS):
-            run_and_collect_coverage(
-                pathlib.Path(f"{CWD}/bin{cid}"),
-                pathlib.Path(f"{CWD}/target.bc_cov"),
+    log.info("Compiling binary")
+    build_binary(f"{CWD}/final_linked{suffix}.bc", f"{CWD}/final_binary{suffix}", cflags=args.cflags)
+    return Target(
+        pathlib.Path(f"{CWD}/final_binary{suffix}"),
+        pathlib.Path(f"{CWD}/cov_info{suffix}.json"),
+        pathlib.Path(f"{CWD}/target{suffix}.bc_cov"),
+    )
+
+
+def open_cache(args: argparse.Namespace, target: Target, mode: str):
+    global CACHE
+    if args.no_cache:
+        CACHE = None
+        return
+    cache_dir = args.cache_dir or pathlib.Path(f"{CWD}/.bccov_cache")
+    CACHE = CoverageCache(cache_dir, target.binary, mode)
+    log.info(f"Using coverage cache {CACHE.dir}")
+    if not args.no_carry_forward:
+        carry_forward(CACHE, target.cov_info)
+
+
+def execute_input(
+    args: argparse.Namespace,
+    binary: pathlib.Path,
+    cov_file: pathlib.Path,
+    input_file: pathlib.Path,
+    mode: str,
+    runner=None,
+):
+    """
+    Run a single input through the instrumented binary and decode its coverage
+    without merging it. Inputs already in the coverage cache are not executed.
+    Inputs that time out are recorded in TIMED_OUT_INPUTS. With a runner the
+    input is handed to its persistent target process instead.
+
+    :return: (coverage, RunResult), coverage is None if the target did not
+        produce a coverage file
+    """
+    input_hash = None
+    if CACHE is not None:
+        with span("cache_lookup"):
+            input_hash = hash_file(input_file)
+            entry = CACHE.get(input_file, input_hash)
+        if entry is not None:
+            return entry.coverage, entry.result
+
+    if runner is not None:
+        coverage, result = runner.run(input_file)
+    else:
+        remove_coverage_files(cov_file)
+        result = run_and_collect_coverage(
+            binary,
+            cov_file,
+            input_file,
+            timeout=args.timeout,
+            kill_timeout=args.kill_timeout,
+        )
+        # forked processes of the target write their own files next to cov_file
+        coverage = read_process_coverage(cov_file, mode=mode)
+    if result.timed_out:
+        TIMED_OUT_INPUTS.append(input_file)
+    if coverage is None:
+        log.warning(f"{input_file} did not produce a coverage file")
+    if CACHE is not None:
+        CACHE.put(input_file, coverage, result, input_hash)
+    return coverage, result
+
+
+def run_input(
+    args: argparse.Namespace,
+    binary: pathlib.Path,
+    cov_file: pathlib.Path,
+    input_file: pathlib.Path,
+    mode: str,
+):
+    """
+    Run a single input through the instrumented binary and merge its coverage.
+    """
+    coverage, result = execute_input(args, binary, cov_file, input_file, mode)
+    if coverage is not None:
+        merge_coverage(coverage, mode=mode, original_input=input_file)
+    return result
+
+
+def watch(
+    args: argparse.Namespace,
+    binary: pathlib.Path,
+    cov_file_prefix: str,
+    mode: str,
+):
+    """
+    Replay the inputs already present and then every new file that shows up in
+    the input directory (the AFL queue and crashes directories with -afl) until
+    interrupted. At most args.jobs inputs run at once, each worker writing its
+    own coverage file, and merging happens on this thread only. The coverage
+    is dumped to args.output_file every args.dump_interval seconds.
+    """
+    from collections import deque
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    from bccov.watch import create_watcher, list_existing_inputs
+
+    if args.afl:
+        dirs = [args.input_dir / "default/crashes", args.input_dir / "default/queue"]
+    else:
+        dirs = [args.input_dir]
+    if not args.output_file:
+        log.warning("No output file given, coverage will not be dumped while watching")
+
+    # start watching before listing so no file falls in between
+    watcher = create_watcher(dirs)
+    backlog = deque(list_existing_inputs(dirs))
+    seen = set(backlog)
+    jobs = max(1, args.jobs)
+    free_cov_files = [pathlib.Path(f"{cov_file_prefix}-w{i}.bc_cov") for i in range(jobs)]
+    pending = {}
+    executed = 0
+    next_dump = time.monotonic() + args.dump_interval
+    log.info(f"Watching {', '.join(str(d) for d in dirs)} with {jobs} jobs")
+
+    def dump():
+        if args.output_file:
+            dump_coverage_info(mode=mode, output_file=args.output_file, dump_format=args.dump_format)
+            log.info(f"Dumped coverage of {executed} inputs to {args.output_file}")
+
+    def collect(done):
+        nonlocal executed
+        for future in done:
+            input_file, cov_file = pending.pop(future)
+            free_cov_files.append(cov_file)
+            coverage, _ = future.result()
+            if coverage is not None:
+                merge_coverage(coverage, mode=mode, original_input=input_file)
+            executed += 1
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        try:
+            while True:
+                timeout = 0 if backlog else (0.1 if pending else args.poll_interval)
+                for input_file in watcher.poll(timeout):
+                    if input_file not in seen:
+                        seen.add(input_file)
+                        backlog.append(input_file)
+
+                while backlog and free_cov_files:
+                    input_file = backlog.popleft()
+                    cov_file = free_cov_files.pop()
+                    future = pool.submit(
+                        execute_input, args, binary, cov_file, input_file, mode
+                    )
+                    pending[future] = (input_file, cov_file)
+
+                if pending:
+                    done, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+                if time.monotonic() >= next_dump:
+                    dump()
+                    next_dump = time.monotonic() + args.dump_interval
+        except KeyboardInterrupt:
+            log.info(f"Stopping watch, waiting for {len(pending)} running inputs")
+            done, _ = wait(pending)
+            collect(done)
+        finally:
+            watcher.close()
+
+    dump()
+
+
+def list_inputs(args: argparse.Namespace):
+    """
+    All inputs of the input directory, AFL crashes before the queue with -afl.
+    """
+    patterns = ["default/crashes/*", "default/queue/*"] if args.afl else ["*"]
+    inputs = []
+    for pattern in patterns:
+        inputs.extend(f for f in sorted(args.input_dir.glob(pattern)) if f.is_file())
+    return inputs
+
+
+def execute_many(args: argparse.Namespace, target: Target, inputs, mode: str):
+    """
+    Execute the inputs on args.jobs workers, each with its own coverage file,
+    and yield (input_file, coverage, RunResult) as they finish.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    jobs = max(1, args.jobs)
+    free_cov_files = [
+        pathlib.Path(f"{target.cov_file.with_suffix('')}-p{i}.bc_cov") for i in range(jobs)
+    ]
+    inputs = iter(inputs)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while True:
+            while free_cov_files:
+                input_file = next(inputs, None)
+                if input_file is None:
+                    break
+                cov_file = free_cov_files.pop()
+                future = pool.submit(
+                    execute_input, args, target.binary, cov_file, input_file, mode
+                )
+                pending[future] = (input_file, cov_file)
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                input_file, cov_file = pending.pop(future)
+                free_cov_files.append(cov_file)
+                coverage, result = future.result()
+                yield input_file, coverage, result
+
+
+def execute_pipelined(args: argparse.Namespace, target: Target, inputs, mode: str) -> int:
+    """
+    Execute and merge the inputs with the asyncio pipeline, merging happens on
+    a single thread in the order the inputs finish.
+    """
+    from bccov.pipeline import Pipeline
+
+    def consume(input_file, coverage, result):
+        if result.timed_out:
+            TIMED_OUT_INPUTS.append(input_file)
+        if coverage is not None:
+            merge_coverage(coverage, mode=mode, original_input=input_file)
+
+    pipeline = Pipeline(
+        target.binary,
+        target.cov_file.with_suffix(""),
+        mode,
+        jobs=args.jobs,
+        timeout=args.timeout,
+        kill_timeout=args.kill_timeout,
+        queue_size=args.queue_size,
+        cache=CACHE,
+    )
+    return pipeline.run(inputs, consume)
+
+
+def execute_persistent(args: argparse.Namespace, target: Target, inputs, mode: str) -> int:
+    """
+    Execute and merge the inputs in one long-running target process, which is
+    only restarted after a crash or timeout.
+    """
+    from bccov.persistent import PersistentRunner
+
+    with PersistentRunner(
+        target.binary,
+        target.cov_file,
+        mode,
+        timeout=args.timeout,
+        kill_timeout=args.kill_timeout,
+    ) as runner:
+        for input_file in inputs:
+            coverage, _ = execute_input(
+                args, target.binary, target.cov_file, input_file, mode, runner=runner
+            )
+            if coverage is not None:
+                merge_coverage(coverage, mode=mode, original_input=input_file)
+    return len(inputs)
+
+
+def cmin(args: argparse.Namespace, mode: str):
+    from bccov import cmin as corpus_min
+
+    global CWD
+
+    CWD = args.cwd
+
+    target = build_target(args, mode)
+    open_cache(args, target, mode)
+
+    inputs = list_inputs(args)
+    log.info(f"Collecting coverage of {len(inputs)} inputs")
+    candidates = []
+    for input_file, coverage, result in execute_many(args, target, inputs, mode):
+        candidates.append(
+            corpus_min.Candidate(
                 input_file,
+                corpus_min.coverage_blocks(coverage, mode),
+                corpus_min.input_weight(input_file, result.exec_time, args.cmin_weight),
             )
-            parse_coverage_file(pathlib.Path(f"{CWD}/target.bc_cov"), mode="tracepc")
+        )
 
+    report_timeouts(args)
+    if CACHE is not None:
+        CACHE.print_stats()
+
+    chosen = corpus_min.minimize(candidates)
+    corpus_min.write_corpus(chosen, args.cmin)
+    corpus_min.print_summary(candidates, chosen)
+    print(f"Minimized corpus written to {args.cmin}")
+
+
+def triage(args: argparse.Namespace, mode: str):
+    """
+    Bucket the crashes by coverage signature in one pass and merge only the
+    coverage of each bucket's representative, so the reports describe one
+    crash per bucket.
+    """
+    from bccov import triage as crash_triage
 
-def tracepc(args: argparse.Namespace):
-    log.info("Running Instrumentation passes")
     global CWD
-    
+
     CWD = args.cwd
-    
+
+    target = build_target(args, mode)
+    open_cache(args, target, mode)
+    parse_cov_info_file(target.cov_info, mode=mode)
+
+    pattern = "default/crashes/*" if args.afl else "*"
+    crashes = [f for f in sorted(args.input_dir.glob(pattern)) if f.is_file()]
+    log.info(f"Triaging {len(crashes)} crashes")
+    buckets = crash_triage.CrashBuckets(mode, args.triage_last)
+    for input_file, coverage, result in execute_many(args, target, crashes, mode):
+        buckets.add(input_file, coverage, result)
+
+    report_timeouts(args)
+    if CACHE is not None:
+        CACHE.print_stats()
+
+    for bucket in buckets.ordered():
+        merge_coverage(bucket.coverage, mode=mode, original_input=bucket.representative)
+
+    buckets.print_summary()
+    crash_triage.write_summary(buckets, args.triage)
+    print(f"Crash buckets written to {args.triage}")
+
+    if mode == "bbcov":
+        if args.output_file:
+            dump_coverage_info("bbcov", args.output_file, args.dump_format)
+        write_reports(args)
+
+
+def growth(args: argparse.Namespace, mode: str):
+    """
+    Coverage after every queue entry in discovery order. The entries run in
+    parallel and through the coverage cache, their results are added to the
+    curve in order as soon as all earlier entries are in.
+    """
+    from bccov import growth as coverage_growth
+
+    global CWD
+
+    CWD = args.cwd
+
+    target = build_target(args, mode)
+    open_cache(args, target, mode)
+    parse_cov_info_file(target.cov_info, mode=mode)
+
+    queue_dir = args.input_dir / "default/queue" if args.afl else args.input_dir
+    entries = coverage_growth.queue_entries(queue_dir)
+    log.info(f"Replaying {len(entries)} queue entries from {queue_dir}")
+    order = {entry.input_file: i for i, entry in enumerate(entries)}
+    curve = coverage_growth.GrowthCurve(mode)
+    finished = {}
+    for input_file, coverage, _ in execute_many(
+        args, target, [entry.input_file for entry in entries], mode
+    ):
+        finished[order[input_file]] = coverage
+        while len(curve.points) in finished:
+            i = len(curve.points)
+            curve.add(entries[i], finished.pop(i))
+
+    report_timeouts(args)
+    if CACHE is not None:
+        CACHE.print_stats()
+
+    coverage_growth.print_summary(curve.points)
+    coverage_growth.write_growth(curve.points, args.growth)
+    print(f"Coverage growth written to {args.growth}")
+
+
+def run_new_inputs(args: argparse.Namespace, target: Target, tried_files: set, mode: str):
+    """
+    Run and merge the inputs that are not in tried_files yet.
+
+    :return: the number of new inputs
+    """
+    new_inputs = [f for f in list_inputs(args) if f not in tried_files]
+    for input_file in new_inputs:
+        tried_files.add(input_file)
+        run_input(args, target.binary, target.cov_file, input_file, mode=mode)
+    log.info(f"Tried {len(new_inputs)} new inputs")
+    return len(new_inputs)
+
+
+def write_reports(args: argparse.Namespace):
+    if args.report_html or args.report_lcov:
+        from bccov.report import generate_reports
+
+        generate_reports(args.source_dir, args.report_html, args.report_lcov, args.jobs)
+
+
+def write_shard_output(args: argparse.Namespace, target: Target):
+    if args.shard_output:
+        from bccov.shard import compute_fingerprint, shard_from_stats, write_shard
+
+        write_shard(
+            shard_from_stats(compute_fingerprint(target.cov_info)),
+            args.shard_output,
+        )
+        print(f"Shard written to {args.shard_output}")
+
+
+def write_profile_outputs(args: argparse.Namespace):
+    from bccov.profile import print_profile, write_folded, write_profile
+
+    if args.profile:
+        print_profile(args.profile_top)
+        write_profile(args.profile, args.profile_top)
+        print(f"Profile written to {args.profile}")
+    if args.flamegraph:
+        write_folded(args.flamegraph)
+        print(f"Folded stacks written to {args.flamegraph}")
+
+
+def report_timeouts(args: argparse.Namespace):
+    if not TIMED_OUT_INPUTS:
+        return
+    log.warning(f"{len(TIMED_OUT_INPUTS)} inputs timed out after {args.timeout}s")
+    for input_file in TIMED_OUT_INPUTS:
+        log.debug(f"Timed out : {input_file}")
+    if args.output_file:
+        timeouts_file = pathlib.Path(f"{args.output_file}.timeouts")
+        timeouts_file.write_text("".join(f"{f}\n" for f in TIMED_OUT_INPUTS))
+        print(f"Timed out inputs written to {timeouts_file}")
+
+
+def compare_compilers(args: argparse.Namespace):
+    """
+    Build the tracepc instrumented target with every compiler of --compilers
+    and report the blocks, lines and exit codes that differ between them.
+    """
+    from bccov.compare import (
+        CompilerComparison,
+        build_variants,
+        compare_inputs,
+        write_report,
+    )
+
+    global CWD
+
+    CWD = args.cwd
+
+    log.info("Running Instrumentation passes")
     run_passes(
         pass_name="CovInstrument",
         bitcode_file=args.bitcode_file,
         output_bitcode_file=f"{CWD}/instrumented.bc",
         output_cov_info_file=f"{CWD}/cov_info.json",
         skip_file=args.skip_file,
-        flags="-tracepc",
+        flags=pass_flags(args, "tracepc"),
+        scope_function=args.scope_function,
+        scope_depth=args.scope_depth,
     )
-    log.info("Linking runtime")
     link_runtime(
         pathlib.Path(f"{CWD}/instrumented.bc"),
         pathlib.Path(f"{CWD}/final_linked.bc"),
         args.debug,
         "tracepc",
     )
-    log.info("Compiling binary")
-    build_binary(f"{CWD}/final_linked.bc", f"{CWD}/final_binary", cflags=args.cflags)
-    log.info("Parsing coverage info")
+
     parse_cov_info_file(pathlib.Path(f"{CWD}/cov_info.json"), mode="tracepc")
+
+    log.info(f"Compiling with {', '.join(args.compilers)}")
+    variants = build_variants(
+        f"{CWD}/final_linked.bc", args.compilers, CWD, args.cflags, args.jobs
+    )
+    comparison = CompilerComparison(variants)
+
+    inputs = list_inputs(args)
+    log.info(f"Running {len(inputs)} inputs through {len(variants)} binaries")
+    compare_inputs(comparison, inputs, CWD, args.timeout, args.kill_timeout, args.jobs)
+
+    comparison.print_report()
+    if args.output_file:
+        write_report(comparison, args.output_file)
+        print(f"Comparison written to {args.output_file}")
+
+
+def tracepc(args: argparse.Namespace):
+    global CWD
+    
+    CWD = args.cwd
+    
+    target = build_target(args, "tracepc")
+    open_cache(args, target, "tracepc")
+    log.info("Parsing coverage info")
+    parse_cov_info_file(target.cov_info, mode="tracepc")
     log.info("Creating code database")
     create_code_database(args.source_dir)
 
@@ -259,34 +1060,37 @@ def tracepc(args: argparse.Namespace):
         for input_file in args.input_dir.glob("default/crashes/*"):
             if not input_file.is_file():
                 continue
-            run_and_collect_coverage(
-                pathlib.Path(f"{CWD}/final_binary"),
-                pathlib.Path(f"{CWD}/target.bc_cov"),
+            run_input(
+                args,
+                target.binary,
+                target.cov_file,
                 input_file,
+                mode="tracepc",
             )
-            parse_coverage_file(pathlib.Path(f"{CWD}/target.bc_cov"), mode="tracepc")
 
         log.info("Trying all queue inputs in AFL input directory")
         for input_file in args.input_dir.glob("default/queue/*"):
             if not input_file.is_file():
                 continue
-            run_and_collect_coverage(
-                pathlib.Path(f"{CWD}/final_binary"),
-                pathlib.Path(f"{CWD}/target.bc_cov"),
+            run_input(
+                args,
+                target.binary,
+                target.cov_file,
                 input_file,
+                mode="tracepc",
             )
-            parse_coverage_file(pathlib.Path(f"{CWD}/target.bc_cov"), mode="tracepc")
     else:
         log.info("Trying all inputs in input directory")
         for input_file in args.input_dir.glob("*"):
             if not input_file.is_file():
                 continue
-            run_and_collect_coverage(
-                pathlib.Path(f"{CWD}/final_binary"),
-                pathlib.Path(f"{CWD}/target.bc_cov"),
+            run_input(
+                args,
+                target.binary,
+                target.cov_file,
                 input_file,
+                mode="tracepc",
             )
-            parse_coverage_file(pathlib.Path(f"{CWD}/target.bc_cov"), mode="tracepc")
 
         for crashing_dir in args.crashes_dir.glob("*"):
             if not crashing_dir.is_dir():
@@ -294,12 +1098,17 @@ def tracepc(args: argparse.Namespace):
             for crashing_file in crashing_dir.glob("*"):
                 if not crashing_file.is_file():
                     continue
-                run_and_collect_coverage(
-                    pathlib.Path(f"{CWD}/final_binary"),
-                    pathlib.Path(f"{CWD}/target.bc_cov"),
+                run_input(
+                    args,
+                    target.binary,
+                    target.cov_file,
                     crashing_file,
+                    mode="tracepc",
                 )
-                parse_coverage_file(pathlib.Path(f"{CWD}/target.bc_cov"), mode="tracepc")
+
+    report_timeouts(args)
+    if CACHE is not None:
+        CACHE.print_stats()
 
     if args.print_stats:
         print_coverage_stats(mode="tracepc")
@@ -324,54 +1133,100 @@ def tracepc(args: argparse.Namespace):
         )
 
 
+def edgecov(args: argparse.Namespace):
+    global CWD
+
+    CWD = args.cwd
+
+    target = build_target(args, "edgecov")
+    open_cache(args, target, "edgecov")
+    log.info("Parsing coverage info")
+    parse_cov_info_file(target.cov_info, mode="edgecov")
+    log.info("Creating code database")
+    create_code_database(args.source_dir)
+
+    inputs = list_inputs(args)
+    for input_file in inputs:
+        run_input(args, target.binary, target.cov_file, input_file, mode="edgecov")
+    log.info(f"Tried {len(inputs)} files from input directory : {str(args.input_dir)}")
+
+    report_timeouts(args)
+    if CACHE is not None:
+        CACHE.print_stats()
+
+    if args.line != 0:
+        print_files_covered_by_line("edgecov", args.function, args.line)
+
+    if args.print_stats:
+        print_coverage_stats(mode="edgecov")
+
+    if args.interactive:
+        while True:
+            print("-" * 80)
+            function_name = input("Enter function name (Type 'exit' to exit): ").strip()
+            if function_name == "exit":
+                break
+            file_name = print_coverage_summary("edgecov", function_name)
+            sources = get_function_source(function_name, file_name)
+            highlight_lines(
+                function_name, sources, mode="edgecov", output_file=args.output_file
+            )
+            print("-" * 80)
+    else:
+        file_name = print_coverage_summary("edgecov", args.function)
+        sources = get_function_source(args.function, file_name)
+        highlight_lines(
+            args.function, sources, mode="edgecov", output_file=args.output_file
+        )
+
+
 def bbcov(args: argparse.Namespace):
     global CWD
     
     CWD = args.cwd
     
-    id = str(uuid.uuid4())[0:8]
-    log.info("Running Instrumentation passes")
-    run_passes(
-        pass_name="CovInstrument",
-        bitcode_file=args.bitcode_file,
-        output_bitcode_file=f"{CWD}/instrumented-{id}.bc",
-        output_cov_info_file=f"{CWD}/cov_info-{id}.json",
-        skip_file=args.skip_file,
-        flags="-bbcount",
-    )
+    BBCovCoverageStats.set_aggregate_mode(args.aggregate)
+    target = build_target(args, "bbcov")
+    open_cache(args, target, "bbcov")
+    log.info("Parsing coverage info")
+    parse_cov_info_file(target.cov_info, mode="bbcov")
 
-    log.info("Linking runtime")
-    link_runtime(
-        pathlib.Path(f"{CWD}/instrumented-{id}.bc"),
-        pathlib.Path(f"{CWD}/final_linked-{id}.bc"),
-        args.debug,
-        "bbcov",
-    )
+    if args.watch:
+        watch(args, target.binary, target.cov_file.with_suffix(""), "bbcov")
+        report_timeouts(args)
+        write_shard_output(args, target)
+        write_profile_outputs(args)
+        return
 
-    log.info("Compiling binary")
-    build_binary(f"{CWD}/final_linked-{id}.bc", f"{CWD}/final_binary-{id}", cflags=args.cflags)
-    log.info("Parsing coverage info")
-    parse_cov_info_file(pathlib.Path(f"{CWD}/cov_info-{id}.json"), mode="bbcov")
     log.info("Creating code database")
     create_code_database(args.source_dir)
 
-    tried_files = []
+    tried_files = set()
 
-    if args.afl:
+    if args.persistent:
+        inputs = list_inputs(args)
+        tried_files.update(inputs)
+        log.info(f"Running {len(inputs)} inputs in persistent mode")
+        execute_persistent(args, target, inputs, "bbcov")
+        log.info(f"Tried {len(tried_files)} files from input directory : {str(args.input_dir)}")
+    elif args.pipeline:
+        inputs = list_inputs(args)
+        tried_files.update(inputs)
+        log.info(f"Running {len(inputs)} inputs through the pipeline with {args.jobs} jobs")
+        execute_pipelined(args, target, inputs, "bbcov")
+        log.info(f"Tried {len(tried_files)} files from input directory : {str(args.input_dir)}")
+    elif args.afl:
         log.info("Trying all crashes in AFL input directory")
         for input_file in args.input_dir.glob("default/crashes/*"):
             if not input_file.is_file():
                 continue
-            tried_files.append(input_file)
-            run_and_collect_coverage(
-                pathlib.Path(f"{CWD}/final_binary-{id}"),
-                pathlib.Path(f"{CWD}/target-{id}.bc_cov"),
+            tried_files.add(input_file)
+            run_input(
+                args,
+                target.binary,
+                target.cov_file,
                 input_file,
-            )
-            parse_coverage_file(
-                pathlib.Path(f"{CWD}/target-{id}.bc_cov"),
                 mode="bbcov",
-                original_input=input_file,
             )
 
         curr_tried = len(tried_files)
@@ -381,16 +1236,13 @@ def bbcov(args: argparse.Namespace):
         for input_file in args.input_dir.glob("default/queue/*"):
             if not input_file.is_file():
                 continue
-            tried_files.append(input_file)
-            run_and_collect_coverage(
-                pathlib.Path(f"{CWD}/final_binary-{id}"),
-                pathlib.Path(f"{CWD}/target-{id}.bc_cov"),
+            tried_files.add(input_file)
+            run_input(
+                args,
+                target.binary,
+                target.cov_file,
                 input_file,
-            )
-            parse_coverage_file(
-                pathlib.Path(f"{CWD}/target-{id}.bc_cov"),
                 mode="bbcov",
-                original_input=input_file,
             )
         curr_tried = len(tried_files) - curr_tried
         log.info(f"Tried {curr_tried} files from AFL Queeue : {str(args.input_dir)}")
@@ -399,16 +1251,13 @@ def bbcov(args: argparse.Namespace):
         for input_file in args.input_dir.glob("*"):
             if not input_file.is_file():
                 continue
-            tried_files.append(input_file)
-            run_and_collect_coverage(
-                pathlib.Path(f"{CWD}/final_binary-{id}"),
-                pathlib.Path(f"{CWD}/target-{id}.bc_cov"),
+            tried_files.add(input_file)
+            run_input(
+                args,
+                target.binary,
+                target.cov_file,
                 input_file,
-            )
-            parse_coverage_file(
-                pathlib.Path(f"{CWD}/target-{id}.bc_cov"),
                 mode="bbcov",
-                original_input=input_file,
             )
 
         log.info(f"Tried {len(tried_files)} files from input directory : {str(args.input_dir)}")
@@ -420,16 +1269,29 @@ def bbcov(args: argparse.Namespace):
         #         if not crashing_file.is_file():
         #             continue
         #         run_and_collect_coverage(
-        #             pathlib.Path(f"{CWD}/final_binary-{id}"),
-        #             pathlib.Path(f"{CWD}/target-{id}.bc_cov"),
+        #             target.binary,
+        #             target.cov_file,
         #             crashing_file,
         #         )
         #         parse_coverage_file(
-        #             pathlib.Path(f"{CWD}/target-{id}.bc_cov"),
+        #             target.cov_file,
         #             mode="bbcov",
         #             original_input=crashing_file,
         #         )
 
+    report_timeouts(args)
+    if CACHE is not None:
+        CACHE.print_stats()
+
+    if args.daemon:
+        from bccov.daemon import CoverageDaemon, serve
+
+        serve(
+            args.daemon,
+            CoverageDaemon(lambda: run_new_inputs(args, target, tried_files, "bbcov")),
+        )
+        return
+
     if args.line != 0:
         print_files_covered_by_line("bbcov", args.function, args.line)
 
@@ -444,56 +1306,7 @@ def bbcov(args: argparse.Namespace):
             if function_name == "exit":
                 break
             if function_name == "new inputs":
-                if args.afl:
-                    for input_file in args.input_dir.glob("default/crashes/*"):
-                        if not input_file.is_file():
-                            continue
-                        if input_file in tried_files:
-                            continue
-                        tried_files.append(input_file)
-                        run_and_collect_coverage(
-                            pathlib.Path(f"{CWD}/final_binary-{id}"),
-                            pathlib.Path(f"{CWD}/target-{id}.bc_cov"),
-                            input_file,
-                        )
-                        parse_coverage_file(
-                            pathlib.Path(f"{CWD}/target-{id}.bc_cov"),
-                            mode="bbcov",
-                            original_input=input_file,
-                        )
-                    for input_file in args.input_dir.glob("default/queue/*"):
-                        if not input_file.is_file():
-                            continue
-                        if input_file in tried_files:
-                            continue
-                        tried_files.append(input_file)
-                        run_and_collect_coverage(
-                            pathlib.Path(f"{CWD}/final_binary-{id}"),
-                            pathlib.Path(f"{CWD}/target-{id}.bc_cov"),
-                            input_file,
-                        )
-                        parse_coverage_file(
-                            pathlib.Path(f"{CWD}/target-{id}.bc_cov"),
-                            mode="bbcov",
-                            original_input=input_file,
-                        )
-                else:
-                    for input_file in args.input_dir.glob("*"):
-                        if not input_file.is_file():
-                            continue
-                        if input_file in tried_files:
-                            continue
-                        tried_files.append(input_file)
-                        run_and_collect_coverage(
-                            pathlib.Path(f"{CWD}/final_binary-{id}"),
-                            pathlib.Path(f"{CWD}/target-{id}.bc_cov"),
-                            input_file,
-                        )
-                        parse_coverage_file(
-                            pathlib.Path(f"{CWD}/target-{id}.bc_cov"),
-                            mode="bbcov",
-                            original_input=input_file,
-                        )
+                run_new_inputs(args, target, tried_files, "bbcov")
                 continue
            
             try:
@@ -517,6 +1330,12 @@ def bbcov(args: argparse.Namespace):
         
     if args.output_file:
         print(f"Output written to {args.output_file}")
-        dump_coverage_info(mode="bbcov", output_file=args.output_file)
+        dump_coverage_info(
+            mode="bbcov", output_file=args.output_file, dump_format=args.dump_format
+        )
+
+    write_shard_output(args, target)
+    write_reports(args)
 
+    write_profile_outputs(args)
 
@@ -0,0 +1,187 @@
+import os
+import pathlib
+import select
+import signal
+import struct
+import subprocess
+import time
+
+from bccov.coverage import (
+    combine_coverage,
+    read_process_coverage,
+    remove_coverage_files,
+)
+from bccov.lruntime import RunResult
+from bccov.utils.commands import signal_group
+from bccov.utils.pylogger import get_logger
+from bccov.utils.trace import EXEC_SPAN, span
+
+log = get_logger(__name__)
+
+STATUS = struct.Struct("<I")
+
+
+class PersistentRunner:
+    """
+    Drives a harness that loops on __bc_cov_loop() (see
+    runtime/bc_persistent.h) so many inputs run in one process. The runtime
+    writes the coverage of every iteration to cov_file and zeroes its counters
+    before the next one. A target that crashes, exits or times out is
+    restarted for the next input.
+
+    The code that runs before the loop is reported once at startup and added
+    to the coverage of every input, so each input's coverage matches a fresh
+    run of the target.
+    """
+
+    def __init__(
+        self,
+        binary: pathlib.Path,
+        cov_file: pathlib.Path,
+        mode: str,
+        timeout: float = None,
+        kill_timeout: float = 1.0,
+    ):
+        self.binary = binary
+        self.cov_file = pathlib.Path(cov_file)
+        self.mode = mode
+        self.timeout = timeout
+        self.kill_timeout = kill_timeout
+        self.proc = None
+        self.ctl_fd = None
+        self.st_fd = None
+        self.startup_coverage = None
+        self.iterations = 0
+        self.restarts = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def start(self):
+        ctl_r, ctl_w = os.pipe()
+        st_r, st_w = os.pipe()
+        env = dict(
+            os.environ,
+            BC_COV_FILE=str(self.cov_file),
+            BC_COV_CTL_FD=str(ctl_r),
+            BC_COV_ST_FD=str(st_w),
+        )
+        remove_coverage_files(self.cov_file)
+        try:
+            self.proc = subprocess.Popen(
+                [str(self.binary)],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                env=env,
+                pass_fds=(ctl_r, st_w),
+                start_new_session=True,
+            )
+        finally:
+            os.close(ctl_r)
+            os.close(st_w)
+        self.ctl_fd = ctl_w
+        self.st_fd = st_r
+
+        # the first status comes when the harness reaches the loop
+        if not self._wait_status(self.timeout):
+            returncode, _ = self._stop(signal.SIGTERM)
+            raise Exception(
+                f"{self.binary} did not reach __bc_cov_loop (exit code {returncode}), "
+                "persistent mode needs a harness that loops on it"
+            )
+        self.startup_coverage = read_process_coverage(self.cov_file, mode=self.mode)
+
+    def _wait_status(self, timeout: float):
+        """
+        :return: True if the runtime reported a finished iteration, False if
+            the target exited and None if it timed out
+        """
+        ready, _, _ = select.select([self.st_fd], [], [], timeout)
+        if not ready:
+            return None
+        data = b""
+        while len(data) < STATUS.size:
+            chunk = os.read(self.st_fd, STATUS.size - len(data))
+            if not chunk:
+                return False
+            data += chunk
+        return True
+
+    def _stop(self, sig=None):
+        """
+        Stop the target, with sig first if given and SIGKILL if it is still
+        alive kill_timeout seconds later.
+
+        :return: (returncode, killed)
+        """
+        killed = False
+        os.close(self.ctl_fd)
+        os.close(self.st_fd)
+        self.ctl_fd = self.st_fd = None
+        try:
+            if sig is not None:
+                signal_group(self.proc, sig)
+            returncode = self.proc.wait(timeout=self.kill_timeout)
+        except subprocess.TimeoutExpired:
+            signal_group(self.proc, signal.SIGKILL)
+            returncode = self.proc.wait()
+            killed = True
+        self.proc = None
+        return returncode, killed
+
+    def run(self, input_file: pathlib.Path):
+        """
+        :return: (coverage, RunResult), coverage is None if the target did not
+            write any coverage for the input
+        """
+        if self.proc is None:
+            if self.iterations:
+                self.restarts += 1
+            self.start()
+
+        # the tracepc runtime keeps its trace file open and truncates it
+        # itself, the others recreate theirs on every dump
+        if self.mode != "tracepc":
+            remove_coverage_files(self.cov_file)
+        path = os.fsencode(os.path.abspath(input_file))
+        start = time.monotonic()
+        with span(EXEC_SPAN, input=input_file):
+            try:
+                os.write(self.ctl_fd, STATUS.pack(len(path)) + path)
+                finished = self._wait_status(self.timeout)
+            except BrokenPipeError:
+                finished = False
+            returncode, timed_out = 0, finished is None
+            if not finished:
+                # crashed or exited, the runtime dumped on the way out, or
+                # hung and gets SIGTERM so it dumps what it has
+                returncode, _ = self._stop(signal.SIGTERM if timed_out else None)
+        exec_time = time.monotonic() - start
+        self.iterations += 1
+        if timed_out:
+            log.warning(f"{input_file} timed out after {exec_time:.2f}s")
+
+        coverage = read_process_coverage(self.cov_file, mode=self.mode)
+        if coverage is not None and self.startup_coverage is not None:
+            coverage = combine_coverage(
+                [self.startup_coverage, coverage], mode=self.mode
+            )
+        return coverage, RunResult(returncode, timed_out, exec_time)
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                # a zero length ends the harness loop
+                os.write(self.ctl_fd, STATUS.pack(0))
+            except BrokenPipeError:
+                pass
+            self._stop()
+        remove_coverage_files(self.cov_file)
+        log.info(
+            f"Persistent mode ran {self.iterations} inputs with {self.restarts} restarts"
+        )
@@ -0,0 +1,207 @@
+"""
+Pipelined execution of inputs with asyncio.
+
+    launch (event loop) -> decode (thread pool) -> merge (single thread)
+
+Target processes are started with asyncio.create_subprocess_exec and awaited
+on the event loop, so starting and reaping them never waits on Python-side
+work. Finished coverage files are decoded on a small thread pool and handed
+to one consumer thread that does all the merging. Each stage is bounded: at
+most `jobs` processes own a coverage file and at most `queue_size` decoded
+results wait for the consumer, so memory stays flat however many inputs
+there are and a slow consumer throttles the launcher.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import pathlib
+import signal
+import time
+
+from bccov.cache import hash_file
+from bccov.coverage import read_process_coverage, remove_coverage_files
+from bccov.defaults import DEFAULT_QUEUE_SIZE
+from bccov.lruntime import RunResult
+from bccov.utils.commands import signal_group
+from bccov.utils.pylogger import get_logger
+from bccov.utils.trace import EXEC_SPAN, span
+
+log = get_logger(__name__)
+
+
+async def run_async(
+    binary: pathlib.Path,
+    cov_file: pathlib.Path,
+    input_file: pathlib.Path,
+    timeout: float = None,
+    kill_timeout: float = 1.0,
+) -> RunResult:
+    """
+    asyncio counterpart of run_and_collect_coverage, with the same
+    SIGTERM-then-SIGKILL timeout handling on the target's process group.
+    """
+    env = dict(os.environ, BC_COV_FILE=str(cov_file))
+    start = time.monotonic()
+    with span(EXEC_SPAN, input=input_file):
+        with open(input_file, "rb") as stdin:
+            proc = await asyncio.create_subprocess_exec(
+                str(binary),
+                stdin=stdin,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+                env=env,
+                start_new_session=True,
+            )
+        timed_out = False
+        try:
+            await asyncio.wait_for(proc.wait(), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            signal_group(proc, signal.SIGTERM)
+            try:
+                await asyncio.wait_for(proc.wait(), kill_timeout)
+            except asyncio.TimeoutError:
+                signal_group(proc, signal.SIGKILL)
+                await proc.wait()
+        except asyncio.CancelledError:
+            # the pipeline is shutting down, do not leave the target behind
+            signal_group(proc, signal.SIGKILL)
+            await proc.wait()
+            raise
+    exec_time = time.monotonic() - start
+    if timed_out:
+        log.warning(f"{input_file} timed out after {exec_time:.2f}s")
+    return RunResult(proc.returncode, timed_out, exec_time)
+
+
+class Pipeline:
+    """
+    Runs inputs through the instrumented binary and calls
+    consume(input_file, coverage, result) for each of them, always from the
+    same thread. Inputs found in cache are not executed, executed ones are
+    added to it.
+    """
+
+    def __init__(
+        self,
+        binary: pathlib.Path,
+        cov_file_prefix,
+        mode: str,
+        jobs: int = None,
+        timeout: float = None,
+        kill_timeout: float = 1.0,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        decode_workers: int = 2,
+        cache=None,
+    ):
+        self.binary = binary
+        self.mode = mode
+        self.jobs = max(1, jobs or os.cpu_count())
+        self.cov_files = [
+            pathlib.Path(f"{cov_file_prefix}-a{i}.bc_cov") for i in range(self.jobs)
+        ]
+        self.timeout = timeout
+        self.kill_timeout = kill_timeout
+        self.queue_size = queue_size
+        self.decode_workers = decode_workers
+        self.cache = cache
+
+    def run(self, inputs, consume) -> int:
+        """:return: the number of inputs consumed"""
+        return asyncio.run(self._run(inputs, consume))
+
+    def decode(self, cov_file: pathlib.Path, input_file, input_hash, result):
+        coverage = read_process_coverage(cov_file, mode=self.mode)
+        remove_coverage_files(cov_file)
+        if coverage is None:
+            log.warning(f"{input_file} did not produce a coverage file")
+        if self.cache is not None:
+            self.cache.put(input_file, coverage, result, input_hash)
+        return coverage
+
+    def lookup(self, input_file):
+        input_hash = hash_file(input_file)
+        return input_hash, self.cache.get(input_file, input_hash)
+
+    async def _run(self, inputs, consume) -> int:
+        loop = asyncio.get_running_loop()
+        free_cov_files = asyncio.Queue()
+        for cov_file in self.cov_files:
+            free_cov_files.put_nowait(cov_file)
+        results = asyncio.Queue(maxsize=self.queue_size)
+        consumed = 0
+
+        with ThreadPoolExecutor(
+            max_workers=self.decode_workers, thread_name_prefix="bccov-decode"
+        ) as decode_pool, ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="bccov-merge"
+        ) as merge_pool:
+
+            async def execute(input_file, cov_file):
+                input_hash = None
+                if self.cache is not None:
+                    input_hash, entry = await loop.run_in_executor(
+                        decode_pool, self.lookup, input_file
+                    )
+                    if entry is not None:
+                        await results.put((input_file, entry.coverage, entry.result))
+                        return
+                remove_coverage_files(cov_file)
+                result = await run_async(
+                    self.binary, cov_file, input_file, self.timeout, self.kill_timeout
+                )
+                coverage = await loop.run_in_executor(
+                    decode_pool, self.decode, cov_file, input_file, input_hash, result
+                )
+                await results.put((input_file, coverage, result))
+
+            async def worker(input_file):
+                # the coverage file is only given back once the result is
+                # queued, so a full queue stops new launches
+                cov_file = await free_cov_files.get()
+                try:
+                    await execute(input_file, cov_file)
+                finally:
+                    free_cov_files.put_nowait(cov_file)
+
+            async def produce():
+                tasks = set()
+                try:
+                    for input_file in inputs:
+                        # wait for a slot before creating the task, so the
+                        # number of tasks stays bounded for huge input lists
+                        while len(tasks) >= self.jobs:
+                            done, tasks = await asyncio.wait(
+                                tasks, return_when=asyncio.FIRST_COMPLETED
+                            )
+                            errors = [t.exception() for t in done if t.exception()]
+                            if errors:
+                                raise errors[0]
+                        tasks.add(asyncio.ensure_future(worker(input_file)))
+                    if tasks:
+                        await asyncio.gather(*tasks)
+                except BaseException:
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    raise
+                await results.put(None)
+
+            async def drain():
+                nonlocal consumed
+                while True:
+                    item = await results.get()
+                    if item is None:
+                        return
+                    await loop.run_in_executor(merge_pool, consume, *item)
+                    consumed += 1
+
+            producer = asyncio.ensure_future(produce())
+            consumer = asyncio.ensure_future(drain())
+            try:
+                await asyncio.gather(producer, consumer)
+            except BaseException:
+                producer.cancel()
+                consumer.cancel()
+                raise
+        return consumed
@@ -0,0 +1,156 @@
+"""
+Execution profile of the target from the bbcov block counters.
+
+With --aggregate sum (or hist) the counters are the total executions of every
+block across the corpus, which ranks the hot spots of the target itself. A
+line is charged the executions of every block that covers it, a function the
+executions of all its blocks, and its entry block counter is its call count.
+"""
+from collections import namedtuple
+import heapq
+import json
+import os
+
+from bccov.coverage import DUMP_SKIP_FILES, BBCovCoverageStats
+
+BlockHotspot = namedtuple(
+    "BlockHotspot", ["executions", "file_name", "function", "id", "lines"]
+)
+LineHotspot = namedtuple("LineHotspot", ["executions", "file_name", "line_no"])
+FunctionHotspot = namedtuple(
+    "FunctionHotspot", ["executions", "calls", "file_name", "function"]
+)
+
+
+def profiled_functions(cov_map: dict = None):
+    if cov_map is None:
+        cov_map = BBCovCoverageStats.COV_MAP
+    for f, func in cov_map.items():
+        if f.file_name in DUMP_SKIP_FILES or not func:
+            continue
+        yield f, func
+
+
+def hot_blocks(cov_map: dict = None, top: int = 20) -> list:
+    blocks = (
+        BlockHotspot(
+            bb.coverage_index,
+            f.file_name,
+            f.name,
+            bb.id,
+            sorted({line.line_no for line in bb.line_details}),
+        )
+        for f, func in profiled_functions(cov_map)
+        for bb in func
+        if bb.coverage_index > 0
+    )
+    return heapq.nlargest(top, blocks, key=lambda b: b.executions)
+
+
+def hot_lines(cov_map: dict = None, top: int = 20) -> list:
+    executions = {}
+    for _, func in profiled_functions(cov_map):
+        for bb in func:
+            if bb.coverage_index == 0:
+                continue
+            for key in {(line.file_name, line.line_no) for line in bb.line_details}:
+                executions[key] = executions.get(key, 0) + bb.coverage_index
+    return heapq.nlargest(
+        top,
+        (
+            LineHotspot(n, file_name, line_no)
+            for (file_name, line_no), n in executions.items()
+        ),
+        key=lambda l: l.executions,
+    )
+
+
+def hot_functions(cov_map: dict = None, top: int = 20) -> list:
+    functions = (
+        FunctionHotspot(
+            sum(bb.coverage_index for bb in func),
+            func[0].coverage_index,
+            f.file_name,
+            f.name,
+        )
+        for f, func in profiled_functions(cov_map)
+    )
+    return heapq.nlargest(
+        top, (fn for fn in functions if fn.executions > 0), key=lambda fn: fn.executions
+    )
+
+
+def histogram_buckets(hist: dict) -> dict:
+    """
+    Label the log2 buckets of a block histogram with the range they count.
+    """
+    buckets = {}
+    for bucket in sorted(hist):
+        low, high = 1 << (bucket - 1), (1 << bucket) - 1
+        buckets[str(low) if low == high else f"{low}-{high}"] = hist[bucket]
+    return buckets
+
+
+def profile_report(top: int = 20) -> dict:
+    hists = BBCovCoverageStats.HISTOGRAMS
+    index = {(f.file_name, f.name): f for f in BBCovCoverageStats.COV_MAP}
+    blocks = []
+    for b in hot_blocks(top=top):
+        block = b._asdict()
+        hist = hists.get((index[(b.file_name, b.function)], b.id))
+        if hist:
+            block["histogram"] = histogram_buckets(hist)
+        blocks.append(block)
+    return {
+        "aggregate": BBCovCoverageStats.AGGREGATE,
+        "blocks": blocks,
+        "lines": [l._asdict() for l in hot_lines(top=top)],
+        "functions": [fn._asdict() for fn in hot_functions(top=top)],
+    }
+
+
+def print_profile(top: int = 20):
+    if BBCovCoverageStats.AGGREGATE == "max":
+        print("Counters are the per-input maximum, use --aggregate sum for totals")
+    print("Hottest functions:")
+    for fn in hot_functions(top=top):
+        print(
+            f"\t{fn.executions:>14} {fn.calls:>10} calls  {fn.file_name} | {fn.function}"
+        )
+    print("Hottest lines:")
+    for l in hot_lines(top=top):
+        print(f"\t{l.executions:>14}  {l.file_name}:{l.line_no}")
+    print("Hottest blocks:")
+    for b in hot_blocks(top=top):
+        print(
+            f"\t{b.executions:>14}  {b.file_name} | {b.function} bb {b.id} lines {b.lines}"
+        )
+
+
+def write_profile(output_file, top: int = 20):
+    with open(output_file, "w") as f:
+        json.dump(profile_report(top), f, indent=4)
+
+
+def write_folded(output_file, cov_map: dict = None):
+    """
+    Write the block executions as folded stacks (file;function;line count),
+    the input format of flamegraph.pl, inferno and speedscope. A block is
+    charged to its first line in the function's own file.
+    """
+    folded = {}
+    for f, func in profiled_functions(cov_map):
+        for bb in func:
+            if bb.coverage_index == 0:
+                continue
+            own = [l.line_no for l in bb.line_details if l.file_name == f.file_name]
+            line = (
+                min(own)
+                if own
+                else min((l.line_no for l in bb.line_details), default=0)
+            )
+            stack = f"{f.file_name};{f.name};{os.path.basename(f.file_name)}:{line}"
+            folded[stack] = folded.get(stack, 0) + bb.coverage_index
+    with open(output_file, "w") as out:
+        for stack in sorted(folded):
+            out.write(f"{stack.replace(' ', '_')} {folded[stack]}\n")
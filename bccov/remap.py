@@ -0,0 +1,191 @@
+import json
+import pathlib
+
+from bccov.cache import read_entry
+from bccov.lruntime import RunResult
+from bccov.utils.pylogger import get_logger
+
+log = get_logger(__name__)
+
+# copy of the build's cov_info kept next to its cache entries
+COV_INFO_NAME = "cov_info.json"
+
+REMAP_MODES = ["bbcov", "tracepc"]
+
+
+class Layout:
+    """
+    Block layout of one build: the content hash of every function and the
+    stable id of every block, as recorded by the pass in cov_info.
+    """
+
+    def __init__(self, cov_info: dict, mode: str):
+        self.mode = mode
+        # function key -> hash
+        self.hashes = {}
+        if mode == "bbcov":
+            # (file, function) -> [stable id per block index]
+            self.blocks = {}
+            # (file, function) -> {stable id: block index}
+            self.index = {}
+            for file_name, func_objs in cov_info.items():
+                for func_obj in func_objs:
+                    key = (file_name, func_obj["Function"])
+                    self.hashes[key] = func_obj.get("Hash")
+                    stable_ids = [bb.get("StableId") for bb in func_obj["BasicBlocks"]]
+                    self.blocks[key] = stable_ids
+                    self.index[key] = {sid: idx for idx, sid in enumerate(stable_ids)}
+        elif mode == "tracepc":
+            # block id -> (function, stable id)
+            self.blocks = {}
+            # (function, stable id) -> block id
+            self.index = {}
+            for bb_obj in cov_info["BasicBlock"]:
+                key = (bb_obj.get("Function"), bb_obj.get("StableId"))
+                self.hashes[key[0]] = bb_obj.get("FunctionHash")
+                self.blocks[bb_obj["Id"]] = key
+                self.index[key] = bb_obj["Id"]
+        else:
+            raise ValueError(f"Coverage of mode {mode} cannot be remapped")
+
+    @property
+    def has_stable_ids(self) -> bool:
+        """cov_info written before the pass recorded stable ids cannot be used"""
+        return all(h is not None for h in self.hashes.values())
+
+
+class Remapper:
+    """
+    Translates decoded coverage of an old build into the block ids of a new
+    build. Coverage is only carried forward when every function the input
+    executed is unchanged, otherwise the input may now behave differently
+    and has to be run again.
+    """
+
+    def __init__(self, old: Layout, new: Layout):
+        assert old.mode == new.mode
+        self.old = old
+        self.new = new
+        self.unchanged = {
+            key
+            for key, h in old.hashes.items()
+            if h is not None and new.hashes.get(key) == h
+        }
+
+    def translate(self, coverage):
+        """
+        :return: the coverage in the new build's block ids, or None if the
+            input touched a changed or removed function
+        """
+        if coverage is None:
+            return None
+        if self.old.mode == "bbcov":
+            return self.translate_bbcov(coverage)
+        return self.translate_tracepc(coverage)
+
+    def translate_bbcov(self, coverage: dict):
+        translated = {}
+        for file_name, func_map in coverage.items():
+            for func_name, counts in func_map.items():
+                if not any(counts):
+                    continue
+                key = (file_name, func_name)
+                if key not in self.unchanged:
+                    return None
+                new_counts = [0] * len(self.new.blocks[key])
+                for old_idx, count in enumerate(counts):
+                    new_counts[
+                        self.new.index[key][self.old.blocks[key][old_idx]]
+                    ] = count
+                translated.setdefault(file_name, {})[func_name] = new_counts
+        return translated
+
+    def translate_tracepc(self, coverage: list):
+        translated = []
+        for bb_id in coverage:
+            key = self.old.blocks.get(bb_id)
+            if key is None or key[0] not in self.unchanged:
+                return None
+            translated.append(self.new.index[key])
+        return translated
+
+
+def load_layout(cov_info_file: pathlib.Path, mode: str) -> Layout:
+    with open(cov_info_file, "r") as f:
+        return Layout(json.load(f), mode)
+
+
+def save_cov_info(cache, cov_info_file: pathlib.Path):
+    """Keep the build's cov_info with its cache entries for later remapping"""
+    path = cache.dir / COV_INFO_NAME
+    if not path.exists():
+        path.write_text(pathlib.Path(cov_info_file).read_text())
+
+
+def previous_build(cache):
+    """The most recently cached other build that has a saved cov_info"""
+    candidates = [
+        d / COV_INFO_NAME
+        for d in cache.dir.parent.iterdir()
+        if d != cache.dir and (d / COV_INFO_NAME).exists()
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda p: p.stat().st_mtime).parent
+
+
+def carry_forward(cache, cov_info_file: pathlib.Path) -> int:
+    """
+    Copy the cache entries of the previous build of the target into the
+    cache of this build, translated to its block ids. Inputs that only
+    executed unchanged functions then hit the cache, the rest run again.
+
+    :return: the number of entries carried forward
+    """
+    save_cov_info(cache, cov_info_file)
+    if cache.mode not in REMAP_MODES:
+        return 0
+    old_dir = previous_build(cache)
+    if old_dir is None:
+        return 0
+
+    try:
+        old = load_layout(old_dir / COV_INFO_NAME, cache.mode)
+        new = load_layout(cov_info_file, cache.mode)
+    except (KeyError, TypeError, ValueError, json.decoder.JSONDecodeError):
+        log.warning(
+            f"Cannot remap coverage from {old_dir}, the cov_info formats differ"
+        )
+        return 0
+    if not old.has_stable_ids or not new.has_stable_ids:
+        log.info(
+            f"Not remapping coverage from {old_dir}, it was built without stable block ids"
+        )
+        return 0
+
+    remapper = Remapper(old, new)
+    carried = stale = 0
+    for path in old_dir.glob("*.json"):
+        if path.name == COV_INFO_NAME or cache.entry_path(path.stem).exists():
+            continue
+        entry = read_entry(path)
+        if entry is None or entry["mode"] != cache.mode:
+            continue
+        coverage = remapper.translate(entry["coverage"])
+        if coverage is None:
+            stale += 1
+            continue
+        cache.put(
+            pathlib.Path(entry["input"]),
+            coverage,
+            RunResult(*entry["result"]),
+            input_hash=path.stem,
+        )
+        carried += 1
+
+    log.info(
+        f"Carried forward {carried} cached inputs from {old_dir.name[:12]}, "
+        f"{len(remapper.unchanged)}/{len(new.hashes)} functions unchanged, "
+        f"{stale} inputs touch changed code and will be re-run"
+    )
+    return carried
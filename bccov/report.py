@@ -0,0 +1,215 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import html
+import os
+import pathlib
+
+from bccov.coverage import DUMP_SKIP_FILES, BBCovCoverageStats
+from bccov.sources import SourceCache, SourceFile
+from bccov.utils.pylogger import get_logger
+from bccov.utils.trace import span
+
+log = get_logger(__name__)
+
+COVERED = "covered"
+UNCOVERED = "uncovered"
+PARTIAL = "partial"
+
+# hits is the highest counter of the blocks on the line
+LineStatus = namedtuple("LineStatus", ["hits", "status"])
+FunctionStatus = namedtuple("FunctionStatus", ["name", "line", "hits"])
+FileReport = namedtuple("FileReport", ["file_name", "lines", "functions"])
+
+
+def compute_file_reports(cov_map: dict = None) -> dict:
+    """
+    Line and function status of every source file in a single pass over the
+    coverage map. A line is covered when all blocks on it were hit, uncovered
+    when none were and partial otherwise (the same rule as highlight_lines).
+    """
+    if cov_map is None:
+        cov_map = BBCovCoverageStats.COV_MAP
+
+    # file -> line -> [max hits, covered blocks, total blocks]
+    line_counts = {}
+    functions = {}
+    for f, func in cov_map.items():
+        if f.file_name in DUMP_SKIP_FILES or not func:
+            continue
+        first_line = None
+        for bb in func:
+            for line in bb.line_details:
+                counts = line_counts.setdefault(line.file_name, {}).setdefault(
+                    line.line_no, [0, 0, 0]
+                )
+                counts[0] = max(counts[0], bb.coverage_index)
+                counts[1] += 1 if bb.coverage_index > 0 else 0
+                counts[2] += 1
+                if line.file_name == f.file_name and (
+                    first_line is None or line.line_no < first_line
+                ):
+                    first_line = line.line_no
+        # the entry block runs once per call
+        functions.setdefault(f.file_name, []).append(
+            FunctionStatus(f.name, first_line or 0, func[0].coverage_index)
+        )
+
+    reports = {}
+    for file_name, lines in line_counts.items():
+        statuses = {}
+        for line_no, (hits, covered, total) in lines.items():
+            if covered == total:
+                status = COVERED
+            elif covered == 0:
+                status = UNCOVERED
+            else:
+                status = PARTIAL
+            statuses[line_no] = LineStatus(hits, status)
+        reports[file_name] = FileReport(
+            file_name,
+            statuses,
+            sorted(functions.get(file_name, []), key=lambda fn: fn.line),
+        )
+    return reports
+
+
+def write_lcov(
+    reports: dict,
+    output_file: pathlib.Path,
+    sources: SourceCache = None,
+    test_name: str = "bccov",
+):
+    with open(output_file, "w") as f:
+        for file_name in sorted(reports):
+            report = reports[file_name]
+            source_path = sources.resolve(file_name) if sources else None
+            f.write(f"TN:{test_name}\nSF:{source_path or file_name}\n")
+            for fn in report.functions:
+                f.write(f"FN:{fn.line},{fn.name}\n")
+            for fn in report.functions:
+                f.write(f"FNDA:{fn.hits},{fn.name}\n")
+            f.write(f"FNF:{len(report.functions)}\n")
+            f.write(f"FNH:{sum(1 for fn in report.functions if fn.hits > 0)}\n")
+            for line_no in sorted(report.lines):
+                f.write(f"DA:{line_no},{report.lines[line_no].hits}\n")
+            f.write(f"LF:{len(report.lines)}\n")
+            f.write(f"LH:{sum(1 for s in report.lines.values() if s.hits > 0)}\n")
+            f.write("end_of_record\n")
+
+
+HTML_STYLE = """
+body { font-family: sans-serif; }
+table { border-collapse: collapse; }
+td, th { padding: 0 8px; text-align: left; }
+pre { margin: 0; }
+.covered { background: #c8f0c8; }
+.uncovered { background: #f6c6c6; }
+.partial { background: #f6f0b0; }
+.lineno, .hits { color: #777; text-align: right; }
+"""
+
+
+def html_page_name(file_name: str) -> str:
+    """
+    Flattening the path alone maps a/b_c.c and a_b/c.c to the same page, a
+    short hash of the full path keeps the names unique.
+    """
+    digest = hashlib.blake2b(file_name.encode(), digest_size=4).hexdigest()
+    return f"{file_name.strip('/').replace('/', '_')}-{digest}.html"
+
+
+def line_summary(report: FileReport):
+    hit = sum(1 for s in report.lines.values() if s.hits > 0)
+    return hit, len(report.lines)
+
+
+def render_file_html(report: FileReport, source_path, output_dir):
+    """
+    Render one annotated source file, runs in a report worker process.
+    """
+    source = SourceFile(source_path) if source_path else None
+    hit, total = line_summary(report)
+    out = [
+        f"<html><head><meta charset='utf-8'><title>{html.escape(report.file_name)}</title>",
+        f"<style>{HTML_STYLE}</style></head><body>",
+        f"<h2>{html.escape(report.file_name)}</h2>",
+        f"<p>Lines: {hit} / {total}</p><table>",
+    ]
+    if source is None:
+        out.append("<tr><td>Source not found</td></tr>")
+        lines = ((n, "") for n in sorted(report.lines))
+    else:
+        lines = source.lines()
+    for line_no, text in lines:
+        status = report.lines.get(line_no)
+        css = f" class='{status.status}'" if status else ""
+        hits = status.hits if status else ""
+        out.append(
+            f"<tr{css}><td class='lineno'>{line_no}</td><td class='hits'>{hits}</td>"
+            f"<td><pre>{html.escape(text.rstrip())}</pre></td></tr>"
+        )
+    out.append("</table></body></html>")
+    (pathlib.Path(output_dir) / html_page_name(report.file_name)).write_text(
+        "\n".join(out)
+    )
+    if source is not None:
+        source.close()
+    return report.file_name, source is not None
+
+
+def write_html(reports: dict, source_dir, output_dir: pathlib.Path, jobs: int = None):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    names = sorted(reports)
+    sources = SourceCache(source_dir)
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        for file_name, found in pool.map(
+            render_file_html,
+            [reports[n] for n in names],
+            [sources.resolve(n) for n in names],
+            [output_dir] * len(names),
+            chunksize=8,
+        ):
+            if not found:
+                log.warning(f"Could not find source of {file_name}")
+
+    rows = []
+    total_hit, total_lines = 0, 0
+    for file_name in names:
+        hit, total = line_summary(reports[file_name])
+        total_hit += hit
+        total_lines += total
+        rows.append(
+            f"<tr><td><a href='{html_page_name(file_name)}'>{html.escape(file_name)}</a></td>"
+            f"<td>{hit} / {total}</td><td>{100 * hit / max(1, total):.1f}%</td></tr>"
+        )
+    (output_dir / "index.html").write_text(
+        "\n".join(
+            [
+                "<html><head><meta charset='utf-8'><title>bccov report</title>",
+                f"<style>{HTML_STYLE}</style></head><body>",
+                f"<h2>bccov report</h2><p>Lines: {total_hit} / {total_lines}</p>",
+                "<table><tr><th>File</th><th>Lines</th><th>Coverage</th></tr>",
+            ]
+            + rows
+            + ["</table></body></html>"]
+        )
+    )
+
+
+def generate_reports(
+    source_dir,
+    html_dir: pathlib.Path = None,
+    lcov_file: pathlib.Path = None,
+    jobs: int = None,
+):
+    with span("compute_file_reports"):
+        reports = compute_file_reports()
+    if lcov_file:
+        with span("write_lcov"):
+            write_lcov(reports, lcov_file, SourceCache(source_dir))
+        print(f"lcov report written to {lcov_file}")
+    if html_dir:
+        with span("write_html"):
+            write_html(reports, source_dir, html_dir, jobs)
+        print(f"HTML report written to {html_dir}")
@@ -0,0 +1,328 @@
+"""
+In-process API that keeps a target warm between calls.
+
+    session = Session(bitcode_file, source_dir, mode="bbcov")
+    session.build()
+    session.add_inputs(input_dir.glob("*"))
+    session.summary("parse_header")
+    session.add_inputs([new_input])
+    session.lines("parse_header")
+    session.close()
+
+A Session owns its instrumented binary, its coverage store and its code
+database, so several targets can be analyzed in one process. The stats
+classes of bccov.coverage keep their state on the class, a session keeps its
+own copy of that state and installs it only while it merges or answers a
+query. Sessions are safe to use from different threads: inputs run in
+parallel and only merging and queries are serialized.
+"""
+from collections import namedtuple
+from contextlib import contextmanager
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+
+from bccov.cache import CoverageCache
+from bccov.compile import build_binary
+from bccov.config import TESTS_DIR
+from bccov.coverage import (
+    BBCovCoverageStats,
+    EdgeCoverageStats,
+    TracePCCoverageStats,
+    empty_stats_state,
+    load_stats_state,
+    merge_coverage,
+    parse_cov_info_file,
+    save_stats_state,
+)
+from bccov.defaults import DEFAULT_QUEUE_SIZE
+from bccov.indexer import CodebaseAnalyzer
+from bccov.llvm import run_passes
+from bccov.lruntime import link_runtime
+from bccov.pipeline import Pipeline
+from bccov.remap import carry_forward
+from bccov.target import PASS_FLAGS, Target
+from bccov.utils.pylogger import get_logger
+
+log = get_logger(__name__)
+
+# held while a session's state is installed in the stats classes
+STATS_LOCK = threading.RLock()
+
+InputResult = namedtuple(
+    "InputResult", ["input_file", "returncode", "timed_out", "exec_time"]
+)
+
+STATS = {
+    "tracepc": TracePCCoverageStats,
+    "bbcov": BBCovCoverageStats,
+    "edgecov": EdgeCoverageStats,
+}
+
+
+class Session:
+    def __init__(
+        self,
+        bitcode_file: pathlib.Path,
+        source_dir: pathlib.Path = None,
+        mode: str = "bbcov",
+        work_dir: pathlib.Path = None,
+        skip_file: pathlib.Path = None,
+        cflags: str = "",
+        debug: bool = False,
+        timeout: float = 5.0,
+        kill_timeout: float = 1.0,
+        jobs: int = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        cache_dir: pathlib.Path = None,
+        aggregate: str = "max",
+        tracepc_guard: bool = False,
+        scope_function: str = None,
+        scope_depth: int = None,
+    ):
+        """
+        :param work_dir: where the build artifacts go, a temporary directory
+            that close() removes if not given
+        :param cache_dir: a coverage cache to look inputs up in and to carry
+            coverage forward from earlier builds, no cache if not given
+        """
+        assert mode in STATS, f"Unknown mode {mode}"
+        self.bitcode_file = pathlib.Path(bitcode_file)
+        self.source_dir = pathlib.Path(source_dir) if source_dir else None
+        self.mode = mode
+        self.owns_work_dir = work_dir is None
+        self.work_dir = pathlib.Path(
+            work_dir or tempfile.mkdtemp(prefix="bccov-session-")
+        )
+        self.skip_file = pathlib.Path(skip_file or TESTS_DIR / "griller.skip")
+        self.cflags = cflags
+        self.debug = debug
+        self.timeout = timeout
+        self.kill_timeout = kill_timeout
+        self.jobs = jobs or os.cpu_count()
+        self.queue_size = queue_size
+        self.cache_dir = pathlib.Path(cache_dir) if cache_dir else None
+        self.tracepc_guard = tracepc_guard
+        self.scope_function = scope_function
+        self.scope_depth = scope_depth
+
+        self.state = empty_stats_state()
+        self.state[(BBCovCoverageStats, "AGGREGATE")] = aggregate
+        self.target = None
+        self.cache = None
+        self.analyzer = None
+        self.results = {}
+        # serializes build() and add_inputs() of this session, queries only
+        # need STATS_LOCK
+        self.lock = threading.Lock()
+        self.index_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    @contextmanager
+    def activate(self):
+        """
+        Install this session's coverage state in the stats classes for the
+        duration of the block. The state is read back afterwards, the stats
+        classes rebind some of it (init_cov_info, Counter).
+        """
+        with STATS_LOCK:
+            previous = save_stats_state()
+            load_stats_state(self.state)
+            try:
+                yield STATS[self.mode]
+            finally:
+                self.state = save_stats_state()
+                load_stats_state(previous)
+
+    def build(self) -> Target:
+        """
+        Instrument, link and compile the target, once per session.
+        """
+        with self.lock:
+            if self.target is not None:
+                return self.target
+            flags = PASS_FLAGS[self.mode]
+            if self.tracepc_guard:
+                flags += " -tracepc-guard"
+            log.info(f"Building {self.bitcode_file} for {self.mode} in {self.work_dir}")
+            run_passes(
+                pass_name="CovInstrument",
+                bitcode_file=self.bitcode_file,
+                output_bitcode_file=f"{self.work_dir}/instrumented.bc",
+                output_cov_info_file=f"{self.work_dir}/cov_info.json",
+                skip_file=self.skip_file,
+                flags=flags,
+                scope_function=self.scope_function,
+                scope_depth=self.scope_depth,
+            )
+            link_runtime(
+                self.work_dir / "instrumented.bc",
+                self.work_dir / "final_linked.bc",
+                self.debug,
+                self.mode,
+            )
+            build_binary(
+                f"{self.work_dir}/final_linked.bc",
+                f"{self.work_dir}/final_binary",
+                cflags=self.cflags,
+            )
+            target = Target(
+                self.work_dir / "final_binary",
+                self.work_dir / "cov_info.json",
+                self.work_dir / "target.bc_cov",
+            )
+            if self.cache_dir is not None:
+                self.cache = CoverageCache(self.cache_dir, target.binary, self.mode)
+                carry_forward(self.cache, target.cov_info)
+            with self.activate():
+                parse_cov_info_file(target.cov_info, mode=self.mode)
+            self.target = target
+            return target
+
+    def index_sources(self) -> CodebaseAnalyzer:
+        """
+        The code database is only built on the first query that needs sources.
+        """
+        with self.index_lock:
+            if self.analyzer is None:
+                assert self.source_dir is not None, "Session has no source directory"
+                self.analyzer = CodebaseAnalyzer(self.source_dir)
+            return self.analyzer
+
+    def add_inputs(self, inputs) -> list:
+        """
+        Run inputs that were not added before and merge their coverage. Targets
+        run outside of STATS_LOCK, so other sessions keep answering queries.
+
+        :return: an InputResult for every newly added input
+        """
+        self.build()
+        with self.lock:
+            inputs = [
+                pathlib.Path(i) for i in inputs if pathlib.Path(i) not in self.results
+            ]
+            added = []
+
+            def consume(input_file, coverage, result):
+                if coverage is not None:
+                    with self.activate():
+                        merge_coverage(
+                            coverage, mode=self.mode, original_input=input_file
+                        )
+                self.results[input_file] = result
+                added.append(InputResult(input_file, *result))
+
+            pipeline = Pipeline(
+                self.target.binary,
+                self.target.cov_file.with_suffix(""),
+                self.mode,
+                jobs=self.jobs,
+                timeout=self.timeout,
+                kill_timeout=self.kill_timeout,
+                queue_size=self.queue_size,
+                cache=self.cache,
+            )
+            pipeline.run(inputs, consume)
+            return added
+
+    def inputs(self) -> list:
+        return [InputResult(i, *result) for i, result in self.results.items()]
+
+    def summary(self, function: str = None) -> list:
+        """
+        :return: [{"file", "function", "covered", "total"}] for the function,
+            or for every function if none is given
+        """
+        if self.mode == "tracepc":
+            raise NotImplementedError("tracepc coverage has no function summary")
+        summary = []
+        with self.activate():
+            if self.mode == "bbcov":
+                functions = [
+                    (f.file_name, f.name, func)
+                    for f, func in BBCovCoverageStats.COV_MAP.items()
+                    if function is None or f.name == function
+                ]
+            else:
+                names = (
+                    [function]
+                    if function is not None
+                    else sorted(set(EdgeCoverageStats.FUNCTIONS.values()))
+                )
+                functions = [
+                    (
+                        EdgeCoverageStats.get_file_name(name),
+                        name,
+                        EdgeCoverageStats.function_blocks(name),
+                    )
+                    for name in names
+                ]
+            for file_name, name, blocks in functions:
+                if not blocks:
+                    continue
+                summary.append(
+                    {
+                        "file": file_name,
+                        "function": name,
+                        "covered": sum(1 for bb in blocks if bb.coverage_index > 0),
+                        "total": len(blocks),
+                    }
+                )
+        return summary
+
+    def lines(self, function: str) -> dict:
+        """
+        :return: {"covered", "uncovered", "partial"} sorted line numbers, partial
+            lines are in both covered and uncovered blocks
+        """
+        with self.activate() as stats:
+            covered, uncovered, partial = stats.get_lines_covered(function)
+        return {
+            "covered": sorted(covered),
+            "uncovered": sorted(uncovered),
+            "partial": sorted(partial),
+        }
+
+    def inputs_covering_line(self, function: str, line: int) -> list:
+        if self.mode == "tracepc":
+            raise NotImplementedError(
+                "tracepc coverage does not record inputs per block"
+            )
+        with self.activate() as stats:
+            files = stats.get_files_covering_line(function, line)
+        return sorted(str(f) for f in files)
+
+    def source(self, function: str, file_name: str = None) -> list:
+        """
+        :return: [{"line", "source", "status"}] for the function, status is
+            "covered", "uncovered", "partial" or None for lines without blocks
+        """
+        sources = self.index_sources().get_function_source(
+            function, file_name, output_mode=False
+        )
+        if sources is None:
+            raise Exception(f"Could not find function with the name {function}")
+        lines = self.lines(function)
+        status = {}
+        for key in ["uncovered", "covered", "partial"]:
+            status.update((line, key) for line in lines[key])
+        return [
+            {"line": line.line, "source": line.source, "status": status.get(line.line)}
+            for line in sources
+        ]
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.print_stats()
+        self.state = empty_stats_state()
+        self.analyzer = None
+        if self.owns_work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
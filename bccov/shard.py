@@ -0,0 +1,188 @@
+from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import hashlib
+import json
+import os
+import pathlib
+
+from bccov.cache import hash_file
+from bccov.coverage import BBCovCoverageStats, Function, parse_cov_info_file
+from bccov.defaults import MERGE_OPS
+from bccov.remap import load_layout
+from bccov.utils.pylogger import get_logger
+
+log = get_logger(__name__)
+
+SHARD_VERSION = 2
+
+# every shard has these keys, whatever wrote or reformatted it
+SHARD_KEYS = {"version", "mode", "fingerprint", "counters", "inputs"}
+
+
+def compute_fingerprint(cov_info: pathlib.Path) -> dict:
+    """
+    Shards can only be merged when their block layout is the same. The layout
+    is the content hash and the stable block ids of every function, so builds
+    of the same source on different machines agree. cov_info written before
+    the pass recorded those falls back to the hash of the file.
+    """
+    layout = load_layout(cov_info, "bbcov")
+    if not layout.has_stable_ids:
+        return {"layout": hash_file(cov_info)}
+    digest = hashlib.sha256()
+    for key in sorted(layout.blocks):
+        digest.update(
+            json.dumps([key, layout.hashes[key], layout.blocks[key]]).encode()
+        )
+    return {"layout": digest.hexdigest()}
+
+
+def shard_from_stats(fingerprint: dict) -> dict:
+    """
+    Snapshot BBCovCoverageStats as a shard: the counter of every block plus the
+    inputs that reached the covered ones.
+    """
+    if BBCovCoverageStats.AGGREGATE == "hist":
+        log.warning("Shards only keep the counters, the histograms are not written")
+    counters = {}
+    inputs = {}
+    for f, func in BBCovCoverageStats.COV_MAP.items():
+        counters.setdefault(f.file_name, {})[f.name] = [
+            bb.coverage_index for bb in func
+        ]
+        attribution = {
+            str(bb.id): [str(i) for i in bb.files] for bb in func if bb.files
+        }
+        if attribution:
+            inputs.setdefault(f.file_name, {})[f.name] = attribution
+    return {
+        "version": SHARD_VERSION,
+        "mode": "bbcov",
+        "fingerprint": fingerprint,
+        "counters": counters,
+        "inputs": inputs,
+    }
+
+
+def write_shard(shard: dict, output_file: pathlib.Path):
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(shard, f)
+    os.replace(tmp_file, output_file)
+
+
+def is_shard(data) -> bool:
+    """Tells a decoded shard from a decoded JSON coverage dump"""
+    return isinstance(data, dict) and SHARD_KEYS.issubset(data)
+
+
+def check_shard(shard, source) -> dict:
+    if not is_shard(shard):
+        raise Exception(f"{source} is not a coverage shard")
+    if shard["version"] != SHARD_VERSION:
+        raise Exception(f"{source} is not a version {SHARD_VERSION} coverage shard")
+    return shard
+
+
+def read_shard(shard_file: pathlib.Path) -> dict:
+    with open(shard_file, "r") as f:
+        return check_shard(json.load(f), shard_file)
+
+
+def load_shard_cov_map(shard: dict, cov_info_file: pathlib.Path):
+    """
+    Populates BBCovCoverageStats.COV_MAP from a decoded (merged) shard. Shards
+    only carry counters, the blocks and their lines come from the cov_info of
+    the build the shards were taken from.
+    """
+    if shard["fingerprint"] != compute_fingerprint(cov_info_file):
+        raise Exception(f"The shard was not taken from a build with {cov_info_file}")
+    parse_cov_info_file(cov_info_file, mode="bbcov")
+    for file_name, func_map in shard["counters"].items():
+        for func_name, cov_array in func_map.items():
+            f = Function(name=func_name, file_name=file_name)
+            func = BBCovCoverageStats.COV_MAP[f]
+            assert len(func) == len(
+                cov_array
+            ), f"Coverage array length mismatch for {f}"
+            attribution = shard["inputs"].get(file_name, {}).get(func_name, {})
+            BBCovCoverageStats.COV_MAP[f] = [
+                bb._replace(
+                    coverage_index=count,
+                    files=[pathlib.Path(i) for i in attribution.get(str(bb.id), [])],
+                )
+                for bb, count in zip(func, cov_array)
+            ]
+
+
+def merge_shards(a: dict, b: dict, op: str = "sum") -> dict:
+    """
+    Merge shard b into shard a and return a. Counters are combined with op
+    (sum or max) and the input attribution of every block is unioned.
+    """
+    if a["mode"] != b["mode"] or a["fingerprint"] != b["fingerprint"]:
+        raise Exception(
+            f"Refusing to merge shards with different fingerprints : "
+            f"{a['fingerprint']} != {b['fingerprint']}"
+        )
+    combine = MERGE_OPS[op]
+
+    for file_name, func_map in b["counters"].items():
+        a_func_map = a["counters"].setdefault(file_name, {})
+        for func_name, cov_array in func_map.items():
+            a_cov_array = a_func_map.get(func_name)
+            if a_cov_array is None:
+                a_func_map[func_name] = cov_array
+                continue
+            assert len(a_cov_array) == len(
+                cov_array
+            ), f"Coverage array length mismatch for {file_name} | {func_name}"
+            a_func_map[func_name] = [
+                combine(x, y) for x, y in zip(a_cov_array, cov_array)
+            ]
+
+    for file_name, func_map in b["inputs"].items():
+        a_func_map = a["inputs"].setdefault(file_name, {})
+        for func_name, attribution in func_map.items():
+            a_attribution = a_func_map.setdefault(func_name, {})
+            for bb_id, files in attribution.items():
+                known = a_attribution.setdefault(bb_id, [])
+                seen = set(known)
+                known.extend(f for f in files if f not in seen)
+    return a
+
+
+def _reduce_files(shard_files: List[pathlib.Path], op: str) -> dict:
+    merged = read_shard(shard_files[0])
+    for shard_file in shard_files[1:]:
+        merged = merge_shards(merged, read_shard(shard_file), op)
+    return merged
+
+
+def _reduce_pair(shards: List[dict], op: str) -> dict:
+    if len(shards) == 1:
+        return shards[0]
+    return merge_shards(shards[0], shards[1], op)
+
+
+def merge_shard_files(
+    shard_files: List[pathlib.Path], op: str = "sum", jobs: int = None
+) -> dict:
+    """
+    Merge any number of shard files with a parallel tree reduction. Every
+    worker first folds its group of files one at a time, so a worker never
+    holds more than two decoded shards, then the partial results are merged
+    pairwise.
+    """
+    assert shard_files, "No shards to merge"
+    jobs = max(1, min(jobs or os.cpu_count(), len(shard_files)))
+    groups = [shard_files[i::jobs] for i in range(jobs)]
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        level = list(pool.map(_reduce_files, groups, repeat(op)))
+        while len(level) > 1:
+            log.debug(f"Merging {len(level)} partial shards")
+            pairs = [level[i : i + 2] for i in range(0, len(level), 2)]
+            level = list(pool.map(_reduce_pair, pairs, repeat(op)))
+    return level[0]
@@ -0,0 +1,97 @@
+from array import array
+import mmap
+import os
+import pathlib
+import threading
+
+
+class SourceFile:
+    """
+    A source file mapped into memory with the offset of every line, so any
+    range of lines can be sliced out without re-reading the file.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                self.data = b""
+            else:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.offsets = array("Q", [0])
+        pos = self.data.find(b"\n")
+        while pos != -1:
+            self.offsets.append(pos + 1)
+            pos = self.data.find(b"\n", pos + 1)
+        if self.offsets[-1] != len(self.data):
+            self.offsets.append(len(self.data))
+
+    @property
+    def num_lines(self) -> int:
+        return len(self.offsets) - 1
+
+    def line(self, line_no: int) -> str:
+        """
+        1-indexed line including its newline.
+        """
+        return self.data[self.offsets[line_no - 1] : self.offsets[line_no]].decode(
+            "latin-1"
+        )
+
+    def lines(self, start_line: int = 1, end_line: int = None):
+        end_line = min(end_line or self.num_lines, self.num_lines)
+        for line_no in range(start_line, end_line + 1):
+            yield line_no, self.line(line_no)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+class SourceCache:
+    """
+    Opens every source file once and resolves the file names recorded in the
+    debug info (absolute, relative to the source directory or bare basenames)
+    to files under the source directory.
+    """
+
+    def __init__(self, source_dir=None):
+        self.source_dir = pathlib.Path(source_dir) if source_dir else None
+        self.files = {}
+        self.basenames = None
+        self.lock = threading.Lock()
+
+    def build_basename_index(self):
+        self.basenames = {}
+        if self.source_dir is None:
+            return
+        for root, _, files in os.walk(self.source_dir):
+            for file in files:
+                self.basenames.setdefault(file, os.path.join(root, file))
+
+    def resolve(self, file_name: str):
+        path = pathlib.Path(file_name)
+        if path.is_absolute():
+            return str(path) if path.is_file() else None
+        if self.source_dir is not None and (self.source_dir / path).is_file():
+            return str(self.source_dir / path)
+        if path.is_file():
+            return str(path)
+        with self.lock:
+            if self.basenames is None:
+                self.build_basename_index()
+        return self.basenames.get(path.name)
+
+    def get(self, file_name: str):
+        """
+        :return: the SourceFile for file_name, None if it cannot be found
+        """
+        with self.lock:
+            if file_name in self.files:
+                return self.files[file_name]
+        path = self.resolve(file_name)
+        source = SourceFile(path) if path else None
+        with self.lock:
+            self.files.setdefault(file_name, source)
+            return self.files[file_name]
@@ -0,0 +1,9 @@
+"""
+An instrumented target as built by the CLI and by bccov.session.
+"""
+from collections import namedtuple
+
+# CovInstrument flags of every instrumentation mode
+PASS_FLAGS = {"tracepc": "-tracepc", "bbcov": "-bbcount", "edgecov": "-edgecov"}
+
+Target = namedtuple("Target", ["binary", "cov_info", "cov_file"])
@@ -0,0 +1,154 @@
+"""
+Crash triage: group crashing inputs by a coverage signature.
+
+The signature of a crash is a hash of the set of blocks it hit and, with
+tracepc, of the last blocks it executed before it died. Crashes that take the
+same path to the same place land in one bucket, so tens of thousands of AFL
+crash entries collapse into a short list with one representative each.
+"""
+from collections import Counter
+import hashlib
+import json
+import pathlib
+
+from bccov.cmin import coverage_blocks
+from bccov.coverage import TracePCCoverageStats
+from bccov.defaults import DEFAULT_TRIAGE_LAST
+from bccov.utils.pylogger import get_logger
+
+log = get_logger(__name__)
+
+
+def crash_tail(coverage, last: int) -> tuple:
+    """
+    The last distinct blocks of a tracepc trace, each at its last execution,
+    so a loop contributes its blocks once however many times it ran. With
+    -tracepc-guard the trace is in first-hit order, so the tail holds the last
+    blocks the crash reached for the first time.
+    """
+    tail = []
+    seen = set()
+    for bb_id in reversed(coverage or []):
+        if len(tail) == last:
+            break
+        if bb_id not in seen:
+            seen.add(bb_id)
+            tail.append(bb_id)
+    return tuple(reversed(tail))
+
+
+def signature(coverage, mode: str, last: int = DEFAULT_TRIAGE_LAST):
+    """
+    :return: (digest, number of blocks hit, tail), tail is empty unless mode
+        is tracepc
+    """
+    blocks = coverage_blocks(coverage, mode)
+    tail = crash_tail(coverage, last) if mode == "tracepc" and last > 0 else ()
+    digest = hashlib.blake2b(digest_size=8)
+    for block in sorted(repr(b) for b in blocks):
+        digest.update(block.encode())
+        digest.update(b"\0")
+    digest.update(b"\1")
+    for bb_id in tail:
+        digest.update(bb_id.to_bytes(4, "little"))
+    return digest.hexdigest(), len(blocks), tail
+
+
+class Bucket:
+    def __init__(self, digest: str, num_blocks: int, tail: tuple):
+        self.digest = digest
+        self.num_blocks = num_blocks
+        self.tail = tail
+        self.inputs = []
+        self.returncodes = Counter()
+        self.timeouts = 0
+        self.representative = None
+        self.representative_size = None
+        self.coverage = None
+
+    def add(self, input_file: pathlib.Path, coverage, result):
+        self.inputs.append(input_file)
+        self.returncodes[result.returncode] += 1
+        if result.timed_out:
+            self.timeouts += 1
+        # the smallest crash is the easiest to read and minimize
+        size = input_file.stat().st_size
+        if self.representative is None or size < self.representative_size:
+            self.representative = input_file
+            self.representative_size = size
+            self.coverage = coverage
+
+
+class CrashBuckets:
+    """
+    Buckets crashes in a single pass over their decoded coverage. Only the
+    coverage of each bucket's representative is kept.
+    """
+
+    def __init__(self, mode: str, last: int = DEFAULT_TRIAGE_LAST):
+        self.mode = mode
+        self.last = last
+        self.buckets = {}
+        self.crashes = 0
+        self.missing = []
+
+    def add(self, input_file: pathlib.Path, coverage, result) -> bool:
+        """:return: True if the crash opened a new bucket"""
+        if coverage is None:
+            self.missing.append(input_file)
+            return False
+        self.crashes += 1
+        digest, num_blocks, tail = signature(coverage, self.mode, self.last)
+        bucket = self.buckets.get(digest)
+        new = bucket is None
+        if new:
+            bucket = self.buckets[digest] = Bucket(digest, num_blocks, tail)
+        bucket.add(input_file, coverage, result)
+        return new
+
+    def ordered(self) -> list:
+        return sorted(self.buckets.values(), key=lambda b: (-len(b.inputs), b.digest))
+
+    def print_summary(self):
+        print(f"Bucketed {self.crashes} crashes into {len(self.buckets)} buckets")
+        if self.missing:
+            print(f"{len(self.missing)} crashes did not produce a coverage file")
+        for bucket in self.ordered():
+            codes = ", ".join(
+                f"{code}: {n}" for code, n in bucket.returncodes.most_common()
+            )
+            print(
+                f"\t{bucket.digest} : {len(bucket.inputs)} crashes, {bucket.num_blocks} blocks, "
+                f"exit codes {{{codes}}} : {bucket.representative}"
+            )
+
+
+def describe_block(bb_id: int) -> dict:
+    bb = TracePCCoverageStats.COV_MAP.get(bb_id)
+    lines = (
+        [] if bb is None else [f"{l.file_name}:{l.line_no}" for l in bb.line_details]
+    )
+    return {"Id": bb_id, "Lines": lines}
+
+
+def write_summary(buckets: CrashBuckets, output_file: pathlib.Path):
+    summary = {
+        "Mode": buckets.mode,
+        "Crashes": buckets.crashes,
+        "Missing": [str(f) for f in buckets.missing],
+        "Buckets": [
+            {
+                "Signature": bucket.digest,
+                "Count": len(bucket.inputs),
+                "Blocks": bucket.num_blocks,
+                "Representative": str(bucket.representative),
+                "ExitCodes": {str(code): n for code, n in bucket.returncodes.items()},
+                "Timeouts": bucket.timeouts,
+                "LastBlocks": [describe_block(bb_id) for bb_id in bucket.tail],
+                "Inputs": [str(f) for f in bucket.inputs],
+            }
+            for bucket in buckets.ordered()
+        ],
+    }
+    with open(output_file, "w") as f:
+        json.dump(summary, f, indent=4)
@@ -1,2 +1,2 @@
-from bccov.utils.commands import run_cmd
+from bccov.utils.commands import run_cmd, run_with_timeout
 from bccov.utils.pylogger import set_global_log_level, get_logger
@@ -1,3 +1,5 @@
+import os
+import signal
 import subprocess
 
 from bccov.utils.pylogger import get_logger
@@ -38,3 +40,64 @@ def run_cmd(
         return "", ""
     except Exception as e:
         logger.exception(f"{error_msg} failed", extra={"cmd": command, "error": e})
+
+
+def run_with_timeout(
+    argv,
+    stdin_file=None,
+    env=None,
+    cwd=None,
+    timeout=None,
+    kill_timeout=1.0,
+    soft_signal=signal.SIGTERM,
+):
+    """
+    Run argv in its own process group. When the timeout expires the whole group
+    first gets soft_signal, which lets the bccov runtimes flush the coverage
+    gathered so far, and is SIGKILLed if it is still alive kill_timeout seconds
+    later.
+
+    :return: (stdout, stderr, returncode, timed_out)
+    """
+    logger.debug(f"Running process : {argv}\n with {cwd} and timeout {timeout}")
+    stdin = open(stdin_file, "rb") if stdin_file is not None else subprocess.DEVNULL
+    try:
+        proc = subprocess.Popen(
+            argv,
+            stdin=stdin,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            cwd=cwd,
+            start_new_session=True,
+        )
+    finally:
+        if stdin_file is not None:
+            stdin.close()
+
+    timed_out = False
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        signal_group(proc, soft_signal)
+        try:
+            stdout, stderr = proc.communicate(timeout=kill_timeout)
+        except subprocess.TimeoutExpired:
+            logger.debug(f"{argv} ignored {soft_signal!r}, killing it")
+            signal_group(proc, signal.SIGKILL)
+            stdout, stderr = proc.communicate()
+
+    return (
+        stdout.decode("latin-1"),
+        stderr.decode("latin-1"),
+        proc.returncode,
+        timed_out,
+    )
+
+
+def signal_group(proc, sig):
+    try:
+        os.killpg(proc.pid, sig)
+    except ProcessLookupError:
+        pass
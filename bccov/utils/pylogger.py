@@ -1,14 +1,43 @@
 import logging
-import os
-import uuid
-
-from colorlog import ColoredFormatter
 
 log_level = logging.INFO
 module_log_levels = {}
 saved_logs = {}
 
 
+class LazyColoredFormatter(logging.Formatter):
+    """
+    Builds the colorlog formatter when the first record is formatted, so
+    importing a module that creates a logger does not import colorlog.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.formatter = None
+
+    def format(self, record):
+        if self.formatter is None:
+            from colorlog import ColoredFormatter
+
+            self.formatter = ColoredFormatter(
+                "%(asctime)-s %(name)s [%(levelname)s] %(log_color)s%(message)s%(reset)s",
+                datefmt=None,
+                reset=True,
+                log_colors={
+                    "DEBUG": "purple",
+                    "INFO": "green",
+                    "WARNING": "yellow",
+                    "ERROR": "red",
+                    "CRITICAL": "red",
+                },
+            )
+        return self.formatter.format(record)
+
+
+# shared by every logger
+formatter = LazyColoredFormatter()
+
+
 def set_global_log_level(level):
     global log_level
     log_level = level
@@ -35,26 +64,9 @@ def get_logger(name, level=None):
     else:
         l.setLevel(level)
 
-    id = str(uuid.uuid4())[0:8]
-    logs_path = os.path.join("/tmp", f"logs-{id}")
-    if not os.path.exists(logs_path):
-        os.makedirs(logs_path)
-
     stream_h = logging.StreamHandler()
     # file_h = logging.FileHandler('logs/%s.log' % name)
 
-    formatter = ColoredFormatter(
-        "%(asctime)-s %(name)s [%(levelname)s] %(log_color)s%(message)s%(reset)s",
-        datefmt=None,
-        reset=True,
-        log_colors={
-            "DEBUG": "purple",
-            "INFO": "green",
-            "WARNING": "yellow",
-            "ERROR": "red",
-            "CRITICAL": "red",
-        },
-    )
     stream_h.setFormatter(formatter)
     l.addHandler(stream_h)
 
@@ -0,0 +1,166 @@
+"""
+Lightweight stage tracing.
+
+    with span("run_passes", mode=mode):
+        ...
+
+When tracing is disabled span() returns a shared no-op context manager, so
+instrumented code pays for one global lookup and nothing else. When enabled
+every span records (name, start, duration, thread, args), which is enough for
+a latency summary per stage and a Chrome trace (chrome://tracing, Perfetto).
+"""
+import json
+import os
+import threading
+import time
+
+from bccov.utils.pylogger import get_logger
+
+log = get_logger(__name__)
+
+ENABLED = False
+
+# (name, start ns, duration ns, thread id, args)
+EVENTS = []
+
+# stage whose spans count as target executions in the summary
+EXEC_SPAN = "execute_input"
+
+_lock = threading.Lock()
+_start_ns = 0
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        event = (
+            self.name,
+            self.start,
+            end - self.start,
+            threading.get_ident(),
+            self.args,
+        )
+        with _lock:
+            EVENTS.append(event)
+        return False
+
+
+def span(name: str, **args):
+    if not ENABLED:
+        return NULL_SPAN
+    return Span(name, args)
+
+
+def enable():
+    global ENABLED, _start_ns
+    EVENTS.clear()
+    _start_ns = time.perf_counter_ns()
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def percentile(sorted_values: list, p: float):
+    # nearest rank
+    idx = max(
+        0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1)
+    )
+    return sorted_values[idx]
+
+
+def summary() -> dict:
+    """
+    Per stage count, total and p50/p99 latency in seconds, plus the target
+    executions per second over the traced wall time.
+    """
+    with _lock:
+        events = list(EVENTS)
+    durations = {}
+    for name, _, duration, _, _ in events:
+        durations.setdefault(name, []).append(duration / 1e9)
+
+    stages = {}
+    for name, values in durations.items():
+        values.sort()
+        stages[name] = {
+            "count": len(values),
+            "total": sum(values),
+            "p50": percentile(values, 50),
+            "p99": percentile(values, 99),
+            "max": values[-1],
+        }
+
+    wall = (time.perf_counter_ns() - _start_ns) / 1e9
+    executions = stages.get(EXEC_SPAN, {}).get("count", 0)
+    return {
+        "wall_time": wall,
+        "executions": executions,
+        "executions_per_sec": executions / wall if wall > 0 else 0.0,
+        "stages": stages,
+    }
+
+
+def print_summary():
+    s = summary()
+    print(
+        f"Traced {s['wall_time']:.2f}s, {s['executions']} executions "
+        f"({s['executions_per_sec']:.1f}/s)"
+    )
+    print(f"{'stage':<24} {'count':>8} {'total s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for name, stage in sorted(s["stages"].items(), key=lambda kv: -kv[1]["total"]):
+        print(
+            f"{name:<24} {stage['count']:>8} {stage['total']:>10.3f} "
+            f"{stage['p50'] * 1000:>10.2f} {stage['p99'] * 1000:>10.2f}"
+        )
+
+
+def write_chrome_trace(output_file):
+    """
+    Write the spans as complete ("X") events of the Chrome trace format.
+    """
+    pid = os.getpid()
+    with _lock:
+        events = list(EVENTS)
+    trace_events = []
+    for name, start, duration, tid, args in events:
+        trace_events.append(
+            {
+                "name": name,
+                "cat": "bccov",
+                "ph": "X",
+                "ts": (start - _start_ns) / 1000,
+                "dur": duration / 1000,
+                "pid": pid,
+                "tid": tid,
+                "args": {k: str(v) for k, v in args.items()},
+            }
+        )
+    with open(output_file, "w") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+    log.info(f"Chrome trace written to {output_file}")
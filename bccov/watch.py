@@ -0,0 +1,147 @@
+from typing import List
+import ctypes
+import ctypes.util
+import os
+import pathlib
+import select
+import struct
+import time
+
+from bccov.utils.pylogger import get_logger
+
+log = get_logger(__name__)
+
+# files AFL keeps next to the test cases
+IGNORED_NAMES = ["README.txt"]
+
+
+def is_input_file(path: pathlib.Path) -> bool:
+    return (
+        path.is_file()
+        and not path.name.startswith(".")
+        and path.name not in IGNORED_NAMES
+    )
+
+
+class InotifyWatcher:
+    """
+    Reports files that are closed after writing or moved into any of the watched
+    directories, through the raw inotify syscalls in libc. When the kernel
+    queue overflows events are lost, so the directories are re-listed and the
+    files not reported before are returned instead.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, dirs: List[pathlib.Path]):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(InotifyWatcher.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.dirs = {}
+        for d in dirs:
+            wd = libc.inotify_add_watch(
+                self.fd,
+                os.fsencode(str(d)),
+                InotifyWatcher.IN_CLOSE_WRITE | InotifyWatcher.IN_MOVED_TO,
+            )
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed on {d}")
+            self.dirs[wd] = pathlib.Path(d)
+        # files already there or reported, an overflow is diffed against them
+        self.seen = set(list_existing_inputs(list(self.dirs.values())))
+
+    def poll(self, timeout: float) -> List[pathlib.Path]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        data = os.read(self.fd, 64 * 1024)
+        new_files = []
+        overflow = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = InotifyWatcher.EVENT_HEADER.unpack_from(
+                data, offset
+            )
+            offset += InotifyWatcher.EVENT_HEADER.size
+            name = data[offset : offset + name_len].rstrip(b"\0")
+            offset += name_len
+            if mask & InotifyWatcher.IN_Q_OVERFLOW:
+                overflow = True
+            elif mask & InotifyWatcher.IN_IGNORED:
+                log.warning(f"{self.dirs.pop(wd, wd)} is no longer watched")
+            elif wd in self.dirs and name and not mask & InotifyWatcher.IN_ISDIR:
+                path = self.dirs[wd] / os.fsdecode(name)
+                if is_input_file(path) and path not in self.seen:
+                    self.seen.add(path)
+                    new_files.append(path)
+
+        if overflow:
+            log.warning("inotify queue overflowed, re-listing the watched directories")
+            for path in list_existing_inputs(list(self.dirs.values())):
+                if path not in self.seen:
+                    self.seen.add(path)
+                    new_files.append(path)
+        return new_files
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Fallback for systems without inotify, re-lists the watched directories
+    every poll and reports the files it has not seen before.
+    """
+
+    def __init__(self, dirs: List[pathlib.Path]):
+        self.dirs = [pathlib.Path(d) for d in dirs]
+        self.seen = set()
+        for path in self.list_files():
+            self.seen.add(path)
+
+    def list_files(self):
+        for d in self.dirs:
+            if not d.is_dir():
+                continue
+            for path in d.iterdir():
+                if is_input_file(path):
+                    yield path
+
+    def poll(self, timeout: float) -> List[pathlib.Path]:
+        time.sleep(timeout)
+        new_files = []
+        for path in self.list_files():
+            if path not in self.seen:
+                self.seen.add(path)
+                new_files.append(path)
+        return new_files
+
+    def close(self):
+        pass
+
+
+def create_watcher(dirs: List[pathlib.Path], force_polling: bool = False):
+    if not force_polling:
+        try:
+            return InotifyWatcher(dirs)
+        except (OSError, AttributeError) as e:
+            log.warning(f"inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher(dirs)
+
+
+def list_existing_inputs(dirs: List[pathlib.Path]) -> List[pathlib.Path]:
+    existing = []
+    for d in dirs:
+        if d.is_dir():
+            existing.extend(sorted(p for p in d.iterdir() if is_input_file(p)))
+    return existing
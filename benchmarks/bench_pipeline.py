@@ -0,0 +1,311 @@
+"""
+Times every stage of the coverage pipeline on a synthetic target and writes
+the results as JSON, so runs can be compared before and after a change.
+
+    python benchmarks/bench_pipeline.py --files 20 --functions 50 --inputs 100 -o bench.json
+    python benchmarks/bench_pipeline.py ... --compare old_bench.json
+
+Stages that need the LLVM toolchain (run_passes, link_runtime, build_binary
+and executing the inputs) or libclang (indexing) are recorded as skipped
+when it is not available, the Python stages always run on generated
+cov_info and coverage files.
+"""
+import argparse
+import json
+import os
+import pathlib
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import synthetic
+
+from bccov import config
+from bccov.coverage import (
+    BBCovCoverageStats,
+    parse_cov_info_file,
+    read_bbcov_coverage_file,
+)
+
+
+class SkipStage(Exception):
+    pass
+
+
+class Bench:
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.stages = {}
+
+    def run(self, name: str, fn, repeat: int = None, setup=None):
+        """
+        Time fn repeat times, setup runs before every repetition and is not
+        timed. Returns the result of the last call.
+        """
+        times = []
+        result = None
+        try:
+            for _ in range(repeat or self.repeat):
+                if setup is not None:
+                    setup()
+                start = time.perf_counter()
+                result = fn()
+                times.append(time.perf_counter() - start)
+        except SkipStage as e:
+            self.stages[name] = {"skipped": str(e)}
+            print(f"{name:<32} skipped ({e})")
+            return None
+        self.stages[name] = {
+            "runs": len(times),
+            "min": min(times),
+            "median": statistics.median(times),
+            "mean": statistics.mean(times),
+            "max": max(times),
+        }
+        print(f"{name:<32} median {self.stages[name]['median'] * 1000:10.2f} ms")
+        return result
+
+    def record(self, name: str, times: list):
+        self.stages[name] = {
+            "runs": len(times),
+            "min": min(times),
+            "median": statistics.median(times),
+            "mean": statistics.mean(times),
+            "max": max(times),
+            "per_second": len(times) / sum(times) if sum(times) else None,
+        }
+        print(f"{name:<32} median {self.stages[name]['median'] * 1000:10.2f} ms")
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=pathlib.Path(__file__).parent,
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def toolchain_missing(clang: str):
+    for tool in [config.LLVM_OPT, config.LLVM_LINK, clang]:
+        if shutil.which(tool) is None:
+            return f"{tool} not found"
+    if not (config.LIB_DIR / "build" / "libCovInstrument.so").exists():
+        return "CovInstrument pass is not built"
+    if not (config.RUNTIME_DIR / "bbcov_runtime.bc").exists():
+        return "bbcov runtime is not built"
+    return None
+
+
+def bench_toolchain(
+    bench: Bench, args, work_dir: pathlib.Path, input_dir: pathlib.Path
+):
+    from bccov.compile import build_binary
+    from bccov.llvm import run_passes
+    from bccov.lruntime import link_runtime, run_and_collect_coverage
+
+    missing = toolchain_missing(args.clang)
+    source_dir = work_dir / "src"
+    bitcode = work_dir / "target.bc"
+    instrumented = work_dir / "instrumented.bc"
+    cov_info = work_dir / "cov_info_pass.json"
+    linked = work_dir / "linked.bc"
+    binary = work_dir / "binary"
+    cov_file = work_dir / "exec.bc_cov"
+
+    def needs_toolchain():
+        if missing:
+            raise SkipStage(missing)
+
+    def compile_target():
+        needs_toolchain()
+        synthetic.generate_bitcode(source_dir, bitcode, args.clang, config.LLVM_LINK)
+
+    def instrument():
+        needs_toolchain()
+        run_passes(
+            "CovInstrument",
+            bitcode,
+            instrumented,
+            cov_info,
+            work_dir / "no.skip",
+            "-bbcount",
+        )
+
+    def link():
+        needs_toolchain()
+        link_runtime(instrumented, linked, mode="bbcov")
+
+    def build():
+        needs_toolchain()
+        build_binary(linked, binary, args.clang)
+
+    bench.run("compile_target", compile_target, repeat=1)
+    bench.run("run_passes", instrument)
+    bench.run("link_runtime", link)
+    bench.run("build_binary", build)
+
+    if missing:
+        bench.stages["execute_input"] = {"skipped": missing}
+        print(f"{'execute_input':<32} skipped ({missing})")
+        return
+    times = []
+    for input_file in sorted(input_dir.iterdir()):
+        times.append(run_and_collect_coverage(binary, cov_file, input_file).exec_time)
+    bench.record("execute_input", times)
+
+
+def bench_python(bench: Bench, args, work_dir: pathlib.Path):
+    cov_info = work_dir / "cov_info.json"
+    synthetic.write_cov_info(cov_info, args.files, args.functions)
+    cov_files = []
+    for n in range(args.cov_files):
+        cov_file = work_dir / f"synthetic-{n}.bc_cov"
+        synthetic.generate_bbcov_file(cov_file, args.files, args.functions, seed=n)
+        cov_files.append(cov_file)
+
+    bench.run("init_cov_info", lambda: parse_cov_info_file(cov_info, "bbcov"))
+    decoded = bench.run(
+        "parse_bbcov_coverage_file",
+        lambda: [read_bbcov_coverage_file(f) for f in cov_files],
+    )
+
+    def add_all():
+        for f, cov_map in zip(cov_files, decoded):
+            BBCovCoverageStats.add_cov_map(cov_map, f)
+
+    bench.run(
+        "add_cov_map", add_all, setup=lambda: parse_cov_info_file(cov_info, "bbcov")
+    )
+
+
+def bench_indexing(bench: Bench, work_dir: pathlib.Path):
+    def index():
+        try:
+            from bccov.indexer import CodebaseAnalyzer
+
+            return CodebaseAnalyzer(str(work_dir / "src"))
+        except Exception as e:
+            raise SkipStage(f"libclang not available : {e}")
+
+    bench.run("codebase_indexing", index, repeat=1)
+
+
+def bench_reports(bench: Bench, args, work_dir: pathlib.Path):
+    from bccov.report import compute_file_reports, write_html, write_lcov
+    from bccov.sources import SourceCache
+
+    source_dir = work_dir / "src"
+    reports = bench.run("compute_file_reports", compute_file_reports)
+    bench.run(
+        "write_lcov",
+        lambda: write_lcov(reports, work_dir / "bench.lcov", SourceCache(source_dir)),
+    )
+    bench.run(
+        "write_html",
+        lambda: write_html(reports, source_dir, work_dir / "html", args.jobs),
+    )
+
+
+def compare(results: dict, baseline_file: pathlib.Path):
+    baseline = json.loads(baseline_file.read_text())
+    print(f"\nCompared to {baseline_file} ({baseline.get('revision')})")
+    for name, stage in results["stages"].items():
+        old = baseline["stages"].get(name)
+        if not old or "median" not in old or "median" not in stage:
+            continue
+        print(f"{name:<32} {old['median'] / stage['median']:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bc-cov pipeline")
+    parser.add_argument(
+        "--files", type=int, default=10, help="Number of generated C files"
+    )
+    parser.add_argument(
+        "--functions", type=int, default=50, help="Functions per generated file"
+    )
+    parser.add_argument(
+        "--inputs", type=int, default=50, help="Number of inputs to execute"
+    )
+    parser.add_argument(
+        "--cov-files",
+        type=int,
+        default=50,
+        help="Number of synthetic coverage files to parse",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Repetitions of every stage"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(), help="Report workers"
+    )
+    parser.add_argument("--clang", type=str, default="clang", help="C compiler")
+    parser.add_argument(
+        "--work-dir", type=pathlib.Path, help="Keep generated files here"
+    )
+    parser.add_argument(
+        "--config", type=pathlib.Path, default=pathlib.Path("config.json")
+    )
+    parser.add_argument(
+        "--compare", type=pathlib.Path, help="Earlier results to compare with"
+    )
+    parser.add_argument(
+        "-o", "--output", type=pathlib.Path, help="Write the results as JSON"
+    )
+    args = parser.parse_args()
+
+    config.set_config(args.config)
+
+    tmp_dir = None
+    if args.work_dir:
+        work_dir = args.work_dir
+        work_dir.mkdir(parents=True, exist_ok=True)
+    else:
+        tmp_dir = tempfile.TemporaryDirectory(prefix="bccov-bench-")
+        work_dir = pathlib.Path(tmp_dir.name)
+
+    synthetic.generate_sources(work_dir / "src", args.files, args.functions)
+    synthetic.generate_inputs(work_dir / "inputs", args.inputs)
+
+    bench = Bench(args.repeat)
+    bench_toolchain(bench, args, work_dir, work_dir / "inputs")
+    bench_python(bench, args, work_dir)
+    bench_indexing(bench, work_dir)
+    bench_reports(bench, args, work_dir)
+
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": {
+            "files": args.files,
+            "functions": args.functions,
+            "blocks": args.files * args.functions * len(synthetic.BLOCK_LINES),
+            "inputs": args.inputs,
+            "cov_files": args.cov_files,
+            "repeat": args.repeat,
+        },
+        "stages": bench.stages,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=4))
+        print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
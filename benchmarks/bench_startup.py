@@ -0,0 +1,133 @@
+"""
+Measures CLI startup and guards it against regressions.
+
+Every scenario runs in a fresh interpreter. The script exits non-zero if a
+median exceeds --budget-ms or if importing the CLI already loaded one of the
+heavy modules that must only be imported on first use.
+
+    python benchmarks/bench_startup.py --budget-ms 100 -o startup.json
+"""
+import argparse
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = pathlib.Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    "interpreter": "pass",
+    "import_bccov": "import bccov",
+    "import_cli": "import bccov.main",
+    "cli_help": (
+        "import sys\n"
+        "sys.argv = ['bccov', '--help']\n"
+        "from bccov import run_cli\n"
+        "try:\n"
+        "    run_cli()\n"
+        "except SystemExit:\n"
+        "    pass\n"
+    ),
+}
+
+# must not be imported until they are used
+LAZY_MODULES = [
+    "clang.cindex",
+    "colorlog",
+    "asyncio",
+    "concurrent.futures",
+    "bccov.cmin",
+    "bccov.compare",
+    "bccov.daemon",
+    "bccov.growth",
+    "bccov.persistent",
+    "bccov.pipeline",
+    "bccov.profile",
+    "bccov.report",
+    "bccov.shard",
+    "bccov.triage",
+    "bccov.watch",
+]
+
+LAZY_CHECK = (
+    "import sys, json\n"
+    "import bccov.main\n"
+    f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))\n"
+)
+
+
+def run_python(code: str) -> float:
+    env = dict(os.environ, PYTHONPATH=str(REPO_DIR))
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        cwd=REPO_DIR,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def eagerly_loaded() -> list:
+    env = dict(os.environ, PYTHONPATH=str(REPO_DIR))
+    out = subprocess.run(
+        [sys.executable, "-c", LAZY_CHECK],
+        env=env,
+        cwd=REPO_DIR,
+        check=True,
+        capture_output=True,
+    )
+    return json.loads(out.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bc-cov startup time")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per scenario")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=100.0,
+        help="Fail if the median of a bccov scenario exceeds this many milliseconds",
+    )
+    parser.add_argument(
+        "-o", "--output", type=pathlib.Path, help="Write the results as JSON"
+    )
+    args = parser.parse_args()
+
+    results = {}
+    failed = False
+    for name, code in SCENARIOS.items():
+        run_python(code)  # warm the page cache and bytecode
+        times = [run_python(code) for _ in range(args.repeat)]
+        median_ms = statistics.median(times) * 1000
+        results[name] = {"median_ms": median_ms, "min_ms": min(times) * 1000}
+        over = name != "interpreter" and median_ms > args.budget_ms
+        failed |= over
+        print(f"{name:<16} median {median_ms:8.2f} ms{'  OVER BUDGET' if over else ''}")
+
+    loaded = eagerly_loaded()
+    if loaded:
+        failed = True
+        print(f"Importing the CLI eagerly loaded {', '.join(loaded)}")
+
+    if args.output:
+        args.output.write_text(
+            json.dumps(
+                {
+                    "budget_ms": args.budget_ms,
+                    "scenarios": results,
+                    "eagerly_loaded": loaded,
+                },
+                indent=4,
+            )
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
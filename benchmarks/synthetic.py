@@ -0,0 +1,177 @@
+"""
+Synthetic targets for the benchmarks, scaled up from tests/test.c.
+
+A target has num_files C files with funcs_per_file functions each. Every
+function is the same grading if/else ladder as tests/test.c, so it has a
+known number of basic blocks and source lines. Alongside the C sources the
+generator can produce matching cov_info (as written by CovInstrument
+-bbcount) and bbcov coverage files, which lets the Python stages be
+benchmarked without an LLVM toolchain.
+"""
+import json
+import pathlib
+import random
+import shutil
+import struct
+import subprocess
+
+FUNCTION_TEMPLATE = """
+int {name}(char c, int i) {{
+    int r = 0;
+    if (c == '{letter}') {{
+        if (i >= 90) {{
+            r = 3;
+        }} else if (i >= 80) {{
+            r = 2;
+        }} else {{
+            r = 1;
+        }}
+    }} else {{
+        if (i >= 80) {{
+            r = 3;
+        }} else if (i >= 70) {{
+            r = 2;
+        }} else {{
+            r = 1;
+        }}
+    }}
+    return r;
+}}
+"""
+
+# (first line offset, last line offset) of every block of FUNCTION_TEMPLATE,
+# relative to the line of the function signature
+BLOCK_LINES = [
+    (0, 3),
+    (4, 4),
+    (5, 5),
+    (6, 6),
+    (8, 8),
+    (11, 11),
+    (12, 12),
+    (13, 13),
+    (15, 15),
+    (19, 20),
+]
+FUNCTION_LINES = FUNCTION_TEMPLATE.count("\n")
+
+
+def function_name(file_idx: int, func_idx: int) -> str:
+    return f"grade_{file_idx}_{func_idx}"
+
+
+def generate_sources(output_dir: pathlib.Path, num_files: int, funcs_per_file: int):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for file_idx in range(num_files):
+        body = ["#include <stdio.h>\n"]
+        for func_idx in range(funcs_per_file):
+            body.append(
+                FUNCTION_TEMPLATE.format(
+                    name=function_name(file_idx, func_idx),
+                    letter=chr(ord("A") + func_idx % 26),
+                )
+            )
+        (output_dir / f"file{file_idx}.c").write_text("".join(body))
+
+    decls = []
+    calls = []
+    for file_idx in range(num_files):
+        for func_idx in range(funcs_per_file):
+            name = function_name(file_idx, func_idx)
+            decls.append(f"int {name}(char c, int i);\n")
+            calls.append(f"    total += {name}(c, i);\n")
+    (output_dir / "main.c").write_text(
+        "#include <stdio.h>\n"
+        + "".join(decls)
+        + "int main() {\n    char c;\n    int i;\n    int total = 0;\n"
+        + '    scanf("%c", &c);\n    scanf("%d", &i);\n'
+        + "".join(calls)
+        + '    printf("%d\\n", total);\n    return 0;\n}\n'
+    )
+
+
+def generate_inputs(output_dir: pathlib.Path, num_inputs: int, seed: int = 0):
+    rng = random.Random(seed)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for n in range(num_inputs):
+        (output_dir / str(n)).write_text(
+            f"{chr(rng.randrange(65, 91))}\n{rng.randrange(100)}\n"
+        )
+
+
+def generate_bitcode(
+    source_dir: pathlib.Path,
+    output_file: pathlib.Path,
+    clang="clang",
+    llvm_link="llvm-link",
+):
+    """
+    Compile the synthetic sources to a single linked bitcode file, returns
+    False when the toolchain is not available.
+    """
+    if shutil.which(clang) is None or shutil.which(llvm_link) is None:
+        return False
+    bitcodes = []
+    for source in sorted(source_dir.glob("*.c")):
+        bitcode = source.with_suffix(".bc")
+        subprocess.run(
+            [clang, "-g", "-O0", "-emit-llvm", "-c", str(source), "-o", str(bitcode)],
+            check=True,
+        )
+        bitcodes.append(str(bitcode))
+    subprocess.run([llvm_link, *bitcodes, "-o", str(output_file)], check=True)
+    return True
+
+
+def generate_cov_info(num_files: int, funcs_per_file: int) -> dict:
+    cov_info = {}
+    for file_idx in range(num_files):
+        file_name = f"file{file_idx}.c"
+        functions = []
+        for func_idx in range(funcs_per_file):
+            # the include line, then one blank line before every function
+            start = 2 + func_idx * FUNCTION_LINES + 1
+            blocks = []
+            for bb, (first, last) in enumerate(BLOCK_LINES):
+                blocks.append(
+                    {
+                        "Id": bb,
+                        "Coverage": [
+                            {"File": file_name, "Line": start + line}
+                            for line in range(first, last + 1)
+                        ],
+                    }
+                )
+            functions.append(
+                {"Function": function_name(file_idx, func_idx), "BasicBlocks": blocks}
+            )
+        cov_info[file_name] = functions
+    return cov_info
+
+
+def write_cov_info(output_file: pathlib.Path, num_files: int, funcs_per_file: int):
+    output_file.write_text(json.dumps(generate_cov_info(num_files, funcs_per_file)))
+
+
+def generate_bbcov_file(
+    output_file: pathlib.Path, num_files: int, funcs_per_file: int, seed: int = 0
+):
+    """
+    A coverage file in the bbcov runtime format: per file its name and
+    function count, per function its name and the block counters.
+    """
+    rng = random.Random(seed)
+    out = bytearray()
+    for file_idx in range(num_files):
+        file_name = f"file{file_idx}.c".encode()
+        out += (
+            struct.pack("I", len(file_name))
+            + file_name
+            + struct.pack("I", funcs_per_file)
+        )
+        for func_idx in range(funcs_per_file):
+            name = function_name(file_idx, func_idx).encode()
+            counters = [rng.choice([0, 0, 1, 5, 100]) for _ in BLOCK_LINES]
+            out += struct.pack("I", len(name)) + name + struct.pack("I", len(counters))
+            out += struct.pack(f"{len(counters)}Q", *counters)
+    output_file.write_bytes(bytes(out))
@@ -1,7 +1,10 @@
 #include "llvm/IR/BasicBlock.h"
+#include "llvm/IR/CFG.h"
 #include "llvm/IR/Constants.h"
 #include "llvm/IR/IRBuilder.h"
 #include "llvm/IR/Instructions.h"
+#include "llvm/IR/IntrinsicInst.h"
+#include "llvm/IR/MDBuilder.h"
 #include "llvm/IR/Module.h"
 #include "llvm/IR/Type.h"
 #include "llvm/Pass.h"
@@ -10,14 +13,24 @@
 #include <llvm/IR/DebugInfoMetadata.h>
 #include <llvm/Support/Debug.h>
 #include <llvm/Support/CommandLine.h>
+#include <llvm/Transforms/Utils/BasicBlockUtils.h>
+#include <llvm/Transforms/Utils/ModuleUtils.h>
 
-#include <set>
+#include <llvm/ADT/DenseMap.h>
+#include <llvm/ADT/SmallPtrSet.h>
+
+#include <algorithm>
 #include <map>
+#include <memory>
 #include <fstream>
+#include <cstdio>
+#include <unordered_map>
 
 #include "rapidjson/document.h"
 #include "rapidjson/writer.h"
-#include "rapidjson/stringbuffer.h"
+#include "rapidjson/filewritestream.h"
+
+#define DEBUG_TYPE "cov-instrument"
 
 using namespace llvm;
 
@@ -26,15 +39,35 @@ static cl::opt<std::string> OutputFilename("output", cl::desc("Specify output fi
 static cl::opt<std::string> SkipList("skiplist", cl::desc("Specify skiplist filename"), cl::value_desc("filename"));
 static cl::opt<bool> BBCountCov("bbcount", cl::desc("Specify if basic block count coverage should be generated"), cl::value_desc("bool"), cl::init(false));
 static cl::opt<bool> TracePC("tracepc", cl::desc("Specify if tracepc coverage should be generated"), cl::value_desc("bool"), cl::init(false));
+static cl::opt<bool> TracePCGuard("tracepc-guard", cl::desc("Only record the first hit of every block in tracepc mode"), cl::value_desc("bool"), cl::init(false));
+static cl::opt<bool> EdgeCov("edgecov", cl::desc("Specify if hashed edge coverage should be generated"), cl::value_desc("bool"), cl::init(false));
+static cl::opt<std::string> ScopeFunction("scope-function", cl::desc("Only instrument this function and the functions it can reach"), cl::value_desc("function"));
+static cl::opt<int> ScopeDepth("scope-depth", cl::desc("With scope-function, only follow calls this many levels deep (-1 for no limit)"), cl::value_desc("depth"), cl::init(-1));
+
+// size of the edge map, must match BC_EDGE_MAP_SIZE in edgecov_runtime.c
+#define EDGE_MAP_SIZE (1 << 16)
 
 namespace
 {
   struct CovInstrument : public ModulePass
   {
     static char ID;
-    rapidjson::StringBuffer s;
-    rapidjson::Writer<rapidjson::StringBuffer> writer;
-    std::map<Function *, std::vector<BasicBlock *>> fileBBMap;
+    // cov_info is streamed to OutputFilename while the module is instrumented
+    FILE *OutFile = nullptr;
+    char OutBuffer[1 << 16];
+    std::unique_ptr<rapidjson::FileWriteStream> OutStream;
+    rapidjson::Writer<rapidjson::FileWriteStream> writer;
+    DenseMap<Function *, std::vector<BasicBlock *>> fileBBMap;
+    DenseMap<Function *, GlobalVariable *> FunctionCounters;
+    // content hashes of the uninstrumented code, see computeStableIds
+    DenseMap<BasicBlock *, uint64_t> StableIds;
+    DenseMap<Function *, uint64_t> FunctionHashes;
+    // first debug location of every function, the fallback for blocks without one
+    DenseMap<Function *, DebugLoc> FunctionDebugLocs;
+    // (file, line) pairs of the current block, reused across blocks
+    std::vector<std::pair<StringRef, uint32_t>> BlockLines;
+    // functions reachable from ScopeFunction, see computeScope
+    SmallPtrSet<Function *, 32> Scope;
 
     CovInstrument() : ModulePass(ID) {}
 
@@ -48,20 +81,113 @@ namespace
       {
         skipList.push_back(line);
       }
+      // sorted for isSkipped
+      std::sort(skipList.begin(), skipList.end());
       return skipList;
     }
 
+    bool isSkipped(Function &F, const std::vector<std::string> &skipList)
+    {
+      if (!ScopeFunction.empty() && !Scope.count(&F))
+      {
+        return true;
+      }
+      return std::binary_search(skipList.begin(), skipList.end(), F.getName().str());
+    }
+
+    bool computeScope(Module &M)
+    {
+      /*
+       * Breadth-first walk of the call graph from ScopeFunction, up to
+       * ScopeDepth calls deep. Every function an instruction refers to counts
+       * as a callee, so callbacks passed by address are followed as well as
+       * direct calls; indirect calls through other pointers are not.
+       */
+      Function *Root = M.getFunction(ScopeFunction);
+      if (Root == nullptr || Root->isDeclaration())
+      {
+        llvm::errs() << "Scope function " << ScopeFunction << " is not defined in the module\n";
+        return false;
+      }
+
+      std::vector<Function *> Level{Root};
+      Scope.insert(Root);
+      for (int Depth = 0; !Level.empty() && (ScopeDepth < 0 || Depth < ScopeDepth); Depth++)
+      {
+        std::vector<Function *> Next;
+        for (Function *F : Level)
+        {
+          for (BasicBlock &BB : *F)
+          {
+            for (Instruction &I : BB)
+            {
+              for (Value *Op : I.operands())
+              {
+                Function *Callee = dyn_cast<Function>(Op->stripPointerCasts());
+                if (Callee && !Callee->isDeclaration() && Scope.insert(Callee).second)
+                {
+                  Next.push_back(Callee);
+                }
+              }
+            }
+          }
+        }
+        Level.swap(Next);
+      }
+
+      llvm::dbgs() << "Instrumenting " << Scope.size() << " functions reachable from " << ScopeFunction << "\n";
+      return true;
+    }
+
+    void openOutput()
+    {
+      OutFile = std::fopen(OutputFilename.c_str(), "wb");
+      if (OutFile == nullptr)
+      {
+        report_fatal_error(Twine("Unable to open ") + OutputFilename);
+      }
+      OutStream.reset(new rapidjson::FileWriteStream(OutFile, OutBuffer, sizeof(OutBuffer)));
+      this->writer.Reset(*OutStream);
+    }
+
+    void closeOutput()
+    {
+      OutStream->Flush();
+      std::fclose(OutFile);
+      OutStream.reset();
+      OutFile = nullptr;
+    }
+
+    void writeString(StringRef Str)
+    {
+      this->writer.String(Str.data(), Str.size());
+    }
+
+    void writeHash(uint64_t Hash)
+    {
+      char Buf[17];
+      std::snprintf(Buf, sizeof(Buf), "%016llx", (unsigned long long)Hash);
+      this->writer.String(Buf, 16);
+    }
+
     bool VerifyParameters(void)
     {
-      if (BBCountCov && TracePC)
+      int NumModes = BBCountCov + TracePC + EdgeCov;
+      if (NumModes > 1)
+      {
+        llvm::errs() << "Only one of bbcount, tracepc and edgecov can be specified\n";
+        return false;
+      }
+
+      if (NumModes == 0)
       {
-        llvm::errs() << "Cannot specify both bbcount and tracepc\n";
+        llvm::errs() << "Must specify one of bbcount, tracepc or edgecov\n";
         return false;
       }
 
-      if (!BBCountCov && !TracePC)
+      if (TracePCGuard && !TracePC)
       {
-        llvm::errs() << "Must specify either bbcount or tracepc\n";
+        llvm::errs() << "tracepc-guard can only be used with tracepc\n";
         return false;
       }
 
@@ -77,6 +203,11 @@ namespace
 
       std::vector<std::string> skipList = parseSkipList();
 
+      if (!ScopeFunction.empty() && !computeScope(M))
+      {
+        return false;
+      }
+
       if (BBCountCov)
       {
         llvm::dbgs() << "Generating basic block count coverage\n";
@@ -87,19 +218,32 @@ namespace
         llvm::dbgs() << "Generating tracepc coverage\n";
         return TracePCCoverage(M, skipList);
       }
+      else if (EdgeCov)
+      {
+        llvm::dbgs() << "Generating edge coverage\n";
+        return EdgeCoverage(M, skipList);
+      }
       else
       {
         llvm_unreachable("Invalid coverage type");
       }
     }
 
-    bool TracePCCoverage(Module &M, std::vector<std::string> skipList)
+    bool TracePCCoverage(Module &M, const std::vector<std::string> &skipList)
     {
       LLVMContext &C = M.getContext();
-      std::map<std::string, std::vector<Function *>> fileFunctionMap;
-      std::map<BasicBlock *, uint32_t> BBMap;
 
-      this->writer.Reset(this->s);
+      FunctionType *CovFuncType = FunctionType::get(Type::getVoidTy(C),
+                                                    {Type::getInt32Ty(C)}, false);
+      FunctionCallee CovFunc = M.getOrInsertFunction("bc_cov", CovFuncType);
+
+      GlobalVariable *Guards = nullptr;
+      if (TracePCGuard)
+      {
+        Guards = createGuards(M, skipList);
+      }
+
+      openOutput();
       this->writer.StartObject();
       this->writer.Key("BasicBlock");
       this->writer.StartArray();
@@ -109,54 +253,264 @@ namespace
       {
         if (F.isDeclaration())
         {
-          llvm::dbgs() << "Skipping function (isDeclaration): " << F.getName() << "\n";
+          LLVM_DEBUG(llvm::dbgs() << "Skipping function (isDeclaration): " << F.getName() << "\n");
           continue;
         }
 
-        if (std::find(skipList.begin(), skipList.end(), F.getName().str()) != skipList.end())
+        if (isSkipped(F, skipList))
         {
-          llvm::dbgs() << "Skipping function (skipList): " << F.getName() << "\n";
+          LLVM_DEBUG(llvm::dbgs() << "Skipping function (skipList or scope): " << F.getName() << "\n");
           continue;
         }
-        
-        // Assign a unique basic block id to each basic block
+
+        computeStableIds(F);
+
+        // the guards split blocks, so take the blocks before instrumenting
+        std::vector<BasicBlock *> Blocks;
         for (BasicBlock &BB : F)
         {
+          Blocks.push_back(&BB);
+        }
+
+        // Assign a unique basic block id to each basic block
+        for (BasicBlock *BBPtr : Blocks)
+        {
+          BasicBlock &BB = *BBPtr;
+          uint32_t BBId = BBCounter++;
           this->writer.StartObject();
           this->writer.Key("Id");
-          this->writer.Uint(BBCounter);          
+          this->writer.Uint(BBId);
+          this->writer.Key("Function");
+          writeString(F.getName());
+          this->writer.Key("FunctionHash");
+          writeHash(FunctionHashes[&F]);
+          this->writer.Key("StableId");
+          writeHash(StableIds[&BB]);
 
-          BBMap[&BB] = BBCounter++;          
-          
           AddBasicBlockCoverage(&BB);
 
           Instruction *InsI = &(*(BB.getFirstInsertionPt()));
+          DebugLoc CallLoc = getNearestDebugInfo(InsI);
+          if (Guards)
+          {
+            InsI = insertGuardCheck(InsI, Guards, BBId);
+          }
           IRBuilder<> builder(InsI);
-          builder.SetCurrentDebugLocation(getNearestDebugInfo(dyn_cast<Instruction>(InsI)));
-
-          FunctionType *CovFuncType = FunctionType::get(Type::getVoidTy(C),
-                                                        {Type::getInt32Ty(C)}, false);
-          FunctionCallee CovFunc = M.getOrInsertFunction("bc_cov", CovFuncType);
+          builder.SetCurrentDebugLocation(CallLoc);
 
-          builder.CreateCall(CovFunc, {builder.getInt32(BBMap[&BB])});
+          builder.CreateCall(CovFunc, {builder.getInt32(BBId)});
           this->writer.EndObject();
         }
       }
 
       this->writer.EndArray();
       this->writer.EndObject();
+      closeOutput();
+
+      if (Guards)
+      {
+        registerGuards(M, Guards);
+      }
+
+      return true;
+    }
+
+    GlobalVariable *createGuards(Module &M, const std::vector<std::string> &skipList)
+    {
+      // one guard byte per block, in the same order the ids are assigned
+      LLVMContext &C = M.getContext();
+      uint32_t NumBBs = 0;
+      for (Function &F : M)
+      {
+        if (F.isDeclaration() || isSkipped(F, skipList))
+        {
+          continue;
+        }
+        NumBBs += std::distance(F.begin(), F.end());
+      }
+
+      ArrayType *GuardsTy = ArrayType::get(Type::getInt8Ty(C), NumBBs);
+      return new GlobalVariable(M, GuardsTy, false, GlobalValue::InternalLinkage,
+                                ConstantAggregateZero::get(GuardsTy), "__bc_tracepc_guards");
+    }
+
+    void registerGuards(Module &M, GlobalVariable *Guards)
+    {
+      // the runtime needs the guards to reset them in forked children and
+      // between persistent mode iterations. Created after instrumenting, so
+      // the constructor is neither instrumented nor given a guard.
+      LLVMContext &C = M.getContext();
+      uint64_t NumBBs = cast<ArrayType>(Guards->getValueType())->getNumElements();
+      FunctionType *CtorTy = FunctionType::get(Type::getVoidTy(C), false);
+      Function *Ctor = Function::Create(CtorTy, GlobalValue::InternalLinkage, "bc_cov_guards_ctor", &M);
+      IRBuilder<> Builder(BasicBlock::Create(C, "entry", Ctor));
+      FunctionType *RegisterTy = FunctionType::get(Type::getVoidTy(C), {Type::getInt8PtrTy(C), Type::getInt32Ty(C)}, false);
+      FunctionCallee Register = M.getOrInsertFunction("bc_cov_register_guards", RegisterTy);
+      Builder.CreateCall(Register, {Builder.CreateBitCast(Guards, Type::getInt8PtrTy(C)), Builder.getInt32(NumBBs)});
+      Builder.CreateRetVoid();
+      appendToGlobalCtors(M, Ctor, 0);
+    }
+
+    Instruction *insertGuardCheck(Instruction *InsI, GlobalVariable *Guards, uint32_t Id)
+    {
+      /*
+       * if (!guards[id]) { guards[id] = 1; <call> }
+       * Returns the instruction the call has to be inserted before. After the
+       * first hit a block only pays for a load and a predictable branch.
+       */
+      LLVMContext &C = InsI->getContext();
+      IRBuilder<> Builder(InsI);
+      std::vector<Value *> Indices{Builder.getInt64(0), Builder.getInt64(Id)};
+      Value *Guard = Builder.CreateInBoundsGEP(Guards, Indices);
+      Value *Unseen = Builder.CreateICmpEQ(Builder.CreateLoad(Type::getInt8Ty(C), Guard), Builder.getInt8(0));
+      Instruction *Then = SplitBlockAndInsertIfThen(Unseen, InsI, false,
+                                                    MDBuilder(C).createBranchWeights(1, 1 << 20));
+      IRBuilder<> ThenBuilder(Then);
+      ThenBuilder.CreateStore(ThenBuilder.getInt8(1), Guard);
+      return Then;
+    }
+
+    uint32_t edgeLocation(Function &F, unsigned int BBIndex)
+    {
+      // FNV-1a of "<function>:<block index>", a block gets the same location in
+      // every build so the maps of different runs can be compared
+      uint32_t Hash = 2166136261u;
+      std::string Key = F.getName().str() + ":" + std::to_string(BBIndex);
+      for (unsigned char Ch : Key)
+      {
+        Hash ^= Ch;
+        Hash *= 16777619u;
+      }
+      return Hash & (EDGE_MAP_SIZE - 1);
+    }
+
+    bool EdgeCoverage(Module &M, const std::vector<std::string> &skipList)
+    {
+      LLVMContext &C = M.getContext();
+      ArrayType *MapTy = ArrayType::get(Type::getInt8Ty(C), EDGE_MAP_SIZE);
+
+      // both are defined by edgecov_runtime.c
+      GlobalVariable *EdgeMap = dyn_cast<GlobalVariable>(M.getOrInsertGlobal("__bc_edge_map", MapTy));
+      GlobalVariable *PrevLoc = dyn_cast<GlobalVariable>(M.getOrInsertGlobal("__bc_edge_prev_loc", Type::getInt32Ty(C)));
+      PrevLoc->setThreadLocalMode(GlobalValue::GeneralDynamicTLSModel);
+
+      openOutput();
+      this->writer.StartObject();
+      this->writer.Key("MapSize");
+      this->writer.Uint(EDGE_MAP_SIZE);
+      this->writer.Key("BasicBlock");
+      this->writer.StartArray();
+
+      uint32_t BBCounter = 0;
+      for (Function &F : M)
+      {
+        if (F.isDeclaration())
+        {
+          continue;
+        }
+
+        if (isSkipped(F, skipList))
+        {
+          continue;
+        }
+
+        computeStableIds(F);
+
+        DenseMap<BasicBlock *, uint32_t> BBIds;
+        DenseMap<BasicBlock *, uint32_t> BBLocs;
+        unsigned int BBIndex = 0;
+        for (BasicBlock &BB : F)
+        {
+          BBIds[&BB] = BBCounter++;
+          BBLocs[&BB] = edgeLocation(F, BBIndex++);
+        }
+
+        for (BasicBlock &BB : F)
+        {
+          bool IsEntry = &BB == &F.getEntryBlock();
+          this->writer.StartObject();
+          this->writer.Key("Id");
+          this->writer.Uint(BBIds[&BB]);
+          this->writer.Key("Function");
+          writeString(F.getName());
+          this->writer.Key("FunctionHash");
+          writeHash(FunctionHashes[&F]);
+          this->writer.Key("StableId");
+          writeHash(StableIds[&BB]);
+          this->writer.Key("Location");
+          this->writer.Uint(BBLocs[&BB]);
+          this->writer.Key("Entry");
+          this->writer.Bool(IsEntry);
+          this->writer.Key("Successors");
+          this->writer.StartArray();
+          for (BasicBlock *Succ : successors(&BB))
+          {
+            this->writer.Uint(BBIds[Succ]);
+          }
+          this->writer.EndArray();
+          AddBasicBlockCoverage(&BB);
+          this->writer.EndObject();
 
-      // Write the output to a file
-      std::string output = this->s.GetString();
+          insertEdgeIncrement(BB, EdgeMap, PrevLoc, BBLocs[&BB], IsEntry);
+        }
+      }
 
-      std::ofstream out(OutputFilename);
-      out << output;
-      out.close();
+      this->writer.EndArray();
+      this->writer.EndObject();
+      closeOutput();
 
       return true;
     }
 
-    bool BBCountCoverage(Module &M, std::vector<std::string> skipList)
+    void insertEdgeIncrement(BasicBlock &BB, GlobalVariable *EdgeMap, GlobalVariable *PrevLoc, uint32_t CurLoc, bool IsEntry)
+    {
+      LLVMContext &C = BB.getContext();
+      Type *Int8Ty = Type::getInt8Ty(C);
+      Type *Int32Ty = Type::getInt32Ty(C);
+
+      Instruction *InsI = &(*(BB.getFirstInsertionPt()));
+      IRBuilder<> Builder(InsI);
+
+      // map[prev_loc ^ cur_loc]++ inline, the entry block ignores the caller so
+      // the edge into a function is always recorded at its own location
+      Value *Index = Builder.getInt32(CurLoc);
+      if (!IsEntry)
+      {
+        LoadInst *Prev = Builder.CreateLoad(Int32Ty, PrevLoc);
+        Index = Builder.CreateXor(Prev, Index);
+      }
+      std::vector<Value *> Indices{Builder.getInt64(0), Builder.CreateZExt(Index, Type::getInt64Ty(C))};
+      Value *Ptr = Builder.CreateInBoundsGEP(EdgeMap, Indices);
+      LoadInst *Counter = Builder.CreateLoad(Int8Ty, Ptr);
+      // skip zero on overflow, a saturated edge must still read as hit
+      Value *Inc = Builder.CreateAdd(Counter, Builder.getInt8(1));
+      Value *Carry = Builder.CreateZExt(Builder.CreateICmpEQ(Inc, Builder.getInt8(0)), Int8Ty);
+      Builder.CreateStore(Builder.CreateAdd(Inc, Carry), Ptr);
+      Builder.CreateStore(Builder.getInt32(CurLoc >> 1), PrevLoc);
+
+      // an instrumented callee leaves its own location behind, restore ours
+      // after the call so the edges out of this block are the CFG edges
+      std::vector<CallInst *> Calls;
+      for (Instruction &I : BB)
+      {
+        if (CallInst *Call = dyn_cast<CallInst>(&I))
+        {
+          Function *Callee = Call->getCalledFunction();
+          if (isa<IntrinsicInst>(Call) || Call->isMustTailCall() || (Callee && Callee->isDeclaration()))
+          {
+            continue;
+          }
+          Calls.push_back(Call);
+        }
+      }
+      for (CallInst *Call : Calls)
+      {
+        IRBuilder<> After(Call->getNextNode());
+        After.CreateStore(After.getInt32(CurLoc >> 1), PrevLoc);
+      }
+    }
+
+    bool BBCountCoverage(Module &M, const std::vector<std::string> &skipList)
     {
       LLVMContext &C = M.getContext();
       std::map<std::string, std::vector<Function *>> fileFunctionMap;
@@ -168,7 +522,7 @@ namespace
           continue;
         }
 
-        if (std::find(skipList.begin(), skipList.end(), F.getName().str()) != skipList.end())
+        if (isSkipped(F, skipList))
         {
           continue;
         }
@@ -176,10 +530,14 @@ namespace
         unsigned int NumBBs = std::distance(F.begin(), F.end());
         ArrayType *ArrayTy = ArrayType::get(Type::getInt64Ty(C), NumBBs);
         std::string counterName = F.getName().str() + "_counters";
-        llvm::dbgs() << "Creating Function Array: " << counterName << "\n";
+        LLVM_DEBUG(llvm::dbgs() << "Creating Function Array: " << counterName << "\n");
         // GlobalVariable *BBCounters = dyn_cast<GlobalVariable>(M.getOrInsertGlobal(funcName, ArrayTy));
         auto *initializer = ConstantAggregateZero::get(ArrayTy);
         GlobalVariable *BBCounters = new GlobalVariable(M, ArrayTy, false, GlobalValue::InternalLinkage, initializer, counterName);
+        FunctionCounters[&F] = BBCounters;
+
+        // Hash the blocks before the increments are added to them
+        computeStableIds(F);
 
         // Insert atomic increment operations in each basic block
         insertAtomicIncrements(F, BBCounters);
@@ -200,6 +558,7 @@ namespace
 
       // Insert calls to bc_cov_set_file and bc_cov
       insertbcCovCalls(M, fileFunctionMap);
+      insertResetCov(M, fileFunctionMap);
       return true;
     }
 
@@ -208,31 +567,112 @@ namespace
       this->writer.Key("Coverage");
       this->writer.StartArray();
 
-      std::set<std::tuple<std::string, uint32_t>> covinfo;
-
+      // the file names point into the module's uniqued metadata, so they are
+      // compared and written without copying; sorted and deduplicated in the
+      // (file, line) order the consumers expect
+      BlockLines.clear();
       for (Instruction &I : *BB)
       {
         if (const llvm::DebugLoc &DL = I.getDebugLoc())
         {
-          std::string filename = DL->getFilename().str();
-          uint32_t line = DL->getLine();
-          covinfo.insert(std::make_tuple(filename, line));
+          BlockLines.emplace_back(DL->getFilename(), DL->getLine());
         }
       }
+      std::sort(BlockLines.begin(), BlockLines.end());
+      BlockLines.erase(std::unique(BlockLines.begin(), BlockLines.end()), BlockLines.end());
 
-      for (auto &info : covinfo)
+      for (auto &Line : BlockLines)
       {
         this->writer.StartObject();
         this->writer.Key("File");
-        this->writer.String(std::get<0>(info).c_str());
+        writeString(Line.first);
         this->writer.Key("Line");
-        this->writer.Uint(std::get<1>(info));
+        this->writer.Uint(Line.second);
         this->writer.EndObject();
       }
 
       this->writer.EndArray();
     }
 
+    static uint64_t fnv1a(uint64_t Hash, const void *Data, size_t Len)
+    {
+      const unsigned char *Bytes = static_cast<const unsigned char *>(Data);
+      for (size_t i = 0; i < Len; i++)
+      {
+        Hash ^= Bytes[i];
+        Hash *= 1099511628211ULL;
+      }
+      return Hash;
+    }
+
+    template <typename T>
+    static uint64_t fnv1a(uint64_t Hash, T Value)
+    {
+      return fnv1a(Hash, &Value, sizeof(Value));
+    }
+
+    static uint64_t fnv1a(uint64_t Hash, StringRef Str)
+    {
+      return fnv1a(Hash, Str.data(), Str.size());
+    }
+
+    uint64_t hashBasicBlock(BasicBlock &BB)
+    {
+      // opcodes, types, constants, referenced globals and debug locations, but
+      // not value names or numbering, which shift whenever anything else in
+      // the module changes
+      uint64_t Hash = 14695981039346656037ULL;
+      for (Instruction &I : BB)
+      {
+        Hash = fnv1a(Hash, I.getOpcode());
+        Hash = fnv1a(Hash, (unsigned int)I.getType()->getTypeID());
+        if (CmpInst *Cmp = dyn_cast<CmpInst>(&I))
+        {
+          Hash = fnv1a(Hash, (unsigned int)Cmp->getPredicate());
+        }
+        for (Value *Op : I.operands())
+        {
+          Hash = fnv1a(Hash, Op->getValueID());
+          if (ConstantInt *CI = dyn_cast<ConstantInt>(Op))
+          {
+            Hash = fnv1a(Hash, CI->getValue().getLimitedValue());
+          }
+          else if (GlobalValue *GV = dyn_cast<GlobalValue>(Op))
+          {
+            Hash = fnv1a(Hash, GV->getName());
+          }
+        }
+        if (const llvm::DebugLoc &DL = I.getDebugLoc())
+        {
+          Hash = fnv1a(Hash, DL->getFilename());
+          Hash = fnv1a(Hash, DL.getLine());
+          Hash = fnv1a(Hash, DL.getCol());
+        }
+      }
+      return Hash;
+    }
+
+    void computeStableIds(Function &F)
+    {
+      /*
+       * A block's stable id is derived from its function's name and its own
+       * content, so it survives rebuilds that only change other functions.
+       * The function hash covers every block in order, equal hashes across
+       * two builds mean the coverage of the function can be carried over.
+       */
+      uint64_t Seed = fnv1a(14695981039346656037ULL, F.getName());
+      uint64_t FuncHash = Seed;
+      // identical blocks of one function are told apart by their order
+      std::unordered_map<uint64_t, uint32_t> Occurrences;
+      for (BasicBlock &BB : F)
+      {
+        uint64_t BBHash = hashBasicBlock(BB);
+        FuncHash = fnv1a(FuncHash, BBHash);
+        StableIds[&BB] = fnv1a(fnv1a(Seed, BBHash), Occurrences[BBHash]++);
+      }
+      FunctionHashes[&F] = FuncHash;
+    }
+
     void insertAtomicIncrements(Function &F, GlobalVariable *BBCounters)
     {
       unsigned int BBIndex = 0;
@@ -265,7 +705,14 @@ namespace
       BasicBlock *BB = BasicBlock::Create(C, "entry", DumpFunc);
       IRBuilder<> builder(BB);
 
-      this->writer.Reset(this->s);
+      FunctionType *SetFileType = FunctionType::get(Type::getVoidTy(C),
+                                                    {Type::getInt8PtrTy(C), Type::getInt32Ty(C), Type::getInt32Ty(C)}, false);
+      FunctionCallee SetFileFunc = M.getOrInsertFunction("bc_cov_set_file", SetFileType);
+      FunctionType *CovFuncType = FunctionType::get(Type::getVoidTy(C),
+                                                    {Type::getInt8PtrTy(C), Type::getInt32Ty(C), Type::getInt64PtrTy(C), Type::getInt32Ty(C)}, false);
+      FunctionCallee CovFunc = M.getOrInsertFunction("bc_cov", CovFuncType);
+
+      openOutput();
       this->writer.StartObject();
 
       for (auto &fileFuncPair : fileFunctionMap)
@@ -275,29 +722,32 @@ namespace
         int numFuncs = functions.size();
 
         // Insert call to bc_cov_set_file
-        insertSetFileCall(M, fileName, numFuncs, builder);
-        this->writer.Key(fileName.c_str());
+        insertSetFileCall(SetFileFunc, fileName, numFuncs, builder);
+        this->writer.Key(fileName.c_str(), fileName.size());
         this->writer.StartArray();
 
         for (Function *F : functions)
         {
           this->writer.StartObject();
           this->writer.Key("Function");
-          this->writer.String(F->getName().str().c_str());
+          writeString(F->getName());
+          this->writer.Key("Hash");
+          writeHash(FunctionHashes[F]);
           this->writer.Key("BasicBlocks");
           // Get the global counters array for the function
-          std::string funcName = F->getName().str() + "_counters";
-          llvm::dbgs() << "Finding array : " << funcName << "\n";
-          GlobalVariable *BBCounters = M.getGlobalVariable(funcName, true);
-          unsigned int NumBBs = std::distance(F->begin(), F->end());
+          GlobalVariable *BBCounters = FunctionCounters[F];
+          const std::vector<BasicBlock *> &BBs = this->fileBBMap[F];
+          unsigned int NumBBs = BBs.size();
 
           unsigned int BBIndex = 0;
           this->writer.StartArray();
-          for (BasicBlock *BB : this->fileBBMap[F])
+          for (BasicBlock *BB : BBs)
           {
             this->writer.StartObject();
             this->writer.Key("Id");
             this->writer.Uint(BBIndex++);
+            this->writer.Key("StableId");
+            writeHash(StableIds[BB]);
             AddBasicBlockCoverage(BB);
             this->writer.EndObject();
           }
@@ -305,7 +755,7 @@ namespace
           this->writer.EndObject();
 
           // Insert call to bc_cov
-          insertCovCall(M, *F, BBCounters, NumBBs, builder);
+          insertCovCall(CovFunc, *F, BBCounters, NumBBs, builder);
         }
 
         this->writer.EndArray();
@@ -314,23 +764,37 @@ namespace
       builder.CreateRetVoid();
 
       this->writer.EndObject();
-
-      // Write the output to a file
-      std::string output = this->s.GetString();
-      // llvm::dbgs() << output << "\n";
-
-      std::ofstream out(OutputFilename);
-      out << output;
-      out.close();
+      closeOutput();
     }
 
-    void insertSetFileCall(Module &M, const std::string &fileName, int numFuncs, IRBuilder<> &Builder)
+    void insertResetCov(Module &M, std::map<std::string, std::vector<Function *>> &fileFunctionMap)
     {
+      // _bc_reset_cov zeroes every counter array, the runtime calls it in
+      // forked children so each process only dumps its own executions
       LLVMContext &C = M.getContext();
-      FunctionType *SetFileType = FunctionType::get(Type::getVoidTy(C),
-                                                    {Type::getInt8PtrTy(C), Type::getInt32Ty(C), Type::getInt32Ty(C)}, false);
-      FunctionCallee SetFileFunc = M.getOrInsertFunction("bc_cov_set_file", SetFileType);
+      FunctionType *funcType = FunctionType::get(Type::getVoidTy(C), false);
+      Function *ResetFunc = Function::Create(funcType, Function::ExternalLinkage, "_bc_reset_cov", &M);
+
+      BasicBlock *BB = BasicBlock::Create(C, "entry", ResetFunc);
+      IRBuilder<> builder(BB);
+      const DataLayout &DL = M.getDataLayout();
+
+      for (auto &fileFuncPair : fileFunctionMap)
+      {
+        for (Function *F : fileFuncPair.second)
+        {
+          GlobalVariable *BBCounters = FunctionCounters[F];
+          assert(BBCounters != nullptr && "Global Variable, needed to reset coverage is null");
+          uint64_t Size = DL.getTypeAllocSize(BBCounters->getValueType());
+          builder.CreateMemSet(BBCounters, builder.getInt8(0), Size, MaybeAlign(8));
+        }
+      }
 
+      builder.CreateRetVoid();
+    }
+
+    void insertSetFileCall(FunctionCallee SetFileFunc, const std::string &fileName, int numFuncs, IRBuilder<> &Builder)
+    {
       // Create arguments for the call
       Constant *FileNameStr = Builder.CreateGlobalStringPtr(fileName);
       Value *FileNameLen = Builder.getInt32(fileName.length());
@@ -339,13 +803,10 @@ namespace
       Builder.CreateCall(SetFileFunc, {FileNameStr, FileNameLen, NumFuncsVal});
     }
 
-    void insertCovCall(Module &M, Function &F, GlobalVariable *BBCounters, unsigned int NumBBs, IRBuilder<> &Builder)
+    void insertCovCall(FunctionCallee CovFunc, Function &F, GlobalVariable *BBCounters, unsigned int NumBBs, IRBuilder<> &Builder)
     {
       assert(BBCounters != nullptr && "Global Variable, needed to insert coverage is null");
-      LLVMContext &C = M.getContext();
-      FunctionType *CovFuncType = FunctionType::get(Type::getVoidTy(C),
-                                                    {Type::getInt8PtrTy(C), Type::getInt32Ty(C), Type::getInt64PtrTy(C), Type::getInt32Ty(C)}, false);
-      FunctionCallee CovFunc = M.getOrInsertFunction("bc_cov", CovFuncType);
+      LLVMContext &C = F.getContext();
 
       // Create arguments for the call
       Constant *FuncNameStr = Builder.CreateGlobalStringPtr(F.getName());
@@ -353,10 +814,10 @@ namespace
       Value *NumBBsVal = Builder.getInt32(NumBBs);
       Value *CastedGlob = Builder.CreateBitCast(BBCounters, Type::getInt64PtrTy(C));
 
-      llvm::dbgs() << "Function name: " << F.getName() << "\n";
+      LLVM_DEBUG(llvm::dbgs() << "Function name: " << F.getName() << "\n");
 
-      llvm::dbgs() << "Function name length: " << F.getName().size() << "\n";
-      llvm::dbgs() << "Number of basic blocks: " << NumBBs << "\n";
+      LLVM_DEBUG(llvm::dbgs() << "Function name length: " << F.getName().size() << "\n");
+      LLVM_DEBUG(llvm::dbgs() << "Number of basic blocks: " << NumBBs << "\n");
       // BBCounters->dump();
 
       // F.dump();
@@ -364,7 +825,7 @@ namespace
       Builder.CreateCall(CovFunc, {FuncNameStr, FuncNameLen, CastedGlob, NumBBsVal});
     }
 
-    const DebugLoc &getNearestDebugInfo(llvm::Instruction *I)
+    DebugLoc getNearestDebugInfo(llvm::Instruction *I)
     {
       /*
        * This function tries to find the nearest debug information for the given instruction
@@ -386,16 +847,33 @@ namespace
         }
       }
 
-      for (auto &BB : *I->getFunction())
+      // the first location of the function, looked up once per function
+      // rather than once per block without debug info
+      Function *F = I->getFunction();
+      auto Cached = FunctionDebugLocs.find(F);
+      if (Cached == FunctionDebugLocs.end())
       {
-        for (auto &I : BB)
+        DebugLoc First;
+        for (auto &BB : *F)
         {
-          const DebugLoc &DL = I.getDebugLoc();
-          if (DL)
+          for (auto &I : BB)
           {
-            return DL;
+            if (I.getDebugLoc())
+            {
+              First = I.getDebugLoc();
+              break;
+            }
+          }
+          if (First)
+          {
+            break;
           }
         }
+        Cached = FunctionDebugLocs.insert({F, First}).first;
+      }
+      if (Cached->second)
+      {
+        return Cached->second;
       }
 
       llvm::errs() << "Unable to find debug information for instruction: " << *I << "\n";
@@ -1,5 +1,6 @@
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
 #include <sys/types.h>
 #include <unistd.h>
 #include <signal.h>
@@ -10,18 +11,52 @@
 #include <errno.h>
 #include <err.h>
 #include <execinfo.h>
+#include <pthread.h>
+#include <fcntl.h>
 
 int grill_guard_after[100] = {0};
-FILE *cov_fp = NULL;
+int cov_fd = -1;
 int grill_guard_before[100] = {0};
 int done = 0;
 
+// the file is opened by the constructor, forked children reopen it as
+// "<BC_COV_FILE>.<pid>"
+char *base_cov_file = NULL;
+
+// the counters are dumped from the signal handlers, so the dump only uses
+// write(2) on this preallocated buffer, never stdio or malloc
+#define COV_BUF_SIZE (64 * 1024)
+static char cov_buf[COV_BUF_SIZE];
+static size_t cov_buf_len = 0;
+
 void bc_dump_cov();
 void bc_cov_set_signal_handler();
 //#ifdef GRILLER
 void grill_hook_destroy();
 //#endif
 void _bc_dump_cov();
+void _bc_reset_cov();
+
+int bc_open_cov_file(const char *path)
+{
+  int fd = open(path, O_CREAT | O_WRONLY | O_TRUNC | O_CLOEXEC, 0666);
+  if (fd == -1)
+  {
+    perror("Error opening file");
+    exit(-1);
+  }
+  return fd;
+}
+
+void bc_fork_child()
+{
+  // the child starts from zero so the parent and child dumps add up
+  _bc_reset_cov();
+  char path[4096];
+  snprintf(path, sizeof(path), "%s.%d", base_cov_file, getpid());
+  close(cov_fd);
+  cov_fd = bc_open_cov_file(path);
+}
 
 __attribute__((constructor)) void bc_init_cov()
 {
@@ -46,10 +81,18 @@ __attribute__((constructor)) void bc_init_cov()
     remove(bc_cov_file);
   }
 
-  cov_fp = fopen(bc_cov_file, "w");
+  base_cov_file = strdup(bc_cov_file);
+  cov_fd = bc_open_cov_file(base_cov_file);
   bc_cov_set_signal_handler();
+  pthread_atfork(NULL, NULL, bc_fork_child);
 
-  alarm(5);
+  // the driver enforces per-input timeouts by sending SIGTERM, an in-process
+  // alarm is only armed when explicitly requested
+  char *bc_cov_timeout = getenv("BC_COV_TIMEOUT");
+  if (bc_cov_timeout != NULL && atoi(bc_cov_timeout) > 0)
+  {
+    alarm(atoi(bc_cov_timeout));
+  }
 }
 
 #define PATHMAX 100
@@ -111,6 +154,58 @@ void bc_cov_set_signal_handler()
   }
 }
 
+void bc_flush_cov_buf()
+{
+  char *data = cov_buf;
+  size_t size = cov_buf_len;
+  while (size > 0)
+  {
+    ssize_t n = write(cov_fd, data, size);
+    if (n <= 0)
+    {
+      if (n == -1 && errno == EINTR)
+        continue;
+      break;
+    }
+    data += n;
+    size -= n;
+  }
+  cov_buf_len = 0;
+}
+
+void bc_write_cov_data(const void *data, size_t size)
+{
+  const char *p = (const char *)data;
+  while (size > 0)
+  {
+    if (cov_buf_len == COV_BUF_SIZE)
+    {
+      bc_flush_cov_buf();
+    }
+    size_t n = COV_BUF_SIZE - cov_buf_len;
+    if (n > size)
+      n = size;
+    memcpy(cov_buf + cov_buf_len, p, n);
+    cov_buf_len += n;
+    p += n;
+    size -= n;
+  }
+}
+
+int bc_write_cov()
+{
+  // only async-signal-safe calls, this also runs from the signal handlers.
+  // Every dump replaces the previous one, persistent mode dumps once per input
+  if (cov_fd == -1 || lseek(cov_fd, 0, SEEK_SET) == -1 || ftruncate(cov_fd, 0) == -1)
+  {
+    return 0;
+  }
+  cov_buf_len = 0;
+  _bc_dump_cov();
+  bc_flush_cov_buf();
+  return 1;
+}
+
 __attribute__((destructor)) void bc_dump_cov()
 {
   if (done == 1) exit(-1);
@@ -118,18 +213,29 @@ __attribute__((destructor)) void bc_dump_cov()
 //#ifdef GRILLER
   grill_hook_destroy();
 //#endif
-  _bc_dump_cov();
-  fclose(cov_fp);
+  bc_write_cov();
   exit(-1);
 }
 
+#include "bc_persistent.h"
+
+static void bc_persistent_write(void)
+{
+  bc_write_cov();
+}
+
+static void bc_persistent_reset(void)
+{
+  _bc_reset_cov();
+}
+
 void bc_cov_set_file(char *file_name, int file_name_len, int num_funcs)
 {
   // if the file descriptor is not set, then set it
   // else close the file descriptor and set it
-  fwrite(&file_name_len, sizeof(int), 1, cov_fp);
-  fwrite(file_name, sizeof(char), file_name_len, cov_fp);
-  fwrite(&num_funcs, sizeof(int), 1, cov_fp);
+  bc_write_cov_data(&file_name_len, sizeof(int));
+  bc_write_cov_data(file_name, file_name_len);
+  bc_write_cov_data(&num_funcs, sizeof(int));
 }
 
 void bc_cov(char *func_name, int func_name_len, u_int64_t *cov_array, int cov_array_len)
@@ -139,8 +245,8 @@ void bc_cov(char *func_name, int func_name_len, u_int64_t *cov_array, int cov_ar
 #ifdef DEBUG
   printf("func: %s | ", func_name);
 #endif
-  fwrite(&func_name_len, sizeof(int), 1, cov_fp);
-  fwrite(func_name, sizeof(char), func_name_len, cov_fp);
+  bc_write_cov_data(&func_name_len, sizeof(int));
+  bc_write_cov_data(func_name, func_name_len);
 #ifdef DEBUG
   for (int i = 0; i < cov_array_len; i++)
   {
@@ -148,6 +254,6 @@ void bc_cov(char *func_name, int func_name_len, u_int64_t *cov_array, int cov_ar
   }
   printf("\n");
 #endif
-  fwrite(&cov_array_len, sizeof(int), 1, cov_fp);
-  fwrite(cov_array, sizeof(u_int64_t), cov_array_len, cov_fp);
+  bc_write_cov_data(&cov_array_len, sizeof(int));
+  bc_write_cov_data(cov_array, sizeof(u_int64_t) * cov_array_len);
 }
\ No newline at end of file
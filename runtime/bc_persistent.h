@@ -0,0 +1,120 @@
+// Persistent mode, shared by the runtimes. A harness that supports it runs
+// its body in a loop:
+//
+//   while (__bc_cov_loop())
+//   {
+//     // read the input from stdin and process it
+//   }
+//
+// Without a driver the loop body runs exactly once on the original stdin.
+// When started by bccov's PersistentRunner (BC_COV_CTL_FD and BC_COV_ST_FD
+// set) every call hands the coverage of the previous iteration to the
+// driver and waits for the next input:
+//
+//   runtime: write coverage to BC_COV_FILE, write a 4 byte status
+//   driver:  read the coverage, write a 4 byte path length and the path
+//   runtime: zero the counters, open the path as stdin, run the body
+//
+// A zero length or a closed control pipe ends the loop. The first call hands
+// over the coverage of everything that ran before the loop. The harness must
+// be single threaded while it loops.
+//
+// The including runtime defines bc_persistent_write() and
+// bc_persistent_reset().
+
+#include <limits.h>
+#include <stdio_ext.h>
+
+static void bc_persistent_write(void);
+static void bc_persistent_reset(void);
+
+static int bc_loop_calls = 0;
+static int bc_ctl_fd = -1;
+static int bc_st_fd = -1;
+
+static int bc_read_full(int fd, void *data, size_t size)
+{
+  char *p = (char *)data;
+  while (size > 0)
+  {
+    ssize_t n = read(fd, p, size);
+    if (n <= 0)
+    {
+      if (n == -1 && errno == EINTR)
+        continue;
+      return 0;
+    }
+    p += n;
+    size -= n;
+  }
+  return 1;
+}
+
+static int bc_write_full(int fd, const void *data, size_t size)
+{
+  const char *p = (const char *)data;
+  while (size > 0)
+  {
+    ssize_t n = write(fd, p, size);
+    if (n <= 0)
+    {
+      if (n == -1 && errno == EINTR)
+        continue;
+      return 0;
+    }
+    p += n;
+    size -= n;
+  }
+  return 1;
+}
+
+int __bc_cov_loop(void)
+{
+  if (bc_loop_calls++ == 0)
+  {
+    char *ctl_fd = getenv("BC_COV_CTL_FD");
+    char *st_fd = getenv("BC_COV_ST_FD");
+    if (ctl_fd == NULL || st_fd == NULL)
+    {
+      // not driven, behave like a single run
+      return 1;
+    }
+    bc_ctl_fd = atoi(ctl_fd);
+    bc_st_fd = atoi(st_fd);
+  }
+  if (bc_ctl_fd == -1)
+  {
+    return 0;
+  }
+
+  bc_persistent_write();
+  uint32_t status = 0;
+  if (!bc_write_full(bc_st_fd, &status, sizeof(status)))
+  {
+    return 0;
+  }
+
+  uint32_t len = 0;
+  char path[PATH_MAX];
+  if (!bc_read_full(bc_ctl_fd, &len, sizeof(len)) || len == 0 || len >= PATH_MAX ||
+      !bc_read_full(bc_ctl_fd, path, len))
+  {
+    return 0;
+  }
+  path[len] = '\0';
+
+  // only now, the driver has read the coverage file
+  bc_persistent_reset();
+
+  int input_fd = open(path, O_RDONLY | O_CLOEXEC);
+  if (input_fd == -1)
+  {
+    err(1, "open %s", path);
+  }
+  dup2(input_fd, STDIN_FILENO);
+  close(input_fd);
+  // drop whatever stdio buffered from the previous input
+  __fpurge(stdin);
+  clearerr(stdin);
+  return 1;
+}
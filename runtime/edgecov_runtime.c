@@ -0,0 +1,148 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/types.h>
+#include <unistd.h>
+#include <signal.h>
+#include <stdint.h>
+#include <errno.h>
+#include <err.h>
+#include <fcntl.h>
+#include <pthread.h>
+
+// must match EDGE_MAP_SIZE in CovInstrument.cpp
+#define BC_EDGE_MAP_SIZE (1 << 16)
+
+// updated inline by the -edgecov instrumentation, map[prev_loc ^ cur_loc]++
+uint8_t __bc_edge_map[BC_EDGE_MAP_SIZE];
+__thread uint32_t __bc_edge_prev_loc;
+
+int done = 0;
+// forked children dump to "<BC_COV_FILE>.<pid>"
+char *base_cov_file = NULL;
+char *cov_file_path = NULL;
+
+void bc_cov_set_signal_handler();
+void bc_dump_cov();
+#ifdef GRILLER
+void grill_hook_destroy();
+#endif
+
+void bc_fork_child()
+{
+  // the child starts from an empty map so the parent and child maps add up
+  memset(__bc_edge_map, 0, BC_EDGE_MAP_SIZE);
+  size_t len = strlen(base_cov_file) + 16;
+  cov_file_path = malloc(len);
+  snprintf(cov_file_path, len, "%s.%d", base_cov_file, getpid());
+}
+
+__attribute__((constructor)) void bc_init_cov(void)
+{
+  char *bc_cov_file = getenv("BC_COV_FILE");
+  if (bc_cov_file == NULL)
+  {
+    bc_cov_file = "default.bc_cov";
+  }
+#ifdef DEBUG
+  printf("bc_cov_file: %s\n", bc_cov_file);
+#endif
+  // the map is only written out at exit, keep the path around for it
+  base_cov_file = cov_file_path = strdup(bc_cov_file);
+  if (access(cov_file_path, F_OK) != -1)
+  {
+    remove(cov_file_path);
+  }
+
+  bc_cov_set_signal_handler();
+  pthread_atfork(NULL, NULL, bc_fork_child);
+
+  char *bc_cov_timeout = getenv("BC_COV_TIMEOUT");
+  if (bc_cov_timeout != NULL && atoi(bc_cov_timeout) > 0)
+  {
+    alarm(atoi(bc_cov_timeout));
+  }
+}
+
+static uint8_t alternate_stack[SIGSTKSZ];
+
+void bc_cov_set_signal_handler()
+{
+  /* setup alternate stack */
+  {
+    stack_t ss = {};
+    ss.ss_sp = (void *)alternate_stack;
+    ss.ss_size = SIGSTKSZ;
+    ss.ss_flags = 0;
+
+    if (sigaltstack(&ss, NULL) != 0)
+    {
+      err(1, "sigaltstack");
+    }
+  }
+
+  /* register our signal handlers */
+  {
+    struct sigaction sig_action = {};
+    sig_action.sa_sigaction = bc_dump_cov;
+    sigemptyset(&sig_action.sa_mask);
+
+    sig_action.sa_flags = SA_SIGINFO | SA_ONSTACK;
+
+    int signals[] = {SIGALRM, SIGSEGV, SIGFPE, SIGINT, SIGILL, SIGTERM, SIGABRT};
+    for (unsigned int i = 0; i < sizeof(signals) / sizeof(signals[0]); i++)
+    {
+      if (sigaction(signals[i], &sig_action, NULL) != 0)
+      {
+        err(1, "sigaction");
+      }
+    }
+  }
+}
+
+void bc_write_map()
+{
+  // only async-signal-safe calls, this also runs from the signal handlers
+  int fd = open(cov_file_path, O_CREAT | O_WRONLY | O_TRUNC, 0666);
+  if (fd == -1)
+  {
+    return;
+  }
+  size_t written = 0;
+  while (written < BC_EDGE_MAP_SIZE)
+  {
+    ssize_t n = write(fd, __bc_edge_map + written, BC_EDGE_MAP_SIZE - written);
+    if (n <= 0)
+    {
+      if (n == -1 && errno == EINTR)
+        continue;
+      break;
+    }
+    written += n;
+  }
+  close(fd);
+}
+
+__attribute__((destructor)) void bc_dump_cov()
+{
+  if (done == 1) exit(-1);
+  done = 1;
+#ifdef GRILLER
+  grill_hook_destroy();
+#endif
+  bc_write_map();
+  exit(-1);
+}
+
+#include "bc_persistent.h"
+
+static void bc_persistent_write(void)
+{
+  bc_write_map();
+}
+
+static void bc_persistent_reset(void)
+{
+  memset(__bc_edge_map, 0, BC_EDGE_MAP_SIZE);
+  __bc_edge_prev_loc = 0;
+}
@@ -1,30 +1,149 @@
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
 #include <sys/types.h>
 #include <unistd.h>
 #include <signal.h>
 #include <assert.h>
-#include <stdlib.h>
 #include <stdbool.h>
 #include <stdint.h>
 #include <errno.h>
 #include <err.h>
 #include <execinfo.h>
-#include <sys/mman.h>
 #include <fcntl.h>
+#include <pthread.h>
+#include <time.h>
 
 int done = 0;
-int fd = 0;
-int curr_offset = 0;
-char *map = NULL;
+int fd = -1;
+
+// BC_COV_FILE as given, forked children write to "<base>.<pid>"
+char *base_cov_file = NULL;
 
 void bc_cov_set_signal_handler();
 void bc_dump_cov();
+void bc_dump_cov_signal(int sig, siginfo_t *info, void *context);
 #ifdef GRILLER
 void grill_hook_destroy();
 #endif
 
-#define MAX_FILE_SIZE 10000
+// every thread appends to its own buffer and flushes it with a single
+// O_APPEND write, so threads never interleave inside a record. A buffer is
+// flushed when it is full and, while its thread records, at least every
+// TRACE_FLUSH_NS, so a SIGKILL only loses the last few milliseconds of trace
+#define TRACE_BUF_ENTRIES 4096
+#define TRACE_CHECK_EVERY 64
+#define TRACE_FLUSH_NS (10 * 1000 * 1000)
+
+struct bc_trace_buf
+{
+  struct bc_trace_buf *next;
+  uint32_t len;
+  uint64_t last_flush;
+  uint32_t ids[TRACE_BUF_ENTRIES];
+};
+
+// all thread buffers, pushed lock-free so the signal handler can walk it
+struct bc_trace_buf *trace_bufs = NULL;
+__thread struct bc_trace_buf *thread_buf = NULL;
+// flushes a thread's buffer when the thread exits
+pthread_key_t trace_buf_key;
+
+// with -tracepc-guard every block has a guard byte and bc_cov is only
+// called on its first hit, the pass registers the guards from a constructor
+uint8_t *bc_guards = NULL;
+uint32_t bc_num_guards = 0;
+
+void bc_cov_register_guards(uint8_t *guards, uint32_t num_guards)
+{
+  bc_guards = guards;
+  bc_num_guards = num_guards;
+}
+
+void bc_reset_guards()
+{
+  if (bc_guards != NULL)
+  {
+    memset(bc_guards, 0, bc_num_guards);
+  }
+}
+
+int bc_open_cov_file(const char *path)
+{
+  int cov_fd = open(path, O_CREAT | O_WRONLY | O_TRUNC | O_APPEND | O_CLOEXEC, 0666);
+  if (cov_fd == -1)
+  {
+    perror("Error opening file");
+    exit(-1);
+  }
+  return cov_fd;
+}
+
+uint64_t bc_now()
+{
+  struct timespec ts;
+  clock_gettime(CLOCK_MONOTONIC_COARSE, &ts);
+  return (uint64_t)ts.tv_sec * 1000000000 + ts.tv_nsec;
+}
+
+void bc_flush_buf(struct bc_trace_buf *buf)
+{
+  // take the entries before writing them, a signal that arrives during the
+  // write then cannot flush them a second time
+  size_t size = buf->len * sizeof(uint32_t);
+  buf->len = 0;
+  __atomic_signal_fence(__ATOMIC_SEQ_CST);
+  char *data = (char *)buf->ids;
+  while (size > 0)
+  {
+    ssize_t n = write(fd, data, size);
+    if (n <= 0)
+    {
+      if (n == -1 && errno == EINTR)
+        continue;
+      break;
+    }
+    data += n;
+    size -= n;
+  }
+  buf->last_flush = bc_now();
+}
+
+void bc_thread_exit(void *buf)
+{
+  bc_flush_buf((struct bc_trace_buf *)buf);
+}
+
+struct bc_trace_buf *bc_new_buf()
+{
+  struct bc_trace_buf *buf = calloc(1, sizeof(struct bc_trace_buf));
+  if (buf == NULL)
+  {
+    err(1, "calloc");
+  }
+  buf->last_flush = bc_now();
+  pthread_setspecific(trace_buf_key, buf);
+  buf->next = __atomic_load_n(&trace_bufs, __ATOMIC_ACQUIRE);
+  while (!__atomic_compare_exchange_n(&trace_bufs, &buf->next, buf, false, __ATOMIC_RELEASE, __ATOMIC_ACQUIRE))
+    ;
+  return buf;
+}
+
+void bc_fork_child()
+{
+  // the buffers hold the parent's trace, the parent flushes them itself
+  for (struct bc_trace_buf *buf = trace_bufs; buf != NULL; buf = buf->next)
+  {
+    buf->len = 0;
+  }
+  // the child records its own first hits
+  bc_reset_guards();
+
+  char path[4096];
+  snprintf(path, sizeof(path), "%s.%d", base_cov_file, getpid());
+  close(fd);
+  fd = bc_open_cov_file(path);
+}
 
 __attribute__((constructor)) void bc_init_cov(void) {
   char *bc_cov_file = getenv("BC_COV_FILE");
@@ -35,36 +154,12 @@ __attribute__((constructor)) void bc_init_cov(void) {
 #ifdef DEBUG
   printf("bc_cov_file: %s\n", bc_cov_file);
 #endif
-  // open the file
-  // if the file exists, delete it
-  if (access(bc_cov_file, F_OK) != -1)
-  {
-    remove(bc_cov_file);
-  }
+  base_cov_file = strdup(bc_cov_file);
 
   bc_cov_set_signal_handler();
-  
-  fd = open(bc_cov_file, O_CREAT | O_RDWR, 0666);
-  if (fd == -1) {
-      perror("Error opening file");
-      exit(-1);
-      return;
-  }
-
-  if (ftruncate(fd, MAX_FILE_SIZE) == -1) {
-      perror("Error setting file size");
-      close(fd);
-      exit(-1);
-      return;
-  }
-
-  map = mmap(0, MAX_FILE_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
-  if (map == MAP_FAILED) {
-      perror("Error mapping file");
-      close(fd);
-      exit(-1);
-      return; 
-  }
+  fd = bc_open_cov_file(base_cov_file);
+  pthread_key_create(&trace_buf_key, bc_thread_exit);
+  pthread_atfork(NULL, NULL, bc_fork_child);
 }
 
 #define PATHMAX 100
@@ -90,7 +185,7 @@ void bc_cov_set_signal_handler()
   /* register our signal handlers */
   {
     struct sigaction sig_action = {};
-    sig_action.sa_sigaction = bc_dump_cov;
+    sig_action.sa_sigaction = bc_dump_cov_signal;
     sigemptyset(&sig_action.sa_mask);
 
     sig_action.sa_flags = SA_SIGINFO | SA_ONSTACK;
@@ -122,6 +217,16 @@ void bc_cov_set_signal_handler()
   }
 }
 
+// only at exit and between persistent mode iterations, other threads may
+// still be appending to their buffers
+void bc_flush_all()
+{
+  for (struct bc_trace_buf *buf = __atomic_load_n(&trace_bufs, __ATOMIC_ACQUIRE); buf != NULL; buf = buf->next)
+  {
+    bc_flush_buf(buf);
+  }
+}
+
 __attribute__((destructor)) void bc_dump_cov()
 {
   if (done == 1) exit(-1);
@@ -129,17 +234,57 @@ __attribute__((destructor)) void bc_dump_cov()
 #ifdef GRILLER
   grill_hook_destroy();
 #endif
-  if (msync(map, MAX_FILE_SIZE, MS_SYNC) == -1) {
-      perror("Error syncing file");
-  }
-  if (munmap(map, MAX_FILE_SIZE) == -1) {
-      perror("Error unmapping file");
+  bc_flush_all();
+  close(fd);
+  exit(-1);
+}
+
+void bc_dump_cov_signal(int sig, siginfo_t *info, void *context)
+{
+  if (done == 1) exit(-1);
+  done = 1;
+#ifdef GRILLER
+  grill_hook_destroy();
+#endif
+  // the other threads are still running, their buffers were flushed at most
+  // TRACE_FLUSH_NS ago
+  if (thread_buf != NULL)
+  {
+    bc_flush_buf(thread_buf);
   }
   close(fd);
   exit(-1);
 }
 
+#include "bc_persistent.h"
+
+static void bc_persistent_write(void)
+{
+  bc_flush_all();
+}
+
+static void bc_persistent_reset(void)
+{
+  // the trace file is opened O_APPEND, the next iteration writes from 0
+  if (ftruncate(fd, 0) == -1)
+  {
+    err(1, "ftruncate");
+  }
+  bc_reset_guards();
+}
+
 
 void bc_cov(uint32_t bbid) {
-  ((int *) map)[curr_offset++] = bbid;
-}
\ No newline at end of file
+  struct bc_trace_buf *buf = thread_buf;
+  if (buf == NULL)
+  {
+    buf = thread_buf = bc_new_buf();
+  }
+  buf->ids[buf->len] = bbid;
+  buf->len++;
+  if (buf->len == TRACE_BUF_ENTRIES ||
+      (buf->len % TRACE_CHECK_EVERY == 0 && bc_now() - buf->last_flush >= TRACE_FLUSH_NS))
+  {
+    bc_flush_buf(buf);
+  }
+}
@@ -0,0 +1,31 @@
+import pytest
+
+from bccov.coverage import empty_stats_state, load_stats_state, save_stats_state
+
+
+@pytest.fixture(autouse=True)
+def stats_state():
+    """Every test starts with empty coverage stats and leaves none behind"""
+    previous = save_stats_state()
+    load_stats_state(empty_stats_state())
+    yield
+    load_stats_state(previous)
+
+
+def make_cov_info(functions: dict) -> dict:
+    """
+    bbcov cov_info for {(file, function): [lines per block]}, with a line per
+    block given as an int.
+    """
+    cov_info = {}
+    for (file_name, func_name), blocks in functions.items():
+        cov_info.setdefault(file_name, []).append(
+            {
+                "Function": func_name,
+                "BasicBlocks": [
+                    {"Id": i, "Coverage": [{"File": file_name, "Line": line}]}
+                    for i, line in enumerate(blocks)
+                ],
+            }
+        )
+    return cov_info
@@ -0,0 +1,83 @@
+import json
+
+from bccov.cache import CACHE_VERSION, CoverageCache, decode_coverage, encode_coverage
+from bccov.lruntime import RunResult
+
+RESULT = RunResult(0, False, 0.1)
+
+
+def make_cache(tmp_path, binary_contents="binary", mode="bbcov"):
+    binary = tmp_path / f"binary-{binary_contents}"
+    binary.write_text(binary_contents)
+    return CoverageCache(tmp_path / "cache", binary, mode)
+
+
+def make_input(tmp_path, contents):
+    input_file = tmp_path / f"input-{contents}"
+    input_file.write_text(contents)
+    return input_file
+
+
+def test_cache_hit_and_miss(tmp_path):
+    cache = make_cache(tmp_path)
+    input_file = make_input(tmp_path, "a")
+    coverage = {"a.c": {"f": [1, 0, 3], "g": [0, 0]}, "b.c": {"h": [0]}}
+
+    assert cache.get(input_file) is None
+    cache.put(input_file, coverage, RESULT)
+    entry = cache.get(input_file)
+    # functions that did not run are not stored
+    assert entry.coverage == {"a.c": {"f": [1, 0, 3]}}
+    assert entry.result == RESULT
+    # keyed by the input contents, not its name
+    assert cache.get(make_input(tmp_path, "b")) is None
+    renamed = tmp_path / "renamed"
+    renamed.write_text("a")
+    assert cache.get(renamed) is not None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_cache_is_keyed_by_binary(tmp_path):
+    input_file = make_input(tmp_path, "a")
+    old = make_cache(tmp_path, "old")
+    old.put(input_file, {"a.c": {"f": [1]}}, RESULT)
+    new = make_cache(tmp_path, "new")
+    assert new.dir != old.dir
+    assert new.get(input_file) is None
+    assert make_cache(tmp_path, "old").get(input_file) is not None
+
+
+def test_cache_skips_timeouts_and_missing_coverage(tmp_path):
+    cache = make_cache(tmp_path)
+    timed_out = make_input(tmp_path, "slow")
+    cache.put(timed_out, {"a.c": {"f": [1]}}, RunResult(-15, True, 5.0))
+    no_coverage = make_input(tmp_path, "crash")
+    cache.put(no_coverage, None, RunResult(-9, False, 0.1))
+    assert list(cache.dir.glob("*.json")) == []
+    assert cache.get(timed_out) is None
+    assert cache.get(no_coverage) is None
+
+
+def test_cache_rejects_other_modes_and_versions(tmp_path):
+    input_file = make_input(tmp_path, "a")
+    make_cache(tmp_path, mode="tracepc").put(input_file, [1, 2, 1], RESULT)
+    assert make_cache(tmp_path, mode="tracepc").get(input_file).coverage == [1, 2, 1]
+    assert make_cache(tmp_path, mode="bbcov").get(input_file) is None
+
+    cache = make_cache(tmp_path, mode="tracepc")
+    path = next(cache.dir.glob("*.json"))
+    entry = json.loads(path.read_text())
+    entry["version"] = CACHE_VERSION - 1
+    path.write_text(json.dumps(entry))
+    assert cache.get(input_file) is None
+
+    path.write_text("{")
+    assert cache.get(input_file) is None
+
+
+def test_encode_coverage_round_trip():
+    coverage = {"a.c": {"f": [0, 5, 0, 0, 2**40]}}
+    encoded = encode_coverage(coverage, "bbcov")
+    assert encoded == {"a.c": {"f": [5, [[1, 5], [4, 2**40]]]}}
+    assert decode_coverage(json.loads(json.dumps(encoded)), "bbcov") == coverage
+    assert encode_coverage([3, 1], "tracepc") == [3, 1]
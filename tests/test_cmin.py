@@ -0,0 +1,48 @@
+import pathlib
+
+from bccov.cmin import Candidate, coverage_blocks, minimize
+
+
+def candidate(name, blocks, weight=1.0):
+    return Candidate(pathlib.Path(name), frozenset(blocks), weight)
+
+
+def test_coverage_blocks_modes():
+    assert coverage_blocks(None) == frozenset()
+    assert coverage_blocks({"a.c": {"f": [0, 3, 1]}}, "bbcov") == {
+        ("a.c", "f", 1),
+        ("a.c", "f", 2),
+    }
+    assert coverage_blocks([4, 2, 4], "tracepc") == {2, 4}
+    assert coverage_blocks([[7, 1], [9, 255]], "edgecov") == {7, 9}
+
+
+def test_minimize_keeps_every_block():
+    candidates = [
+        candidate("a", {1, 2, 3}),
+        candidate("b", {1, 2}),
+        candidate("c", {3, 4}),
+        candidate("d", {4}),
+        candidate("empty", set()),
+    ]
+    chosen = minimize(candidates)
+    covered = set().union(*(c.blocks for c in chosen))
+    assert covered == {1, 2, 3, 4}
+    assert [c.input_file.name for c in chosen] == ["a", "c"]
+
+
+def test_minimize_prefers_cheaper_inputs():
+    candidates = [
+        candidate("big", {1, 2, 3, 4}, weight=100.0),
+        candidate("small1", {1, 2}, weight=1.0),
+        candidate("small2", {3, 4}, weight=1.0),
+    ]
+    assert sorted(c.input_file.name for c in minimize(candidates)) == [
+        "small1",
+        "small2",
+    ]
+
+
+def test_minimize_skips_redundant_inputs():
+    candidates = [candidate("a", {1, 2}), candidate("b", {1}), candidate("c", {2})]
+    assert [c.input_file.name for c in minimize(candidates)] == ["a"]
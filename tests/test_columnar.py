@@ -0,0 +1,86 @@
+import pathlib
+
+from bccov import columnar
+from bccov.columnar import (
+    ColumnarReader,
+    build_sections,
+    is_columnar_dump,
+    load_columnar_cov_map,
+    load_function_cov_map,
+    write_sections,
+)
+from bccov.coverage import BBCovCoverageStats, CoverageDetails, Function, LineDetails
+
+
+def make_cov_map():
+    def bb(id, count, lines, file_name="a.c"):
+        return CoverageDetails(
+            count, id, [LineDetails(file_name, l) for l in lines], []
+        )
+
+    return {
+        Function("parse", "a.c"): [bb(0, 3, [10, 11]), bb(1, 0, [12]), bb(2, 7, [])],
+        Function("main", "b.c"): [bb(0, 1, [5], "b.c"), bb(1, 2**40, [6, 7], "b.c")],
+    }
+
+
+def as_plain(cov_map):
+    return {
+        f: [
+            (bb.id, bb.coverage_index, [tuple(l) for l in bb.line_details])
+            for bb in func
+        ]
+        for f, func in cov_map.items()
+    }
+
+
+def dump(cov_map, tmp_path) -> pathlib.Path:
+    dump_file = tmp_path / "cov.bin"
+    write_sections(build_sections(cov_map), dump_file)
+    return dump_file
+
+
+def test_columnar_round_trip(tmp_path):
+    cov_map = make_cov_map()
+    dump_file = dump(cov_map, tmp_path)
+    assert is_columnar_dump(dump_file)
+
+    loaded = load_columnar_cov_map(dump_file)
+    assert loaded is BBCovCoverageStats.COV_MAP
+    assert as_plain(loaded) == as_plain(cov_map)
+
+
+def test_columnar_empty_cov_map(tmp_path):
+    assert load_columnar_cov_map(dump({}, tmp_path)) == {}
+
+
+def test_load_function_cov_map(tmp_path):
+    cov_map = make_cov_map()
+    dump_file = dump(cov_map, tmp_path)
+
+    loaded = load_function_cov_map(dump_file, ["main", "missing"])
+    assert loaded is BBCovCoverageStats.COV_MAP
+    assert as_plain(loaded) == {
+        Function("main", "b.c"): as_plain(cov_map)[Function("main", "b.c")]
+    }
+
+
+def test_load_function_cov_map_hash_collisions(tmp_path, monkeypatch):
+    # every name lands in the same index bucket, the loader has to compare names
+    monkeypatch.setattr(columnar, "name_hash", lambda name: 42)
+    cov_map = make_cov_map()
+    cov_map[Function("parse", "c.c")] = [
+        CoverageDetails(1, 0, [LineDetails("c.c", 1)], [])
+    ]
+    dump_file = dump(cov_map, tmp_path)
+
+    reader = ColumnarReader(dump_file)
+    try:
+        assert sorted(reader.find_functions("parse")) == [0, 1, 2]
+    finally:
+        reader.close()
+
+    loaded = load_function_cov_map(dump_file, ["parse"])
+    assert as_plain(loaded) == {
+        f: func for f, func in as_plain(cov_map).items() if f.name == "parse"
+    }
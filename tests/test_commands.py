@@ -0,0 +1,60 @@
+import argparse
+import signal
+import time
+
+from bccov.cache import CoverageCache
+from bccov.utils.commands import run_with_timeout
+import bccov.main as main
+
+
+def test_run_with_timeout_finishes():
+    stdout, _, returncode, timed_out = run_with_timeout(["echo", "hi"], timeout=5)
+    assert (stdout, returncode, timed_out) == ("hi\n", 0, False)
+
+
+def test_run_with_timeout_terminates():
+    start = time.monotonic()
+    _, _, returncode, timed_out = run_with_timeout(
+        ["sleep", "10"], timeout=0.2, kill_timeout=5
+    )
+    assert timed_out
+    assert returncode == -signal.SIGTERM
+    assert time.monotonic() - start < 5
+
+
+def test_run_with_timeout_kills_what_ignores_sigterm():
+    start = time.monotonic()
+    _, _, returncode, timed_out = run_with_timeout(
+        ["sh", "-c", "trap '' TERM; sleep 10"], timeout=0.2, kill_timeout=0.2
+    )
+    assert timed_out
+    assert returncode == -signal.SIGKILL
+    assert time.monotonic() - start < 5
+
+
+def test_timed_out_inputs_are_recorded(tmp_path, monkeypatch):
+    binary = tmp_path / "target"
+    binary.write_text("#!/bin/sh\nsleep 10\n")
+    binary.chmod(0o755)
+    input_file = tmp_path / "in0"
+    input_file.write_text("x")
+    monkeypatch.setattr(main, "TIMED_OUT_INPUTS", [])
+    monkeypatch.setattr(
+        main, "CACHE", CoverageCache(tmp_path / "cache", binary, "bbcov")
+    )
+    args = argparse.Namespace(
+        timeout=0.2, kill_timeout=0.2, output_file=tmp_path / "out"
+    )
+
+    for _ in range(2):
+        coverage, result = main.execute_input(
+            args, binary, tmp_path / "cov", input_file, "bbcov"
+        )
+        assert coverage is None
+        assert result.timed_out
+    # timed out runs are not cached, so the input ran and timed out twice
+    assert main.CACHE.hits == 0
+    assert main.TIMED_OUT_INPUTS == [input_file, input_file]
+
+    main.report_timeouts(args)
+    assert (tmp_path / "out.timeouts").read_text() == f"{input_file}\n" * 2
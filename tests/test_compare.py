@@ -0,0 +1,85 @@
+import json
+import pathlib
+
+from bccov.compare import CompilerComparison, Divergence, Variant
+from bccov.coverage import parse_cov_info_file
+
+INPUTS = [pathlib.Path(f"in{i}") for i in range(3)]
+
+
+def make_comparison(num_variants=2):
+    comparison = CompilerComparison(
+        [Variant(f"cc{v}", pathlib.Path(f"bin{v}")) for v in range(num_variants)]
+    )
+    for input_file in INPUTS:
+        comparison.add_input(input_file)
+    return comparison
+
+
+def test_diverging():
+    comparison = make_comparison()
+    keys_by_input = [
+        [frozenset({1, 2}), frozenset({1, 2})],
+        [frozenset({1, 3}), frozenset({1})],
+        [frozenset({2}), frozenset({2, 3, 4})],
+    ]
+    assert comparison.diverging(keys_by_input) == [
+        Divergence(3, [1, 1], [INPUTS[1], INPUTS[2]]),
+        Divergence(4, [0, 1], [INPUTS[2]]),
+    ]
+
+
+def test_diverging_needs_the_same_input():
+    # both variants reach 5, but never on the same input
+    comparison = make_comparison()
+    keys_by_input = [
+        [frozenset({5}), frozenset()],
+        [frozenset(), frozenset({5})],
+        [frozenset(), frozenset()],
+    ]
+    assert comparison.diverging(keys_by_input) == [
+        Divergence(5, [1, 1], [INPUTS[0], INPUTS[1]])
+    ]
+
+
+def test_diverging_three_variants():
+    comparison = make_comparison(3)
+    keys_by_input = [[frozenset({1}), frozenset({1}), frozenset({1})]] * 3
+    assert comparison.diverging(keys_by_input) == []
+    keys_by_input = [[frozenset({1}), frozenset({1}), frozenset()]] * 3
+    assert comparison.diverging(keys_by_input) == [Divergence(1, [3, 3, 0], INPUTS)]
+
+
+def test_block_line_and_exit_divergence(tmp_path):
+    cov_info_file = tmp_path / "cov_info.json"
+    cov_info_file.write_text(
+        json.dumps(
+            {
+                "BasicBlock": [
+                    {"Id": i, "Coverage": [{"File": "a.c", "Line": line}]}
+                    for i, line in enumerate([1, 2, 2])
+                ]
+            }
+        )
+    )
+    parse_cov_info_file(cov_info_file, mode="tracepc")
+
+    comparison = make_comparison()
+    comparison.record(0, 0, [0, 1, 1, 0], 0)
+    comparison.record(1, 0, [0, 2], 0)
+    comparison.record(0, 1, [0], 0)
+    comparison.record(1, 1, [0], -11)
+    # input 2 never finished in either variant
+
+    assert comparison.block_divergence() == [
+        Divergence(1, [1, 0], [INPUTS[0]]),
+        Divergence(2, [0, 1], [INPUTS[0]]),
+    ]
+    # blocks 1 and 2 share line 2, so the lines agree
+    assert comparison.line_divergence() == []
+    assert comparison.exit_divergence() == [(INPUTS[1], [0, -11])]
+
+    report = comparison.report()
+    assert [b["id"] for b in report["blocks"]] == [1, 2]
+    assert report["blocks"][0]["lines"] == ["a.c:2"]
+    assert report["blocks"][0]["reached"] == {"cc0": 1, "cc1": 0}
@@ -0,0 +1,145 @@
+import json
+import pathlib
+
+from conftest import make_cov_info
+import pytest
+
+from bccov.coverage import (
+    BBCovCoverageStats,
+    Edge,
+    EdgeCoverageStats,
+    Function,
+    parse_cov_info_file,
+    read_edgecov_coverage_file,
+)
+
+MAP_SIZE = 64
+
+
+def edge_index(src_location, dst_location):
+    return (src_location >> 1) ^ dst_location
+
+
+def load_edgecov_cov_info(tmp_path, blocks):
+    """blocks: [(location, entry, successor ids)], the function is f"""
+    cov_info = {
+        "MapSize": MAP_SIZE,
+        "BasicBlock": [
+            {
+                "Id": i,
+                "Function": "f",
+                "Location": location,
+                "Entry": entry,
+                "Successors": successors,
+                "Coverage": [{"File": "a.c", "Line": 10 + i}],
+            }
+            for i, (location, entry, successors) in enumerate(blocks)
+        ],
+    }
+    cov_info_file = tmp_path / "cov_info.json"
+    cov_info_file.write_text(json.dumps(cov_info))
+    parse_cov_info_file(cov_info_file, mode="edgecov")
+
+
+def write_edge_map(path, hits):
+    data = bytearray(MAP_SIZE)
+    for index, count in hits.items():
+        data[index] = count
+    path.write_bytes(bytes(data))
+    return path
+
+
+# 0 -> 1 -> 3, 0 -> 2 -> 3
+DIAMOND = [(2, True, [1, 2]), (8, False, [3]), (16, False, [3]), (32, False, [])]
+
+
+def test_edge_index(tmp_path):
+    load_edgecov_cov_info(tmp_path, DIAMOND)
+    index = EdgeCoverageStats.EDGE_INDEX
+    assert index[2] == [Edge(None, 0)]
+    assert index[edge_index(2, 8)] == [Edge(0, 1)]
+    assert index[edge_index(8, 32)] == [Edge(1, 3)]
+    assert index[edge_index(16, 32)] == [Edge(2, 3)]
+    assert EdgeCoverageStats.MAP_SIZE == MAP_SIZE
+
+
+def test_read_edgecov_coverage_file(tmp_path):
+    cov_file = write_edge_map(tmp_path / "map", {0: 1, 5: 255, 63: 2})
+    assert read_edgecov_coverage_file(cov_file) == [[0, 1], [5, 255], [63, 2]]
+
+
+def test_add_cov_map(tmp_path):
+    load_edgecov_cov_info(tmp_path, DIAMOND)
+    first, second = pathlib.Path("first"), pathlib.Path("second")
+    hits = {2: 1, edge_index(2, 8): 1, edge_index(2, 16): 1}
+    hits[edge_index(8, 32)] = 3
+    hits[edge_index(16, 32)] = 5
+    EdgeCoverageStats.add_cov_map(
+        read_edgecov_coverage_file(write_edge_map(tmp_path / "map1", hits)), first
+    )
+    EdgeCoverageStats.add_cov_map([[2, 4]], second)
+
+    blocks = EdgeCoverageStats.COV_MAP
+    assert [bb.coverage_index for bb in blocks.values()] == [4, 1, 1, 5]
+    # block 3 is reached by two edges of the first input, it is credited once
+    assert blocks[3].files == [first]
+    assert blocks[0].files == [first, second]
+    assert EdgeCoverageStats.EDGE_HITS[Edge(2, 3)] == 5
+    assert EdgeCoverageStats.EDGE_HITS[Edge(None, 0)] == 4
+    assert EdgeCoverageStats.UNMAPPED == set()
+
+
+def test_add_cov_map_unmapped_and_collisions(tmp_path):
+    # 1 -> 2 and 3 -> 2 hash to the same index
+    load_edgecov_cov_info(
+        tmp_path, [(2, True, [1]), (4, False, [2]), (1, False, []), (5, False, [2])]
+    )
+    assert edge_index(4, 1) == edge_index(5, 1)
+    unmapped = 63
+    assert unmapped not in EdgeCoverageStats.EDGE_INDEX
+
+    EdgeCoverageStats.add_cov_map([[edge_index(4, 1), 2], [unmapped, 1]], "input")
+    assert EdgeCoverageStats.UNMAPPED == {unmapped}
+    assert EdgeCoverageStats.EDGE_HITS == {Edge(1, 2): 2, Edge(3, 2): 2}
+    assert EdgeCoverageStats.COV_MAP[2].files == ["input"]
+    assert EdgeCoverageStats.COV_MAP[2].coverage_index == 2
+    assert EdgeCoverageStats.COV_MAP[0].coverage_index == 0
+
+
+def load_bbcov(tmp_path, aggregate):
+    cov_info_file = tmp_path / "cov_info.json"
+    cov_info_file.write_text(json.dumps(make_cov_info({("a.c", "f"): [1, 2, 3]})))
+    parse_cov_info_file(cov_info_file, mode="bbcov")
+    BBCovCoverageStats.set_aggregate_mode(aggregate)
+    for i, counts in enumerate([[1, 0, 5], [3, 0, 1], [2, 0, 0]]):
+        BBCovCoverageStats.add_cov_map({"a.c": {"f": counts}}, f"in{i}")
+    return BBCovCoverageStats.COV_MAP[Function("f", "a.c")]
+
+
+def test_aggregate_max(tmp_path):
+    func = load_bbcov(tmp_path, "max")
+    assert [bb.coverage_index for bb in func] == [3, 0, 5]
+    assert [bb.files for bb in func] == [["in0", "in1", "in2"], [], ["in0", "in1"]]
+    assert BBCovCoverageStats.HISTOGRAMS == {}
+
+
+def test_aggregate_sum(tmp_path):
+    func = load_bbcov(tmp_path, "sum")
+    assert [bb.coverage_index for bb in func] == [6, 0, 6]
+    assert BBCovCoverageStats.HISTOGRAMS == {}
+
+
+def test_aggregate_hist(tmp_path):
+    func = load_bbcov(tmp_path, "hist")
+    assert [bb.coverage_index for bb in func] == [6, 0, 6]
+    f = Function("f", "a.c")
+    # bucket b counts the inputs that ran the block [2 ** (b - 1), 2 ** b) times
+    assert BBCovCoverageStats.HISTOGRAMS == {
+        (f, 0): {1: 1, 2: 2},
+        (f, 2): {3: 1, 1: 1},
+    }
+
+
+def test_aggregate_mode_is_checked():
+    with pytest.raises(AssertionError):
+        BBCovCoverageStats.set_aggregate_mode("mean")
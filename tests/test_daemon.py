@@ -0,0 +1,64 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from bccov.daemon import CoverageDaemon, query, serve
+
+
+def fake_daemon(socket_path, reply: bytes):
+    """Accepts one query and answers it with reply before hanging up"""
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(socket_path))
+    server.listen(1)
+
+    def answer():
+        conn, _ = server.accept()
+        with conn:
+            conn.makefile("rb").readline()
+            conn.sendall(reply)
+        server.close()
+
+    thread = threading.Thread(target=answer)
+    thread.start()
+    return thread
+
+
+def test_query_round_trip(tmp_path):
+    socket_path = tmp_path / "daemon.sock"
+    daemon = CoverageDaemon(run_new_inputs=lambda: 3)
+    thread = threading.Thread(target=serve, args=(socket_path, daemon))
+    thread.start()
+    try:
+        while daemon.server is None or not socket_path.exists():
+            time.sleep(0.01)
+        assert query(socket_path, {"cmd": "ping"}) == {"ok": True, "result": "pong"}
+        assert query(socket_path, {"cmd": "run_new_inputs"}) == {
+            "ok": True,
+            "result": {"new_inputs": 3},
+        }
+        assert query(socket_path, {"cmd": "nope"}) == {
+            "ok": False,
+            "error": "Unknown command nope",
+        }
+    finally:
+        query(socket_path, {"cmd": "shutdown"})
+        thread.join(timeout=5)
+    assert not socket_path.exists()
+
+
+def test_query_empty_reply(tmp_path):
+    socket_path = tmp_path / "daemon.sock"
+    thread = fake_daemon(socket_path, b"")
+    with pytest.raises(Exception, match="closed the connection without replying"):
+        query(socket_path, {"cmd": "ping"})
+    thread.join()
+
+
+def test_query_partial_reply(tmp_path):
+    socket_path = tmp_path / "daemon.sock"
+    thread = fake_daemon(socket_path, b'{"ok": true, "res')
+    with pytest.raises(Exception, match="sent an incomplete reply"):
+        query(socket_path, {"cmd": "ping"})
+    thread.join()
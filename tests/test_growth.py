@@ -0,0 +1,84 @@
+import json
+import os
+
+from conftest import make_cov_info
+
+from bccov.coverage import parse_cov_info_file
+from bccov.growth import (
+    GrowthCurve,
+    GrowthPoint,
+    QueueEntry,
+    queue_entries,
+    write_growth,
+)
+
+
+def entry(time):
+    return QueueEntry(None, None, time)
+
+
+def test_growth_curve_bbcov(tmp_path):
+    cov_info_file = tmp_path / "cov_info.json"
+    cov_info_file.write_text(
+        json.dumps(make_cov_info({("a.c", "f"): [1, 2, 2], ("b.c", "g"): [7, 8]}))
+    )
+    parse_cov_info_file(cov_info_file, mode="bbcov")
+
+    curve = GrowthCurve("bbcov")
+    assert curve.add(entry(0.5), {"a.c": {"f": [1, 0, 0]}}) == GrowthPoint(0.5, 1, 1, 1)
+    # block 1 and 2 share line 2, only one line is new
+    assert curve.add(entry(1.0), {"a.c": {"f": [3, 1, 1]}}) == GrowthPoint(1.0, 2, 3, 2)
+    # nothing new
+    assert curve.add(entry(2.0), {"a.c": {"f": [1, 1, 0]}}) == GrowthPoint(2.0, 3, 3, 2)
+    # an entry synced from another instance with an earlier time
+    assert curve.add(entry(1.5), {"b.c": {"g": [0, 1]}}) == GrowthPoint(2.0, 4, 4, 3)
+    assert curve.add(entry(3.0), None) == GrowthPoint(3.0, 5, 4, 3)
+
+
+def test_growth_curve_tracepc(tmp_path):
+    cov_info_file = tmp_path / "cov_info.json"
+    cov_info_file.write_text(
+        json.dumps(
+            {
+                "BasicBlock": [
+                    {"Id": i, "Coverage": [{"File": "a.c", "Line": line}]}
+                    for i, line in enumerate([1, 1, 2])
+                ]
+            }
+        )
+    )
+    parse_cov_info_file(cov_info_file, mode="tracepc")
+
+    curve = GrowthCurve("tracepc")
+    curve.add(entry(0), [0, 1, 0])
+    curve.add(entry(1), [2, 2])
+    assert curve.points == [GrowthPoint(0, 1, 2, 1), GrowthPoint(1, 2, 3, 2)]
+
+
+def test_queue_entries_order(tmp_path):
+    names = [
+        "id:000002,src:000000,time:3000,op:havoc",
+        "id:000000,time:0,orig:seed",
+        "id:000001,src:000000,time:1500,+cov",
+        "seed_by_hand",
+    ]
+    for name in names:
+        (tmp_path / name).write_bytes(b"x")
+    os.utime(tmp_path / "seed_by_hand", (0, 0))
+    (tmp_path / ".state").mkdir()
+
+    entries = queue_entries(tmp_path)
+    assert [(e.id, e.time) for e in entries[:3]] == [(0, 0), (1, 1.5), (2, 3)]
+    assert entries[3].id is None and entries[3].input_file.name == "seed_by_hand"
+
+
+def test_write_growth(tmp_path):
+    points = [GrowthPoint(0.0, 1, 3, 2), GrowthPoint(1.25, 2, 5, 4)]
+    write_growth(points, tmp_path / "growth.csv")
+    assert (tmp_path / "growth.csv").read_text().splitlines() == [
+        "time,inputs,blocks,lines",
+        "0.000,1,3,2",
+        "1.250,2,5,4",
+    ]
+    write_growth(points, tmp_path / "growth.json")
+    assert json.loads((tmp_path / "growth.json").read_text())[1] == points[1]._asdict()
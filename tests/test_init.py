@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+import pytest
+
+import bccov
+
+
+def imported_modules(code: str) -> set:
+    """Modules imported by a fresh interpreter after running code"""
+    out = subprocess.run(
+        [sys.executable, "-c", f"{code}\nimport sys\nprint(' '.join(sys.modules))"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return set(out.split())
+
+
+def test_import_does_not_load_the_cli():
+    assert "bccov.main" not in imported_modules("import bccov")
+    assert "bccov.main" not in imported_modules("import bccov.shard")
+
+
+def test_entry_points_are_loaded_on_access():
+    assert "bccov.main" in imported_modules("import bccov\nbccov.run_cli")
+
+    from bccov.session import Session
+
+    assert bccov.Session is Session
+    # cached in the module, __getattr__ is not consulted again
+    assert vars(bccov)["Session"] is Session
+
+
+def test_unknown_attribute():
+    with pytest.raises(AttributeError, match="has no attribute 'nope'"):
+        bccov.nope
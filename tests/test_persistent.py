@@ -0,0 +1,115 @@
+import pathlib
+import shutil
+import subprocess
+
+import pytest
+
+from bccov.persistent import PersistentRunner
+
+RUNTIME_DIR = pathlib.Path(__file__).parent.parent / "runtime"
+
+# stands in for an instrumented harness, every input byte is a block id
+HARNESS = r"""
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <unistd.h>
+
+void bc_cov(uint32_t bbid);
+int __bc_cov_loop(void);
+
+int main(void)
+{
+  bc_cov(1);
+  while (__bc_cov_loop())
+  {
+    int c;
+    while ((c = getchar()) != EOF)
+    {
+      if (c == 'q')
+        exit(3);
+      if (c == 'h')
+        for (;;)
+          pause();
+      bc_cov(c);
+    }
+  }
+  return 0;
+}
+"""
+
+
+@pytest.fixture(scope="module")
+def harness(tmp_path_factory):
+    if shutil.which("cc") is None:
+        pytest.skip("no C compiler")
+    build_dir = tmp_path_factory.mktemp("harness")
+    (build_dir / "harness.c").write_text(HARNESS)
+    binary = build_dir / "harness"
+    subprocess.run(
+        [
+            "cc",
+            "-o",
+            str(binary),
+            str(build_dir / "harness.c"),
+            str(RUNTIME_DIR / "tracepc_runtime.c"),
+            "-pthread",
+        ],
+        check=True,
+    )
+    return binary
+
+
+def run_inputs(runner, tmp_path, contents):
+    results = []
+    for n, content in enumerate(contents):
+        input_file = tmp_path / f"in{n}"
+        input_file.write_text(content)
+        results.append(runner.run(input_file))
+    return results
+
+
+def test_counters_are_reset_between_iterations(harness, tmp_path):
+    with PersistentRunner(harness, tmp_path / "cov", "tracepc", timeout=5) as runner:
+        results = run_inputs(runner, tmp_path, ["ab", "c", ""])
+        pid = runner.proc.pid
+        assert runner.startup_coverage == [1]
+    # the startup coverage is part of every input's coverage
+    assert [coverage for coverage, _ in results] == [[1, 97, 98], [1, 99], [1]]
+    assert all(r.returncode == 0 and not r.timed_out for _, r in results)
+    assert (runner.iterations, runner.restarts) == (3, 0)
+    assert pid and runner.proc is None
+
+
+def test_target_is_restarted_after_it_exits(harness, tmp_path):
+    with PersistentRunner(harness, tmp_path / "cov", "tracepc", timeout=5) as runner:
+        (exited, exit_result), (after, after_result) = run_inputs(
+            runner, tmp_path, ["aq", "b"]
+        )
+    # the runtime dumps on the way out
+    assert exited == [1, 97]
+    # the runtime's destructor replaces the exit code
+    assert exit_result.returncode != 0 and not exit_result.timed_out
+    assert after == [1, 98]
+    assert after_result.returncode == 0
+    assert (runner.iterations, runner.restarts) == (2, 1)
+
+
+def test_hung_input_times_out(harness, tmp_path):
+    with PersistentRunner(
+        harness, tmp_path / "cov", "tracepc", timeout=0.5, kill_timeout=1
+    ) as runner:
+        (hung, hung_result), (after, _) = run_inputs(runner, tmp_path, ["ah", "b"])
+    # SIGTERM makes the runtime dump what the input ran so far
+    assert hung == [1, 97]
+    assert hung_result.timed_out
+    assert after == [1, 98]
+    assert runner.restarts == 1
+
+
+def test_harness_without_driver_runs_once(harness, tmp_path):
+    cov_file = tmp_path / "cov"
+    subprocess.run([str(harness)], input=b"ab", env={"BC_COV_FILE": str(cov_file)})
+    assert cov_file.read_bytes() == b"".join(
+        i.to_bytes(4, "little") for i in [1, 97, 98]
+    )
@@ -0,0 +1,94 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from bccov.pipeline import Pipeline
+
+TARGET = f"""#!{sys.executable}
+import os, struct, sys, time
+
+n = int(sys.stdin.read())
+with open(os.environ["LAUNCH_LOG"], "a") as f:
+    f.write(f"{{n}}\\n")
+# later inputs finish first
+time.sleep(0.05 * (3 - n % 4))
+with open(os.environ["BC_COV_FILE"], "wb") as f:
+    f.write(struct.pack("I", n))
+"""
+
+
+@pytest.fixture
+def target(tmp_path, monkeypatch):
+    binary = tmp_path / "target"
+    binary.write_text(TARGET)
+    binary.chmod(0o755)
+    monkeypatch.setenv("LAUNCH_LOG", str(tmp_path / "launches"))
+    return binary
+
+
+def make_inputs(tmp_path, count):
+    inputs = []
+    for n in range(count):
+        input_file = tmp_path / f"in{n}"
+        input_file.write_text(str(n))
+        inputs.append(input_file)
+    return inputs
+
+
+def launches(tmp_path):
+    path = tmp_path / "launches"
+    return len(path.read_text().splitlines()) if path.exists() else 0
+
+
+def test_every_input_is_consumed_once_on_one_thread(tmp_path, target):
+    inputs = make_inputs(tmp_path, 8)
+    consumed = []
+
+    def consume(input_file, coverage, result):
+        consumed.append((input_file, coverage, threading.get_ident()))
+        assert result.returncode == 0 and not result.timed_out
+
+    pipeline = Pipeline(target, tmp_path / "cov", "tracepc", jobs=4)
+    assert pipeline.run(iter(inputs), consume) == len(inputs)
+    # results are consumed as they finish, each with its own coverage
+    assert {(c[0], tuple(c[1])) for c in consumed} == {
+        (input_file, (n,)) for n, input_file in enumerate(inputs)
+    }
+    assert len(consumed) == len(inputs)
+    assert len({c[2] for c in consumed}) == 1
+    assert launches(tmp_path) == len(inputs)
+
+
+def test_slow_consumer_throttles_the_launcher(tmp_path, target):
+    inputs = make_inputs(tmp_path, 12)
+    release = threading.Event()
+    consumed = []
+
+    def consume(input_file, coverage, result):
+        release.wait()
+        consumed.append(input_file)
+
+    jobs, queue_size = 2, 1
+    pipeline = Pipeline(
+        target, tmp_path / "cov", "tracepc", jobs=jobs, queue_size=queue_size
+    )
+    thread = threading.Thread(target=pipeline.run, args=(inputs, consume))
+    thread.start()
+    time.sleep(2)
+    # one result being consumed, queue_size waiting in the queue and one per
+    # job waiting to be queued while holding its coverage file
+    assert launches(tmp_path) == 1 + queue_size + jobs
+    release.set()
+    thread.join(timeout=30)
+    assert sorted(consumed) == sorted(inputs)
+
+
+def test_consumer_errors_stop_the_pipeline(tmp_path, target):
+    def consume(input_file, coverage, result):
+        raise ValueError("merge failed")
+
+    pipeline = Pipeline(target, tmp_path / "cov", "tracepc", jobs=2)
+    with pytest.raises(ValueError, match="merge failed"):
+        pipeline.run(make_inputs(tmp_path, 4), consume)
@@ -0,0 +1,44 @@
+import json
+
+from conftest import make_cov_info
+
+from bccov.coverage import BBCovCoverageStats, parse_cov_info_file
+from bccov.profile import histogram_buckets, hot_functions, hot_lines, profile_report
+
+
+def load(tmp_path, aggregate):
+    cov_info_file = tmp_path / "cov_info.json"
+    cov_info_file.write_text(
+        json.dumps(make_cov_info({("a.c", "f"): [1, 2, 2], ("a.c", "g"): [9]}))
+    )
+    parse_cov_info_file(cov_info_file, mode="bbcov")
+    BBCovCoverageStats.set_aggregate_mode(aggregate)
+    BBCovCoverageStats.add_cov_map({"a.c": {"f": [1, 4, 2], "g": [0]}}, "in0")
+    BBCovCoverageStats.add_cov_map({"a.c": {"f": [1, 1, 0], "g": [3]}}, "in1")
+
+
+def test_histogram_buckets():
+    assert histogram_buckets({3: 2, 1: 5, 2: 1}) == {"1": 5, "2-3": 1, "4-7": 2}
+
+
+def test_profile_report_hist(tmp_path):
+    load(tmp_path, "hist")
+    assert [(fn.function, fn.executions, fn.calls) for fn in hot_functions()] == [
+        ("f", 9, 2),
+        ("g", 3, 3),
+    ]
+    assert [(l.line_no, l.executions) for l in hot_lines()] == [(2, 7), (9, 3), (1, 2)]
+
+    report = profile_report()
+    assert report["aggregate"] == "hist"
+    top = report["blocks"][0]
+    assert (top["function"], top["id"], top["executions"]) == ("f", 1, 5)
+    assert top["histogram"] == {"1": 1, "4-7": 1}
+
+
+def test_profile_report_max(tmp_path):
+    load(tmp_path, "max")
+    report = profile_report()
+    assert report["aggregate"] == "max"
+    assert [b["executions"] for b in report["blocks"]] == [4, 3, 2, 1]
+    assert all("histogram" not in b for b in report["blocks"])
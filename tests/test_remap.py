@@ -0,0 +1,135 @@
+import json
+import os
+
+from bccov.cache import CoverageCache
+from bccov.lruntime import RunResult
+from bccov.remap import carry_forward
+
+RESULT = RunResult(0, False, 0.1)
+
+
+def bbcov_cov_info(functions: dict) -> dict:
+    """{(file, function): (hash, [stable id per block])}"""
+    cov_info = {}
+    for (file_name, func_name), (func_hash, stable_ids) in functions.items():
+        cov_info.setdefault(file_name, []).append(
+            {
+                "Function": func_name,
+                "Hash": func_hash,
+                "BasicBlocks": [
+                    {"Id": i, "StableId": sid, "Coverage": []}
+                    for i, sid in enumerate(stable_ids)
+                ],
+            }
+        )
+    return cov_info
+
+
+def build(tmp_path, name, cov_info, mode="bbcov"):
+    build_dir = tmp_path / name
+    build_dir.mkdir()
+    binary = build_dir / "final_binary"
+    binary.write_text(name)
+    cov_info_file = build_dir / "cov_info.json"
+    cov_info_file.write_text(json.dumps(cov_info))
+    cache = CoverageCache(tmp_path / "cache", binary, mode)
+    return cache, cov_info_file
+
+
+def test_carry_forward_bbcov(tmp_path):
+    old_cache, old_cov_info = build(
+        tmp_path,
+        "old",
+        bbcov_cov_info(
+            {("a.c", "f"): ("h1", [10, 11, 12]), ("a.c", "g"): ("h2", [20, 21])}
+        ),
+    )
+    carry_forward(old_cache, old_cov_info)
+    old_cache.put(
+        None, {"a.c": {"f": [1, 0, 2], "g": [0, 0]}}, RESULT, input_hash="only_f"
+    )
+    old_cache.put(
+        None, {"a.c": {"f": [1, 0, 0], "g": [1, 0]}}, RESULT, input_hash="f_and_g"
+    )
+    old_cache.put(
+        None, {"a.c": {"f": [1, 1, 1]}}, RunResult(-9, True, 5.0), input_hash="timeout"
+    )
+
+    # f only moved its blocks around, g changed
+    new_cache, new_cov_info = build(
+        tmp_path,
+        "new",
+        bbcov_cov_info(
+            {("a.c", "f"): ("h1", [12, 10, 11]), ("a.c", "g"): ("h3", [20, 22, 21])}
+        ),
+    )
+    assert carry_forward(new_cache, new_cov_info) == 1
+    assert (new_cache.dir / "cov_info.json").exists()
+
+    entry = new_cache.get(None, "only_f")
+    assert entry.coverage == {"a.c": {"f": [2, 1, 0]}}
+    assert entry.result == RESULT
+    assert new_cache.get(None, "f_and_g") is None
+    assert new_cache.get(None, "timeout") is None
+
+
+def test_carry_forward_tracepc(tmp_path):
+    def cov_info(blocks):
+        return {
+            "BasicBlock": [
+                {
+                    "Id": i,
+                    "Function": func,
+                    "FunctionHash": h,
+                    "StableId": sid,
+                    "Coverage": [],
+                }
+                for i, (func, h, sid) in enumerate(blocks)
+            ]
+        }
+
+    old_cache, old_cov_info = build(
+        tmp_path,
+        "old",
+        cov_info([("f", "h1", 1), ("f", "h1", 2), ("g", "h2", 3)]),
+        mode="tracepc",
+    )
+    carry_forward(old_cache, old_cov_info)
+    old_cache.put(None, [0, 1, 0], RESULT, input_hash="only_f")
+    old_cache.put(None, [0, 2], RESULT, input_hash="f_and_g")
+
+    new_cache, new_cov_info = build(
+        tmp_path,
+        "new",
+        cov_info([("g", "h3", 3), ("f", "h1", 2), ("f", "h1", 1)]),
+        mode="tracepc",
+    )
+    assert carry_forward(new_cache, new_cov_info) == 1
+    assert new_cache.get(None, "only_f").coverage == [2, 1, 2]
+    assert new_cache.get(None, "f_and_g") is None
+
+
+def test_carry_forward_picks_newest_build(tmp_path):
+    layout = {("a.c", "f"): ("h1", [1, 2])}
+    for name, mtime, count in [("older", 1000, 1), ("newer", 2000, 2)]:
+        cache, cov_info_file = build(tmp_path, name, bbcov_cov_info(layout))
+        carry_forward(cache, cov_info_file)
+        cache.put(None, {"a.c": {"f": [count, 0]}}, RESULT, input_hash="input")
+        os.utime(cache.dir / "cov_info.json", (mtime, mtime))
+
+    cache, cov_info_file = build(tmp_path, "current", bbcov_cov_info(layout))
+    assert carry_forward(cache, cov_info_file) == 1
+    assert cache.get(None, "input").coverage == {"a.c": {"f": [2, 0]}}
+
+
+def test_carry_forward_without_stable_ids(tmp_path):
+    old_cache, old_cov_info = build(
+        tmp_path, "old", bbcov_cov_info({("a.c", "f"): (None, [None])})
+    )
+    carry_forward(old_cache, old_cov_info)
+    old_cache.put(None, {"a.c": {"f": [1]}}, RESULT, input_hash="input")
+
+    new_cache, new_cov_info = build(
+        tmp_path, "new", bbcov_cov_info({("a.c", "f"): ("h1", [1])})
+    )
+    assert carry_forward(new_cache, new_cov_info) == 0
@@ -0,0 +1,102 @@
+import json
+import pathlib
+
+from conftest import make_cov_info
+import pytest
+
+from bccov.coverage import BBCovCoverageStats, parse_cov_info_file
+from bccov.report import (
+    COVERED,
+    PARTIAL,
+    UNCOVERED,
+    LineStatus,
+    compute_file_reports,
+    html_page_name,
+    write_html,
+    write_lcov,
+)
+from bccov.sources import SourceCache, SourceFile
+
+
+@pytest.fixture
+def reports(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src/a.c").write_text("int f() {\n  if (x)\n    return 1;\n}\n")
+    cov_info_file = tmp_path / "cov_info.json"
+    cov_info_file.write_text(
+        json.dumps(make_cov_info({("src/a.c", "f"): [1, 2, 2, 3]}))
+    )
+    parse_cov_info_file(cov_info_file, mode="bbcov")
+    BBCovCoverageStats.add_cov_map(
+        {"src/a.c": {"f": [2, 1, 0, 0]}}, pathlib.Path("in0")
+    )
+    return compute_file_reports()
+
+
+def test_compute_file_reports(reports):
+    report = reports["src/a.c"]
+    assert report.lines == {
+        1: LineStatus(2, COVERED),
+        2: LineStatus(1, PARTIAL),
+        3: LineStatus(0, UNCOVERED),
+    }
+    assert [(fn.name, fn.line, fn.hits) for fn in report.functions] == [("f", 1, 2)]
+
+
+def test_write_lcov(tmp_path, reports):
+    lcov_file = tmp_path / "cov.info"
+    write_lcov(reports, lcov_file, SourceCache(tmp_path))
+    assert lcov_file.read_text().splitlines() == [
+        "TN:bccov",
+        f"SF:{tmp_path / 'src/a.c'}",
+        "FN:1,f",
+        "FNDA:2,f",
+        "FNF:1",
+        "FNH:1",
+        "DA:1,2",
+        "DA:2,1",
+        "DA:3,0",
+        "LF:3",
+        "LH:2",
+        "end_of_record",
+    ]
+
+
+def test_write_html(tmp_path, reports):
+    html_dir = tmp_path / "html"
+    write_html(reports, tmp_path, html_dir, jobs=1)
+    page = (html_dir / html_page_name("src/a.c")).read_text()
+    assert "<p>Lines: 2 / 3</p>" in page
+    assert (
+        "<tr class='partial'><td class='lineno'>2</td><td class='hits'>1</td>" in page
+    )
+    assert "return 1;" in page
+    assert html_page_name("src/a.c") in (html_dir / "index.html").read_text()
+
+
+def test_html_page_names_are_unique():
+    assert html_page_name("a/b_c.c") != html_page_name("a_b/c.c")
+
+
+def test_source_cache_resolves_debug_info_names(tmp_path):
+    (tmp_path / "lib").mkdir()
+    (tmp_path / "lib/b.c").write_text("one\ntwo")
+    sources = SourceCache(tmp_path)
+    assert sources.resolve("lib/b.c") == str(tmp_path / "lib/b.c")
+    # built elsewhere, found by its basename
+    assert sources.resolve("build/lib/b.c") == str(tmp_path / "lib/b.c")
+    assert sources.resolve("/nonexistent/b.c") is None
+    assert sources.get("lib/b.c") is sources.get("lib/b.c")
+    assert sources.get("missing.c") is None
+
+
+def test_source_file_lines(tmp_path):
+    (tmp_path / "b.c").write_text("one\ntwo")
+    source = SourceFile(tmp_path / "b.c")
+    assert source.num_lines == 2
+    assert list(source.lines()) == [(1, "one\n"), (2, "two")]
+    assert list(source.lines(2, 5)) == [(2, "two")]
+    source.close()
+
+    (tmp_path / "empty.c").write_text("")
+    assert SourceFile(tmp_path / "empty.c").num_lines == 0
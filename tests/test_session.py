@@ -0,0 +1,84 @@
+import json
+import pathlib
+import threading
+
+from conftest import make_cov_info
+import pytest
+
+from bccov.coverage import BBCovCoverageStats, parse_cov_info_file
+from bccov.session import Session
+
+
+@pytest.fixture
+def make_session(tmp_path):
+    sessions = []
+
+    def make(functions: dict, **kwargs):
+        """A session with cov_info for functions installed, without a build"""
+        work_dir = tmp_path / f"session{len(sessions)}"
+        work_dir.mkdir()
+        cov_info_file = work_dir / "cov_info.json"
+        cov_info_file.write_text(json.dumps(make_cov_info(functions)))
+        session = Session(work_dir / "target.bc", work_dir=work_dir, **kwargs)
+        with session.activate():
+            parse_cov_info_file(cov_info_file, mode="bbcov")
+        sessions.append(session)
+        return session
+
+    yield make
+    for session in sessions:
+        session.close()
+
+
+def merge(session, coverage, input_name="in"):
+    with session.activate():
+        BBCovCoverageStats.add_cov_map(coverage, pathlib.Path(input_name))
+
+
+def test_activate_restores_the_previous_state(make_session):
+    outside = BBCovCoverageStats.COV_MAP
+    session = make_session({("a.c", "f"): [1, 2]}, aggregate="sum")
+    assert BBCovCoverageStats.COV_MAP is outside
+    assert BBCovCoverageStats.AGGREGATE == "max"
+
+    merge(session, {"a.c": {"f": [1, 0]}})
+    with session.activate():
+        assert BBCovCoverageStats.AGGREGATE == "sum"
+        assert len(BBCovCoverageStats.COV_MAP) == 1
+    assert BBCovCoverageStats.COV_MAP is outside
+    assert session.summary("f") == [
+        {"file": "a.c", "function": "f", "covered": 1, "total": 2}
+    ]
+
+
+def test_nested_sessions_do_not_clobber_each_other(make_session):
+    a = make_session({("a.c", "f"): [1, 2]})
+    b = make_session({("b.c", "g"): [1, 2, 3]})
+    with a.activate():
+        BBCovCoverageStats.add_cov_map({"a.c": {"f": [1, 0]}}, pathlib.Path("in0"))
+        merge(b, {"b.c": {"g": [1, 1, 1]}})
+        # back to a's state after b's block
+        BBCovCoverageStats.add_cov_map({"a.c": {"f": [0, 1]}}, pathlib.Path("in1"))
+
+    assert a.summary() == [{"file": "a.c", "function": "f", "covered": 2, "total": 2}]
+    assert b.summary() == [{"file": "b.c", "function": "g", "covered": 3, "total": 3}]
+
+
+def test_interleaved_sessions_from_threads(make_session):
+    sessions = [make_session({(f"{n}.c", "f"): [1]}, aggregate="sum") for n in range(4)]
+
+    def add(n):
+        for _ in range(200):
+            merge(sessions[n], {f"{n}.c": {"f": [1]}})
+
+    threads = [threading.Thread(target=add, args=(n,)) for n in range(len(sessions))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for n, session in enumerate(sessions):
+        with session.activate():
+            [func] = BBCovCoverageStats.COV_MAP.values()
+            assert [bb.coverage_index for bb in func] == [200]
+            assert list(BBCovCoverageStats.COV_MAP)[0].file_name == f"{n}.c"
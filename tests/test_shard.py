@@ -0,0 +1,148 @@
+import json
+import pathlib
+
+from conftest import make_cov_info
+import pytest
+
+from bccov.coverage import BBCovCoverageStats, Function, parse_cov_info_file
+from bccov.shard import (
+    SHARD_VERSION,
+    compute_fingerprint,
+    is_shard,
+    load_shard_cov_map,
+    merge_shard_files,
+    merge_shards,
+    read_shard,
+    shard_from_stats,
+    write_shard,
+)
+
+FINGERPRINT = {"layout": "l"}
+
+
+def make_shard(counters, inputs=None, fingerprint=FINGERPRINT):
+    return {
+        "version": SHARD_VERSION,
+        "mode": "bbcov",
+        "fingerprint": dict(fingerprint),
+        "counters": counters,
+        "inputs": inputs or {},
+    }
+
+
+def test_merge_shards_sum_and_max():
+    a = make_shard({"a.c": {"f": [1, 0, 2]}})
+    b = make_shard({"a.c": {"f": [3, 1, 0], "g": [1]}})
+    assert merge_shards(a, b, "sum")["counters"] == {"a.c": {"f": [4, 1, 2], "g": [1]}}
+
+    a = make_shard({"a.c": {"f": [1, 0, 2]}})
+    b = make_shard({"a.c": {"f": [3, 1, 0]}})
+    assert merge_shards(a, b, "max")["counters"] == {"a.c": {"f": [3, 1, 2]}}
+
+
+def test_merge_shards_unions_inputs():
+    a = make_shard({"a.c": {"f": [1, 1]}}, {"a.c": {"f": {"0": ["x"], "1": ["x"]}}})
+    b = make_shard({"a.c": {"f": [1, 0]}}, {"a.c": {"f": {"0": ["x", "y"]}}})
+    merged = merge_shards(a, b)
+    assert merged["inputs"] == {"a.c": {"f": {"0": ["x", "y"], "1": ["x"]}}}
+
+
+def test_merge_shards_rejects_other_builds():
+    a = make_shard({"a.c": {"f": [1]}})
+    b = make_shard({"a.c": {"f": [1]}}, fingerprint={"layout": "other"})
+    with pytest.raises(Exception, match="different fingerprints"):
+        merge_shards(a, b)
+
+
+def test_merge_shard_files(tmp_path):
+    shard_files = []
+    for i in range(5):
+        shard_file = tmp_path / f"{i}.shard"
+        write_shard(
+            make_shard({"a.c": {"f": [i, 1]}}, {"a.c": {"f": {"1": [f"in{i}"]}}}),
+            shard_file,
+        )
+        shard_files.append(shard_file)
+    merged = merge_shard_files(shard_files, "sum", jobs=2)
+    assert merged["counters"] == {"a.c": {"f": [10, 5]}}
+    assert sorted(merged["inputs"]["a.c"]["f"]["1"]) == [f"in{i}" for i in range(5)]
+
+
+def test_shard_round_trip(tmp_path):
+    cov_info_file = tmp_path / "cov_info.json"
+    cov_info_file.write_text(json.dumps(make_cov_info({("a.c", "f"): [1, 2, 3]})))
+    parse_cov_info_file(cov_info_file, mode="bbcov")
+    BBCovCoverageStats.add_cov_map({"a.c": {"f": [2, 0, 1]}}, pathlib.Path("in0"))
+
+    shard_file = tmp_path / "a.shard"
+    write_shard(shard_from_stats(compute_fingerprint(cov_info_file)), shard_file)
+
+    BBCovCoverageStats.COV_MAP = {}
+    load_shard_cov_map(read_shard(shard_file), cov_info_file)
+    func = BBCovCoverageStats.COV_MAP[Function("f", "a.c")]
+    assert [bb.coverage_index for bb in func] == [2, 0, 1]
+    assert [bb.files for bb in func] == [
+        [pathlib.Path("in0")],
+        [],
+        [pathlib.Path("in0")],
+    ]
+
+
+def test_load_shard_rejects_other_cov_info(tmp_path):
+    cov_info_file = tmp_path / "cov_info.json"
+    cov_info_file.write_text(json.dumps(make_cov_info({("a.c", "f"): [1]})))
+    shard_file = tmp_path / "a.shard"
+    write_shard(make_shard({"a.c": {"f": [1]}}), shard_file)
+    with pytest.raises(Exception, match="was not taken from a build"):
+        load_shard_cov_map(read_shard(shard_file), cov_info_file)
+
+
+def test_is_shard(tmp_path):
+    shard = make_shard({"a.c": {"f": [1]}})
+    # however the shard was reformatted
+    shard_file = tmp_path / "a.shard"
+    shard_file.write_text(json.dumps(shard, indent=2, sort_keys=True))
+    assert is_shard(json.loads(shard_file.read_text()))
+    assert read_shard(shard_file) == shard
+    # a JSON coverage dump maps file names to functions
+    assert not is_shard({"a.c": {"f": [{"Id": 0, "CovInfo": [], "CovIndex": 1}]}})
+    assert not is_shard([1, 2])
+
+    shard_file.write_text(json.dumps(dict(shard, version=0)))
+    with pytest.raises(
+        Exception, match=f"is not a version {SHARD_VERSION} coverage shard"
+    ):
+        read_shard(shard_file)
+    shard_file.write_text(json.dumps({"a.c": {}}))
+    with pytest.raises(Exception, match="is not a coverage shard"):
+        read_shard(shard_file)
+
+
+def test_fingerprint_depends_on_layout_only(tmp_path):
+    def cov_info(line, function_hash="h"):
+        return {
+            "a.c": [
+                {
+                    "Function": "f",
+                    "Hash": function_hash,
+                    "BasicBlocks": [
+                        {
+                            "Id": i,
+                            "StableId": sid,
+                            "Coverage": [{"File": "a.c", "Line": line}],
+                        }
+                        for i, sid in enumerate([7, 9])
+                    ],
+                }
+            ]
+        }
+
+    here, there, changed = (
+        tmp_path / n for n in ("here.json", "there.json", "changed.json")
+    )
+    here.write_text(json.dumps(cov_info(1)))
+    there.write_text(json.dumps(cov_info(2), indent=2))
+    changed.write_text(json.dumps(cov_info(1, function_hash="h2")))
+
+    assert compute_fingerprint(here) == compute_fingerprint(there)
+    assert compute_fingerprint(here) != compute_fingerprint(changed)
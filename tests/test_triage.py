@@ -0,0 +1,66 @@
+import json
+
+from bccov.lruntime import RunResult
+from bccov.triage import CrashBuckets, crash_tail, signature, write_summary
+
+CRASH = RunResult(-11, False, 0.1)
+
+
+def test_crash_tail_counts_blocks_once():
+    assert crash_tail([1, 2, 3, 4, 3, 4, 3, 4], 3) == (2, 3, 4)
+    assert crash_tail([1, 2, 1, 2, 1], 8) == (2, 1)
+    assert crash_tail([5, 5, 5], 2) == (5,)
+    assert crash_tail([], 4) == ()
+    assert crash_tail(None, 4) == ()
+
+
+def test_signature_tracepc():
+    digest, num_blocks, tail = signature([1, 2, 3, 2, 3], "tracepc", last=2)
+    assert (num_blocks, tail) == (3, (2, 3))
+    # the same blocks reached in the same last order
+    assert signature([1, 3, 2, 3], "tracepc", last=2)[0] == digest
+    # the same blocks, but the crash ended somewhere else
+    assert signature([1, 3, 2], "tracepc", last=2)[0] != digest
+    # without a tail only the block set counts
+    assert (
+        signature([1, 2, 3], "tracepc", last=0)[0]
+        == signature([3, 2, 1], "tracepc", last=0)[0]
+    )
+
+
+def test_signature_bbcov_ignores_counts():
+    a = {"a.c": {"f": [1, 0, 3]}}
+    b = {"a.c": {"f": [7, 0, 1]}}
+    c = {"a.c": {"f": [1, 1, 3]}}
+    assert signature(a, "bbcov") == signature(b, "bbcov")
+    assert signature(a, "bbcov")[0] != signature(c, "bbcov")[0]
+    assert signature(a, "bbcov")[2] == ()
+
+
+def test_crash_buckets(tmp_path):
+    inputs = {}
+    for name, size in [("big", 30), ("small", 10), ("other", 20), ("lost", 5)]:
+        inputs[name] = tmp_path / name
+        inputs[name].write_bytes(b"x" * size)
+
+    buckets = CrashBuckets("tracepc", last=2)
+    assert buckets.add(inputs["big"], [1, 2, 3], CRASH)
+    assert not buckets.add(inputs["small"], [1, 2, 3, 2, 3], RunResult(-6, False, 0.1))
+    assert buckets.add(inputs["other"], [1, 4], CRASH)
+    assert not buckets.add(inputs["lost"], None, CRASH)
+
+    assert buckets.crashes == 3
+    assert buckets.missing == [inputs["lost"]]
+    first, second = buckets.ordered()
+    assert first.inputs == [inputs["big"], inputs["small"]]
+    assert first.representative == inputs["small"]
+    assert first.coverage == [1, 2, 3, 2, 3]
+    assert dict(first.returncodes) == {-11: 1, -6: 1}
+    assert second.representative == inputs["other"]
+
+    summary_file = tmp_path / "triage.json"
+    write_summary(buckets, summary_file)
+    summary = json.loads(summary_file.read_text())
+    assert summary["Crashes"] == 3
+    assert [b["Count"] for b in summary["Buckets"]] == [2, 1]
+    assert [b["Id"] for b in summary["Buckets"][0]["LastBlocks"]] == [2, 3]
@@ -0,0 +1,67 @@
+import pytest
+
+from bccov.watch import (
+    InotifyWatcher,
+    PollingWatcher,
+    create_watcher,
+    is_input_file,
+    list_existing_inputs,
+)
+
+
+def test_is_input_file(tmp_path):
+    (tmp_path / "id:000000").write_text("x")
+    (tmp_path / ".cur_input").write_text("x")
+    (tmp_path / "README.txt").write_text("x")
+    (tmp_path / ".state").mkdir()
+    assert [p.name for p in tmp_path.iterdir() if is_input_file(p)] == ["id:000000"]
+
+
+def test_list_existing_inputs(tmp_path):
+    crashes, queue = tmp_path / "crashes", tmp_path / "queue"
+    queue.mkdir()
+    for name in ["b", "a", ".hidden"]:
+        (queue / name).write_text("x")
+    # directories that do not exist yet are skipped
+    assert list_existing_inputs([crashes, queue]) == [queue / "a", queue / "b"]
+
+
+@pytest.mark.parametrize("force_polling", [False, True])
+def test_watcher_reports_new_files_once(tmp_path, force_polling):
+    (tmp_path / "old").write_text("x")
+    watcher = create_watcher([tmp_path], force_polling=force_polling)
+    try:
+        assert watcher.poll(0.01) == []
+        (tmp_path / "new").write_text("x")
+        (tmp_path / ".hidden").write_text("x")
+        assert watcher.poll(0.5) == [tmp_path / "new"]
+        # rewriting a file that was reported does not report it again
+        (tmp_path / "new").write_text("y")
+        assert watcher.poll(0.05) == []
+    finally:
+        watcher.close()
+
+
+def test_inotify_waits_for_writes_to_finish(tmp_path):
+    watcher = InotifyWatcher([tmp_path])
+    try:
+        with open(tmp_path / "partial", "w") as f:
+            f.write("x")
+            f.flush()
+            assert watcher.poll(0.05) == []
+        assert watcher.poll(0.5) == [tmp_path / "partial"]
+
+        staged = tmp_path.parent / f"{tmp_path.name}.staged"
+        staged.write_text("x")
+        staged.rename(tmp_path / "moved")
+        assert watcher.poll(0.5) == [tmp_path / "moved"]
+    finally:
+        watcher.close()
+
+
+def test_polling_watcher_picks_up_created_dirs(tmp_path):
+    queue = tmp_path / "queue"
+    watcher = PollingWatcher([queue])
+    queue.mkdir()
+    (queue / "a").write_text("x")
+    assert watcher.poll(0) == [queue / "a"]